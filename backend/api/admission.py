@@ -0,0 +1,121 @@
+import os
+from typing import Iterable, NamedTuple
+
+from fastapi import HTTPException, status
+from redis import RedisError
+from redis.asyncio import Redis
+from starlette.concurrency import run_in_threadpool
+
+from celery_worker.worker import celery_app, ADMISSION_REDIS_URL, INTERACTIVE_QUEUE, BULK_QUEUE
+
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH") or 1000)
+ADMISSION_USER_MAX_COST = int(os.getenv("ADMISSION_USER_MAX_COST") or 100)
+ADMISSION_BULK_COST = int(os.getenv("ADMISSION_BULK_COST") or 20)
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER") or 30)
+# Pending costs of jobs lost without releasing them expire eventually
+ADMISSION_PENDING_TTL = int(os.getenv("ADMISSION_PENDING_TTL") or 3600)
+
+PENDING_COST_KEY = "admission:pending:{username}"
+
+admission_redis = Redis.from_url(ADMISSION_REDIS_URL) if ADMISSION_REDIS_URL else None
+
+
+class Admission(NamedTuple):
+    queue: str
+    pending_key: str | None
+
+
+def job_cost(limits: Iterable[int]) -> int:
+    """
+    Estimates the cost of a scrape job as the number of pages it may fetch.
+
+    :param limits: The page limit of every query of the job
+    :type limits: Iterable[int]
+
+    :returns: The cost of the job
+    :rtype: int
+    """
+    return sum(max(limit, 1) for limit in limits)
+
+
+def queue_depth(queue: str) -> int:
+    """
+    Counts the messages waiting in a broker queue.
+
+    The broker connection is taken from the connection pool of the Celery app, so
+    admitting a job does not connect to the broker again.
+
+    :param queue: The name of the queue
+    :type queue: str
+
+    :returns: The number of waiting messages, 0 if the queue does not exist yet
+    :rtype: int
+    """
+    with celery_app.pool.acquire(block=True) as connection:
+        # A passive declare of a missing queue closes its channel, the pooled connection stays usable
+        with connection.channel() as channel:
+            try:
+                return channel.queue_declare(queue=queue, passive=True).message_count
+            except connection.channel_errors:
+                return 0
+
+
+def _too_many_requests(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+    )
+
+
+async def admit(username: str, cost: int) -> Admission:
+    """
+    Decides whether a scrape job of a user is accepted and which queue it goes to.
+
+    Jobs costing at least `ADMISSION_BULK_COST` pages go to the bulk queue, so they do not
+    delay interactive ones. A job is refused if its queue already holds `ADMISSION_MAX_QUEUE_DEPTH`
+    messages or if the user would have more than `ADMISSION_USER_MAX_COST` pages pending.
+    The pending cost is reserved here and released by the worker once the job is done.
+
+    :param username: The user submitting the job
+    :type username: str
+
+    :param cost: The cost of the job, see `job_cost`
+    :type cost: int
+
+    :returns: The queue of the job and the key its cost is reserved under, if tracked
+    :rtype: Admission
+
+    :raises HTTPException: 422 if pending costs are tracked and the job alone costs more
+                           than `ADMISSION_USER_MAX_COST`,
+                           429 with Retry-After if the job is refused for now
+    """
+    queue = BULK_QUEUE if cost >= ADMISSION_BULK_COST else INTERACTIVE_QUEUE
+
+    # Reading the queue depth talks to the broker synchronously
+    if await run_in_threadpool(queue_depth, queue) >= ADMISSION_MAX_QUEUE_DEPTH:
+        raise _too_many_requests("Too many jobs in the queue! Try again later!")
+
+    if admission_redis is None:
+        return Admission(queue, None)
+
+    # Such a job would be refused on every retry
+    if cost > ADMISSION_USER_MAX_COST:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"The job costs {cost} pages, a job can cost at most {ADMISSION_USER_MAX_COST} pages!",
+        )
+
+    pending_key = PENDING_COST_KEY.format(username=username)
+    try:
+        pending = await admission_redis.incrby(pending_key, cost)
+        await admission_redis.expire(pending_key, ADMISSION_PENDING_TTL)
+
+        if pending > ADMISSION_USER_MAX_COST:
+            await admission_redis.decrby(pending_key, cost)
+            raise _too_many_requests("Too many pending jobs for the user! Try again later!")
+    except RedisError:
+        # Admission control must not take the API down with it
+        return Admission(queue, None)
+
+    return Admission(queue, pending_key)
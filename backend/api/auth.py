@@ -1,14 +1,17 @@
 import os
+import time
 from datetime import datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt, ExpiredSignatureError
 
 from dotenv import load_dotenv
 
-from api.encrypt_utils import verify_password
+from api.cache import TTLCache
+from api.encrypt_utils import verify_password_async
 from db import models
 from db import schemas
 
@@ -17,16 +20,27 @@ load_dotenv()
 SECRET_KEY = str(os.getenv("SECRET_KEY")) or None
 ALGORITHM = str(os.getenv("ALGORITHM")) or None
 TOKEN_EXPIRES_TIME = 30
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES") or 1024)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS") or 300)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Decoded payloads of verified tokens, each entry expires together with its token
+verified_tokens = TTLCache(AUTH_CACHE_MAX_ENTRIES, TOKEN_EXPIRES_TIME * 60)
+# Users by username, detached from the session they were loaded with
+cached_users = TTLCache(AUTH_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+# The latest still valid token issued to every user id
+issued_tokens = TTLCache(AUTH_CACHE_MAX_ENTRIES, TOKEN_EXPIRES_TIME * 60)
 
-def get_user(db: Session, username: str) -> models.User | None:
+
+async def get_user(db: AsyncSession, username: str) -> models.User | None:
     """
     Retrieves a user from the database using the provided username.
 
+    Found users are cached for `USER_CACHE_TTL_SECONDS`.
+
     :param db: The database session object to use for the query
-    :type db: Session
+    :type db: AsyncSession
 
     :param username: The username of the user to retrieve
     :type username: str
@@ -34,20 +48,26 @@ def get_user(db: Session, username: str) -> models.User | None:
     :returns: The User object if found, otherwise None
     :rtype: models.User | None
     """
-    user = db.query(models.User).where(
-        models.User.username == username
-    ).first()
+    user = cached_users.get(username)
+    if user:
+        return user
+
+    user = (await db.execute(
+        select(models.User).where(models.User.username == username)
+    )).scalars().first()
     if user:
+        db.expunge(user)
+        cached_users.set(username, user)
         return user
     return None
 
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """
     Authenticates a user using the provided username and password.
 
     :param db: The database session object to use for the query
-    :type db: Session
+    :type db: AsyncSession
 
     :param username: The username of the user to authenticate
     :type username: str
@@ -59,25 +79,53 @@ def authenticate_user(db: Session, username: str, password: str):
     :rtype: models.User | bool
     """
 
-    user = get_user(db, username)
+    user = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
 
-def check_token_expiration(token: Depends(oauth2_scheme)):
+def decode_token(token: str) -> dict:
+    """
+    Decodes a JWT token, verified tokens are cached until they expire.
+
+    :param token: The JWT token to decode
+    :type token: str
+
+    :returns: The payload of the token
+    :rtype: dict
+
+    :raises JWTError: If the token has expired or the signature verification fails
+    """
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
+    if "exp" in payload:
+        verified_tokens.set(token, payload, ttl=payload["exp"] - time.time())
+    else:
+        verified_tokens.set(token, payload)
+
+    return payload
+
+
+def check_token_expiration(token: Depends(oauth2_scheme)) -> dict:
     """
     Checks the expiration status of a JWT token.
 
     :param token: The JWT token to check
     :type token: str
 
+    :returns: The payload of the token
+    :rtype: dict
+
     :raises HTTPException: If the token has expired or the signature verification fails
     """
     try:
-        jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
+        return decode_token(token)
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,19 +139,21 @@ def check_token_expiration(token: Depends(oauth2_scheme)):
         )
 
 
-def create_jwt_token(
+async def create_jwt_token(
         data: dict,
-        db: Session,
+        db: AsyncSession,
         time_expires: timedelta | None = None
 ) -> schemas.Token:
     """
     Creates a new JWT token or retrieves the existing one if it has not expired.
 
+    The latest token of every user is cached, so repeated logins do not query the database.
+
     :param data: The data to encode into the JWT token
     :type data: dict
 
     :param db: The database session object to use for queries
-    :type db: Session
+    :type db: AsyncSession
 
     :param time_expires: The expiration time for the token, if any
     :type time_expires: timedelta | None
@@ -117,25 +167,34 @@ def create_jwt_token(
 
     to_encode = data.copy()
     username = to_encode.get("user")
-    user = get_user(db, username)
+    user = await get_user(db, username)
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    token_data = db.query(models.Token).where(
-        models.Token.user_id == user.id
-    ).order_by(
-        models.Token.expires_date.desc()
-    ).first()
+    cached_token = issued_tokens.get(user.id)
+    if (cached_token and
+            (cached_token.expires_date - datetime.utcnow()) > timedelta(seconds=5)):
+        return cached_token
+
+    token_data = (await db.execute(
+        select(models.Token).where(
+            models.Token.user_id == user.id
+        ).order_by(
+            models.Token.expires_date.desc()
+        )
+    )).scalars().first()
 
     if (token_data and
             (token_data.expires_date - datetime.utcnow()) > timedelta(seconds=5)):
 
-        return schemas.Token(
+        token = schemas.Token(
             user_id=token_data.user_id,
             token=token_data.token,
             expires_date=token_data.expires_date
         )
+        _remember_issued_token(user.id, token)
+        return token
 
     if time_expires:
         token_time = datetime.utcnow() + time_expires
@@ -153,15 +212,24 @@ def create_jwt_token(
     )
 
     db.add(new_token)
-    db.commit()
+    await db.commit()
 
-    return schemas.Token(
+    token = schemas.Token(
         token=jwt_token,
         expires_date=token_time
     )
+    _remember_issued_token(user.id, token)
+    return token
+
+
+def _remember_issued_token(user_id: int, token: schemas.Token):
+    # Stop handing the token out a bit before it expires, like the database lookup does
+    ttl = (token.expires_date - datetime.utcnow()).total_seconds() - 5
+    if ttl > 0:
+        issued_tokens.set(user_id, token, ttl=ttl)
 
 
-def get_current_user(token: Depends(oauth2_scheme), db: Session) -> models.User:
+async def get_current_user(token: Depends(oauth2_scheme), db: AsyncSession) -> models.User:
     """
     Retrieves the current user based on the JWT token provided.
 
@@ -169,7 +237,7 @@ def get_current_user(token: Depends(oauth2_scheme), db: Session) -> models.User:
     :type token: str
 
     :param db: The database session object to use for queries
-    :type db: Session
+    :type db: AsyncSession
 
     :returns: The User object corresponding to the token
     :rtype: models.User
@@ -184,14 +252,14 @@ def get_current_user(token: Depends(oauth2_scheme), db: Session) -> models.User:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=ALGORITHM)
+        payload = decode_token(token)
         username = payload.get("user")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = get_user(db, username)
+    user = await get_user(db, username)
     if user is None:
         raise credentials_exception
     return user
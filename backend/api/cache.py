@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+from fastapi import Request, Response, status
+from redis import RedisError
+from redis.asyncio import Redis
+
+from api.compression import COMPRESSION_MIN_SIZE, compress, negotiate_encoding
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES") or 256)
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS") or 300)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    headers: Dict[str, str]
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries also expire after a fixed time.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Any) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Any, value: Any, ttl: float | None = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of serialized responses: in-process LRU, then optionally Redis.
+
+    Keys are built from the request parameters and the revisions of the data they read,
+    so a write makes the old entries unreachable instead of having to delete them.
+    """
+
+    def __init__(self, max_size: int, ttl: int, redis_url: str | None = None):
+        self.ttl = ttl
+        self.local = TTLCache(max_size, ttl)
+        self.redis = Redis.from_url(redis_url) if redis_url else None
+
+    async def get(self, key: str) -> CachedResponse | None:
+        cached = self.local.get(key)
+        if cached is not None or self.redis is None:
+            return cached
+
+        try:
+            payload = await self.redis.get(f"response:{key}")
+        except RedisError:
+            return None
+
+        if payload is None:
+            return None
+
+        meta, body = payload.split(b"\n", 1)
+        meta = json.loads(meta)
+        cached = CachedResponse(body=body, media_type=meta["media_type"], headers=meta["headers"])
+        self.local.set(key, cached)
+
+        return cached
+
+    async def set(self, key: str, cached: CachedResponse):
+        self.local.set(key, cached)
+
+        if self.redis is None:
+            return
+
+        meta = json.dumps({"media_type": cached.media_type, "headers": cached.headers}).encode()
+        try:
+            await self.redis.set(f"response:{key}", meta + b"\n" + cached.body, ex=self.ttl)
+        except RedisError:
+            pass
+
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_REDIS_URL)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Builds a cache key, which is also used as the ETag, from request parameters and data revisions.
+
+    :param parts: Everything the response depends on
+    :type parts: Any
+
+    :returns: A hex digest identifying the response
+    :rtype: str
+    """
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def cached_response(
+        request: Request,
+        key: str,
+        produce: Callable[[], Awaitable[CachedResponse]]
+) -> Response:
+    """
+    Answers a request from the response cache, producing and storing the response on a miss.
+
+    A client sending the current ETag in `If-None-Match` gets 304 without a body.
+    Bodies are compressed with the encoding negotiated from Accept-Encoding, the
+    compressed variants are cached too.
+
+    :param request: The incoming request
+    :type request: Request
+
+    :param key: The cache key of the response, see `make_cache_key`
+    :type key: str
+
+    :param produce: Coroutine function building the response on a cache miss
+    :type produce: Callable[[], Awaitable[CachedResponse]]
+
+    :returns: The response to send
+    :rtype: Response
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    # Every encoding is a representation of its own, with its own ETag
+    etag = f'"{key}-{encoding}"' if encoding else f'"{key}"'
+    vary = {"Vary": "Accept-Encoding"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, **vary})
+
+    encoded = await response_cache.get(f"{key}:{encoding}") if encoding else None
+    if encoded is None:
+        cached = await response_cache.get(key)
+        if cached is None:
+            cached = await produce()
+            await response_cache.set(key, cached)
+
+        encoded = cached
+        if encoding and len(cached.body) >= COMPRESSION_MIN_SIZE:
+            encoded = CachedResponse(
+                compress(cached.body, encoding),
+                cached.media_type,
+                {**cached.headers, "Content-Encoding": encoding},
+            )
+            await response_cache.set(f"{key}:{encoding}", encoded)
+
+    return Response(
+        content=encoded.body,
+        media_type=encoded.media_type,
+        headers={**encoded.headers, "ETag": etag, **vary},
+    )
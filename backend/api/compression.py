@@ -0,0 +1,69 @@
+import gzip
+import os
+from typing import Dict
+
+import brotli
+import zstandard
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE") or 1024)
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL") or 6)
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY") or 5)
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL") or 3)
+
+# Preferred first when a client accepts several with the same quality
+SUPPORTED_ENCODINGS = ("zstd", "br", "gzip")
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Picks a content encoding from the Accept-Encoding header of a request.
+
+    :param accept_encoding: The Accept-Encoding header, if any
+    :type accept_encoding: str | None
+
+    :returns: "zstd", "br" or "gzip", None if the response should not be compressed
+    :rtype: str | None
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    candidates = [
+        (qualities.get(encoding, wildcard), -position, encoding)
+        for position, encoding in enumerate(SUPPORTED_ENCODINGS)
+    ]
+    quality, _, encoding = max(candidates)
+
+    return encoding if quality > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses a response body.
+
+    :param body: The body to compress
+    :type body: bytes
+
+    :param encoding: "zstd", "br" or "gzip", see `negotiate_encoding`
+    :type encoding: str
+
+    :returns: The compressed body
+    :rtype: bytes
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
@@ -1,7 +1,19 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or 4)
+
 crypto_context = CryptContext(schemes=["bcrypt"])
 
+# bcrypt releases the GIL, a small bounded pool keeps logins off the event loop
+# without letting a burst of them take every thread of the process.
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+
 
 def verify_password(password: str, hashed_password: str) -> bool:
     """
@@ -11,3 +23,17 @@ def verify_password(password: str, hashed_password: str) -> bool:
     :return: bool
     """
     return crypto_context.verify(password, hashed_password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """
+    Verifies a password like `verify_password`, in the password hashing thread pool.
+
+    :param password: A real password entered by user
+    :param hashed_password: Hashed password returned from database
+    :return: bool
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_hash_executor, verify_password, password, hashed_password
+    )
@@ -0,0 +1,197 @@
+import csv
+import enum
+import io
+from typing import Iterable, List
+
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException, status
+
+from db.archive import ARCHIVE_SCHEMA
+
+# Archive files list every query which found an advert, responses carry the matching one in `query`
+ADVERT_ARROW_SCHEMA = ARCHIVE_SCHEMA.remove(
+    ARCHIVE_SCHEMA.get_field_index("queries")
+).append(
+    pa.field("date_created", pa.timestamp("us"))
+).append(
+    pa.field("modified_at", pa.timestamp("us"))
+)
+ADVERT_COLUMNS = ADVERT_ARROW_SCHEMA.names
+
+
+class ExportFormat(str, enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+PARQUET_MEDIA_TYPE_ALIASES = (PARQUET_MEDIA_TYPE, "application/x-parquet")
+
+
+def parse_fields(fields: str | None) -> List[str] | None:
+    """
+    Parses the `fields=` projection of a request.
+
+    :param fields: Comma separated advert columns, if any
+    :type fields: str | None
+
+    :returns: The requested columns in `ADVERT_COLUMNS` order, None for every column
+    :rtype: List[str] | None
+
+    :raises HTTPException: If an unknown column is requested
+    """
+    if not fields:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(ADVERT_COLUMNS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+        )
+
+    return [column for column in ADVERT_COLUMNS if column in requested] or None
+
+
+def to_json(rows: List[dict], fields: List[str] | None = None) -> bytes:
+    """
+    Serializes adverts as a JSON array with orjson, without validating them row by row.
+
+    Rows come from the database or the archive already shaped like `schemas.Advertisement`.
+
+    :param rows: The adverts as dictionaries
+    :type rows: List[dict]
+
+    :param fields: The columns to keep, every column if not set
+    :type fields: List[str] | None
+
+    :returns: The encoded array
+    :rtype: bytes
+    """
+    columns = fields or ADVERT_COLUMNS
+    return orjson.dumps([{column: row[column] for column in columns} for row in rows])
+
+
+def to_ndjson(rows: Iterable[dict]) -> bytes:
+    """
+    Serializes adverts as newline delimited JSON with orjson, one advert per line.
+
+    Dates are written in ISO 8601 like `datetime.isoformat` does.
+
+    :param rows: The adverts as dictionaries
+    :type rows: Iterable[dict]
+
+    :returns: The encoded lines
+    :rtype: bytes
+    """
+    return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+
+def to_csv(rows: List[dict], header: bool = False) -> bytes:
+    """
+    Serializes adverts as CSV lines.
+
+    :param rows: The adverts as dictionaries
+    :type rows: List[dict]
+
+    :param header: Whether the header line is written first
+    :type header: bool
+
+    :returns: The encoded lines
+    :rtype: bytes
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ADVERT_COLUMNS, extrasaction="ignore")
+
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+
+    return buffer.getvalue().encode()
+
+
+def negotiate_columnar_format(accept: str | None) -> str | None:
+    """
+    Picks a columnar media type from the Accept header of a request.
+
+    :param accept: The Accept header, if any
+    :type accept: str | None
+
+    :returns: The Arrow IPC stream or Parquet media type, None if JSON should be sent
+    :rtype: str | None
+    """
+    if not accept:
+        return None
+
+    for media_range in accept.split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+
+        if media_type == ARROW_STREAM_MEDIA_TYPE:
+            return ARROW_STREAM_MEDIA_TYPE
+        if media_type in PARQUET_MEDIA_TYPE_ALIASES:
+            return PARQUET_MEDIA_TYPE
+
+    return None
+
+
+def to_arrow_table(rows: List[dict], fields: List[str] | None = None) -> pa.Table:
+    """
+    Builds an Arrow table of adverts column by column.
+
+    :param rows: The adverts as dictionaries
+    :type rows: List[dict]
+
+    :param fields: The columns to keep, every column if not set
+    :type fields: List[str] | None
+
+    :returns: The table with the advert columns
+    :rtype: pa.Table
+    """
+    schema = ADVERT_ARROW_SCHEMA
+    if fields:
+        schema = pa.schema([ADVERT_ARROW_SCHEMA.field(name) for name in fields])
+
+    return pa.table(
+        [
+            pa.array([row[field.name] for row in rows], type=field.type)
+            for field in schema
+        ],
+        schema=schema,
+    )
+
+
+def to_columnar(rows: List[dict], media_type: str, fields: List[str] | None = None) -> bytes:
+    """
+    Serializes adverts as an Arrow IPC stream or a Parquet file.
+
+    :param rows: The adverts as dictionaries
+    :type rows: List[dict]
+
+    :param media_type: `ARROW_STREAM_MEDIA_TYPE` or `PARQUET_MEDIA_TYPE`
+    :type media_type: str
+
+    :param fields: The columns to keep, every column if not set
+    :type fields: List[str] | None
+
+    :returns: The encoded table
+    :rtype: bytes
+    """
+    table = to_arrow_table(rows, fields)
+    sink = pa.BufferOutputStream()
+
+    if media_type == PARQUET_MEDIA_TYPE:
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
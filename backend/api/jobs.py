@@ -0,0 +1,74 @@
+import json
+import os
+from typing import AsyncIterator, Dict
+
+from redis.asyncio import Redis
+
+from celery_worker.progress import (
+    PROGRESS_REDIS_URL,
+    JOB_KEY,
+    JOB_CHANNEL,
+    JOB_FINISHED,
+    parse_progress,
+)
+
+JOB_EVENTS_KEEPALIVE = int(os.getenv("JOB_EVENTS_KEEPALIVE") or 15)
+
+progress_redis = Redis.from_url(PROGRESS_REDIS_URL) if PROGRESS_REDIS_URL else None
+
+
+async def get_job_progress(job_id: str) -> Dict | None:
+    """
+    Reads the progress of a job.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :returns: The progress of the job, None for an unknown job or if progress is not tracked
+    :rtype: Dict | None
+    """
+    if progress_redis is None:
+        return None
+
+    return parse_progress(await progress_redis.hgetall(JOB_KEY.format(job_id=job_id)))
+
+
+def _event(name: str, data: Dict) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def job_events(job_id: str) -> AsyncIterator[bytes]:
+    """
+    Streams the progress of a job as server-sent events until the job is finished.
+
+    Every update of the job is sent as a `progress` event, the last one as a `done` event,
+    so clients refresh their data once, when it has landed.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :returns: An iterator over encoded events
+    :rtype: AsyncIterator[bytes]
+    """
+    pubsub = progress_redis.pubsub()
+    # Subscribed before reading the state, so no update can fall in between
+    await pubsub.subscribe(JOB_CHANNEL.format(job_id=job_id))
+
+    try:
+        progress = await get_job_progress(job_id)
+
+        while progress is not None and progress["status"] not in JOB_FINISHED:
+            yield _event("progress", progress)
+
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=JOB_EVENTS_KEEPALIVE)
+            if message is None:
+                # A comment line keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+
+            progress = await get_job_progress(job_id)
+
+        if progress is not None:
+            yield _event("done", progress)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.close()
@@ -1,17 +1,35 @@
-from datetime import date, timedelta
-from typing import List
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List
 
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 
 
 from db import schemas
-from db.crud import get_adverts, get_distinct_queries
-from db.database import SessionLocal
+from db.crud import (
+    get_adverts,
+    get_distinct_queries,
+    get_query_catalog,
+    get_catalog_stamp,
+    get_price_stats,
+    get_price_history,
+    get_price_histogram,
+    get_place_counts,
+    get_price_scatter,
+    get_query_revisions,
+    search_adverts,
+    stream_adverts,
+)
+from db.database import AsyncSessionLocal
+from db.archive import archived_files
 from api.auth import (
     authenticate_user,
     create_jwt_token,
@@ -19,33 +37,64 @@ from api.auth import (
     check_token_expiration,
 )
 from api.auth import TOKEN_EXPIRES_TIME
+from api.pagination import encode_cursor, decode_cursor
+from api.admission import admit, job_cost
+from api.jobs import get_job_progress, job_events
+from api.cache import CachedResponse, cached_response, make_cache_key
+from api.formats import (
+    ExportFormat,
+    EXPORT_MEDIA_TYPES,
+    to_ndjson,
+    to_csv,
+    to_columnar,
+    to_json,
+    parse_fields,
+    negotiate_columnar_format,
+)
 
-from celery_worker.worker import celery_app, get_and_save_date
+from celery_worker.worker import celery_app, get_and_save_date, get_and_save_batch
 
 olx_app = FastAPI()
 
+SEARCH_PAGE_LIMIT = 100
+CHART_MAX_BINS = 500
+CHART_MAX_PLACES = 100
+CHART_MAX_POINTS = 20000
+ADVERTS_PAGE_LIMIT = int(os.getenv("ADVERTS_PAGE_LIMIT") or 5000)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Set by the chart endpoints when the date range reaches archived months, which charts leave out
+ARCHIVE_EXCLUDED_HEADER = "X-Archive-Excluded"
+SCRAPE_BATCH_MAX = int(os.getenv("SCRAPE_BATCH_MAX") or 50)
+
+QUERY_CATALOG_ADAPTER = TypeAdapter(List[schemas.QueryCatalogEntry])
 
-def get_db() -> Session:
-    db = SessionLocal()
-    return db
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
 @olx_app.post("/token", response_model=schemas.Token)
-async def get_token_data(form_date: OAuth2PasswordRequestForm = Depends()):
+async def get_token_data(
+    form_date: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
     """
     Endpoint to get token data for a user.
 
     :param form_date: OAuth2 password request form data
     :type form_date: OAuth2PasswordRequestForm, default is Depends()
 
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
     :return: JWT token data
     :rtype: schemas.Token
 
     :raises HTTPException: If the username or password is incorrect
     """
 
-    db = get_db()
-    user = authenticate_user(db, form_date.username, form_date.password)
+    user = await authenticate_user(db, form_date.username, form_date.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,7 +103,7 @@ async def get_token_data(form_date: OAuth2PasswordRequestForm = Depends()):
         )
 
     access_token_time = timedelta(minutes=TOKEN_EXPIRES_TIME)
-    access_token = create_jwt_token(
+    access_token = await create_jwt_token(
         {"user": user.username}, db=db, time_expires=access_token_time
     )
 
@@ -87,14 +136,17 @@ async def save_olx_data(
     :param token: Authentication token, default is extracted from the request headers
     :type token: str, optional
 
-    :return: JSON response indicating the task status
+    :return: JSON response indicating the task status and the id of the job,
+    its progress is served by `/api/v1/jobs/{job_id}`
     :rtype: JSONResponse
 
-    :raises HTTPException: If backend is not responding or query param is missing
+    :raises HTTPException: If backend is not responding or query param is missing,
+    422 if the job costs more than a user may have pending, 429 if the job is not admitted,
+    see `api.admission.admit`
     """
-    check_token_expiration(token=token)
+    payload = check_token_expiration(token=token)
 
-    celery_status = celery_app.control.ping()
+    celery_status = await run_in_threadpool(celery_app.control.ping)
 
     if not query:
         return JSONResponse(
@@ -111,24 +163,173 @@ async def save_olx_data(
             detail="Backend doesn`t work well! Try again later!",
         )
 
-    get_and_save_date(query, limit, price_from, price_to)
+    admission = await admit(payload.get("user"), job_cost([limit]))
+
+    job_id = await run_in_threadpool(
+        get_and_save_date, query, limit, price_from, price_to, admission.queue, admission.pending_key
+    )
 
     return JSONResponse(
         content={
             "msg": "Task added to the queue",
+            "job_id": job_id,
         },
         status_code=status.HTTP_200_OK,
         media_type="application/json",
     )
 
 
+@olx_app.post("/api/v1/adverts/batch", response_model=schemas.ScrapeBatchJob)
+async def save_olx_data_batch(
+    specs: List[schemas.ScrapeSpec],
+    token: str = Depends(oauth2_scheme),
+):
+    """
+    Endpoint to save OLX data of several queries asynchronously, as one job.
+
+    :param specs: The query, limit and price range of every request to parse
+    :type specs: List[schemas.ScrapeSpec]
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :return: The id of the job and the number of queued requests
+    :rtype: schemas.ScrapeBatchJob
+
+    :raises HTTPException: If the batch is empty or too big, or backend is not responding,
+    422 if the job costs more than a user may have pending, 429 if the job is not admitted,
+    see `api.admission.admit`
+    """
+    payload = check_token_expiration(token=token)
+
+    if not 0 < len(specs) <= SCRAPE_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch should have from 1 to {SCRAPE_BATCH_MAX} requests",
+        )
+
+    celery_status = await run_in_threadpool(celery_app.control.ping)
+
+    if not celery_status:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Backend doesn`t work well! Try again later!",
+        )
+
+    admission = await admit(payload.get("user"), job_cost(spec.limit for spec in specs))
+
+    job_id = await run_in_threadpool(
+        get_and_save_batch, [spec.model_dump() for spec in specs], admission.queue, admission.pending_key
+    )
+
+    return schemas.ScrapeBatchJob(msg="Tasks added to the queue", job_id=job_id, tasks=len(specs))
+
+
+@olx_app.get("/api/v1/jobs/{job_id}", response_model=schemas.JobProgress)
+async def get_job(
+    job_id: str,
+    token: str = Depends(oauth2_scheme),
+):
+    """
+    Endpoint to retrieve the progress of a scrape job.
+
+    :param job_id: The id of the job returned when it was submitted
+    :type job_id: str
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :return: The status of the job with its fetched pages and written rows
+    :rtype: schemas.JobProgress
+
+    :raises HTTPException: If the job is unknown
+    """
+    check_token_expiration(token=token)
+
+    progress = await get_job_progress(job_id)
+    if progress is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+
+    return progress
+
+
+@olx_app.get("/api/v1/jobs/{job_id}/events", response_class=StreamingResponse)
+async def get_job_events(
+    job_id: str,
+    token: str = Depends(oauth2_scheme),
+):
+    """
+    Endpoint streaming the progress of a scrape job as server-sent events.
+
+    A `progress` event is sent on every update of the job and a single `done` event
+    once it is finished, when its adverts can be read.
+
+    :param job_id: The id of the job returned when it was submitted
+    :type job_id: str
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :return: Streaming response with the events
+    :rtype: StreamingResponse
+
+    :raises HTTPException: If the job is unknown
+    """
+    check_token_expiration(token=token)
+
+    if await get_job_progress(job_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+
+    return StreamingResponse(
+        job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @olx_app.get("/api/v1/adverts", response_model=List[schemas.Advertisement])
 async def get_data_from_db(
-    query: str, date_from: date, date_to: date, token: str = Depends(oauth2_scheme)
+    request: Request,
+    query: str,
+    date_from: date,
+    date_to: date,
+    limit: int = Query(default=ADVERTS_PAGE_LIMIT, ge=1, le=ADVERTS_PAGE_LIMIT),
+    cursor: str | None = None,
+    price_from: int | None = Query(default=None, ge=0),
+    price_to: int | None = Query(default=None, ge=0),
+    tags: str | None = None,
+    place: str | None = None,
+    sort: schemas.AdvertSort = schemas.AdvertSort.date,
+    since: datetime | None = None,
+    fields: str | None = None,
+    accept: str | None = Header(default=None),
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Endpoint to retrieve data from the database based on query and date range.
 
+    Adverts are returned in pages ordered by date_added, or by price when `sort=price`.
+    When more adverts match, the `X-Next-Cursor` response header holds the cursor of the next page.
+    Price range, category and place filters are applied by the database.
+
+    The page is sent as JSON unless the Accept header asks for an Arrow IPC stream
+    (`application/vnd.apache.arrow.stream`) or Parquet (`application/vnd.apache.parquet`).
+    Rows are serialized as read, without validating them one by one, and compressed
+    with zstd, brotli or gzip when the client accepts it.
+
+    Serialized pages are cached until the worker writes adverts of a matching query,
+    and an unchanged page is answered with 304 when the client sends its ETag.
+
+    :param request: The incoming request, used for conditional requests
+    :type request: Request
+
     :param query: The query string for searching adverts
     :type query: str
 
@@ -138,57 +339,609 @@ async def get_data_from_db(
     :param date_to: The end date for retrieving adverts
     :type date_to: date
 
+    :param limit: The page size, defaults to the maximum `ADVERTS_PAGE_LIMIT`
+    :type limit: int, optional
+
+    :param cursor: The `X-Next-Cursor` of the previous page, omitted for the first page
+    :type cursor: str | None
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param sort: The order of the adverts, `date` (default) or `price`, which skips adverts without a price
+    :type sort: schemas.AdvertSort, optional
+
+    :param since: Only return adverts stored or changed after this moment, to sync a copy incrementally.
+                  Adverts are stamped before they are committed, so clients pass a moment some
+                  minutes before the highest `modified_at` they have seen and dedupe by url
+    :type since: datetime | None
+
+    :param fields: Comma separated advert columns to return, every column if not set
+    :type fields: str | None
+
+    :param accept: The Accept header of the request
+    :type accept: str | None
+
     :param token: Authentication token, default is extracted from the request headers
     :type token: str, optional
 
-    :return: List of advertisements matching the criteria
-    :rtype: List[schemas.Advertisement]
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
 
-    :raises HTTPException: If there is a database error
+    :return: Page of advertisements matching the criteria
+    :rtype: Response
+
+    :raises HTTPException: If the cursor is invalid or there is a database error
     """
     check_token_expiration(token=token)
 
-    db = get_db()
+    after = decode_cursor(
+        cursor, types=(int, int) if sort == schemas.AdvertSort.price else (datetime, int)
+    )
+    media_type = negotiate_columnar_format(accept)
+    columns = parse_fields(fields)
+
+    async def produce_page() -> CachedResponse:
+        data, next_keyset = await get_adverts(
+            db=db,
+            query=query,
+            start_date=date_from,
+            end_date=date_to,
+            limit=limit,
+            after=after,
+            price_from=price_from,
+            price_to=price_to,
+            tags=tags,
+            place=place,
+            sort=sort,
+            since=since,
+        )
+        headers = {NEXT_CURSOR_HEADER: encode_cursor(next_keyset)} if next_keyset else {}
+
+        if media_type:
+            return CachedResponse(to_columnar(data, media_type, columns), media_type, headers)
+
+        return CachedResponse(to_json(data, columns), "application/json", headers)
 
     try:
-        data = get_adverts(db=db, query=query, start_date=date_from, end_date=date_to)
+        revisions = await get_query_revisions(db=db, query=query)
+        key = make_cache_key(
+            "adverts", query, date_from, date_to, limit, cursor,
+            price_from, price_to, tags, place, sort.value, since, columns, media_type, revisions
+        )
+        return await cached_response(request, key, produce_page)
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error with database!",
         )
 
-    finally:
-        db.close()
 
-    return data
+@olx_app.get("/api/v1/adverts/export", response_class=StreamingResponse)
+async def export_adverts(
+    query: str,
+    date_from: date,
+    date_to: date,
+    export_format: ExportFormat = Query(default=ExportFormat.ndjson, alias="format"),
+    token: str = Depends(oauth2_scheme),
+):
+    """
+    Endpoint to export every advert matching the query and date range as a stream.
+
+    Rows are read through a server-side cursor and written while they are read,
+    so memory use stays constant and the first bytes are sent right away.
+
+    :param query: The query string for searching adverts
+    :type query: str
+
+    :param date_from: The start date for exporting adverts
+    :type date_from: date
+
+    :param date_to: The end date for exporting adverts
+    :type date_to: date
+
+    :param export_format: The output format, `ndjson` (default) or `csv`
+    :type export_format: ExportFormat, optional
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :return: Streaming response with the adverts
+    :rtype: StreamingResponse
+    """
+    check_token_expiration(token=token)
+
+    async def export_content():
+        # The session has to live as long as the stream, not as long as the handler
+        async with AsyncSessionLocal() as db:
+            header = True
+            async for batch in stream_adverts(
+                db=db, query=query, start_date=date_from, end_date=date_to
+            ):
+                if export_format == ExportFormat.csv:
+                    yield to_csv(batch, header=header)
+                    header = False
+                else:
+                    yield to_ndjson(batch)
+
+    return StreamingResponse(
+        export_content(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f"attachment; filename=adverts.{export_format.value}"
+        },
+    )
+
+
+@olx_app.get("/api/v1/adverts/search", response_model=schemas.AdvertisementSearchPage)
+async def search_adverts_in_db(
+    text: str,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    price_from: int | None = None,
+    price_to: int | None = None,
+    limit: int = Query(default=20, ge=1, le=SEARCH_PAGE_LIMIT),
+    cursor: str | None = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to search adverts by title, ranked by relevance.
+
+    :param text: The text to search in advert titles
+    :type text: str
+
+    :param date_from: The start date for retrieving adverts, optional
+    :type date_from: date | None
+
+    :param date_to: The end date for retrieving adverts, optional
+    :type date_to: date | None
+
+    :param price_from: The minimum price of adverts, optional
+    :type price_from: int | None
+
+    :param price_to: The maximum price of adverts, optional
+    :type price_to: int | None
+
+    :param limit: The page size, defaults to 20
+    :type limit: int, optional
+
+    :param cursor: The `next_cursor` of the previous page, omitted for the first page
+    :type cursor: str | None
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: A page of matching adverts and the cursor of the next page
+    :rtype: schemas.AdvertisementSearchPage
+
+    :raises HTTPException: If the cursor is invalid or there is a database error
+    """
+    check_token_expiration(token=token)
+
+    after = decode_cursor(cursor)
+
+    try:
+        rows, next_keyset = await search_adverts(
+            db=db,
+            text=text,
+            start_date=date_from,
+            end_date=date_to,
+            price_from=price_from,
+            price_to=price_to,
+            limit=limit,
+            after=after,
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+    return schemas.AdvertisementSearchPage(
+        items=rows,
+        next_cursor=encode_cursor(next_keyset) if next_keyset else None,
+    )
 
 
 @olx_app.get("/api/v1/query-types", response_class=JSONResponse)
-async def get_query_types(token: str = Depends(oauth2_scheme)):
+async def get_query_types(
+    request: Request,
+    details: bool = False,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
     """
     Endpoint to retrieve distinct query types from the database.
 
+    Query types are read from the query catalog. The serialized list is cached until
+    a query is added, scraped or its adverts change.
+
+    :param request: The incoming request, used for conditional requests
+    :type request: Request
+
+    :param details: Whether to return the catalog entries with advert counts and seen/scraped dates
+                    instead of the query names only
+    :type details: bool, optional
+
     :param token: Authentication token, default is extracted from the request headers
     :type token: str, optional
 
-    :return: JSON response with distinct query types
-    :rtype: JSONResponse
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: JSON response with distinct query types or their catalog entries
+    :rtype: Response
+
+    :raises HTTPException: If there is a database error
+    """
+    check_token_expiration(token=token)
+
+    async def produce_query_types() -> CachedResponse:
+        if details:
+            catalog = [
+                schemas.QueryCatalogEntry.model_validate(entry) for entry in await get_query_catalog(db=db)
+            ]
+            return CachedResponse(QUERY_CATALOG_ADAPTER.dump_json(catalog), "application/json", {})
+
+        distinct_queries = await get_distinct_queries(db=db)
+        return CachedResponse(json.dumps(distinct_queries).encode(), "application/json", {})
+
+    try:
+        stamp = await get_catalog_stamp(db=db)
+        key = make_cache_key("query-types", details, stamp)
+        return await cached_response(request, key, produce_query_types)
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+
+@olx_app.get("/api/v1/price-stats", response_model=List[schemas.AdvertPriceStats])
+async def get_price_stats_from_db(
+    query: str,
+    date_from: date,
+    date_to: date,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to retrieve pre-aggregated price statistics per query, category, place and day.
+
+    :param query: The query string for searching adverts, "all" matches every query
+    :type query: str
+
+    :param date_from: The start date of the statistics
+    :type date_from: date
+
+    :param date_to: The end date of the statistics
+    :type date_to: date
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: List of price statistics matching the criteria
+    :rtype: List[schemas.AdvertPriceStats]
+
+    :raises HTTPException: If there is a database error
+    """
+    check_token_expiration(token=token)
+
+    try:
+        stats = await get_price_stats(db=db, query=query, start_date=date_from, end_date=date_to)
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+    return stats
+
+
+@olx_app.get("/api/v1/charts/price-histogram", response_model=List[schemas.PriceHistogramBin])
+async def get_price_histogram_from_db(
+    response: Response,
+    query: str,
+    date_from: date,
+    date_to: date,
+    bins: int = Query(default=50, ge=1, le=CHART_MAX_BINS),
+    price_from: int | None = Query(default=None, ge=0),
+    price_to: int | None = Query(default=None, ge=0),
+    tags: str | None = None,
+    place: str | None = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to retrieve a price histogram of adverts, the bins are counted by the database.
+
+    Only adverts in the database are aggregated, the archived ones returned by
+    `/api/v1/adverts` are not. The `X-Archive-Excluded` header is set when the
+    date range reaches archived months.
+
+    :param response: The response, used to flag ranges reaching archived adverts
+    :type response: Response
+
+    :param query: The query string for searching adverts
+    :type query: str
+
+    :param date_from: The start date of the adverts
+    :type date_from: date
+
+    :param date_to: The end date of the adverts
+    :type date_to: date
+
+    :param bins: The number of equal width price bins
+    :type bins: int, optional
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: The histogram bins ordered by price
+    :rtype: List[schemas.PriceHistogramBin]
 
     :raises HTTPException: If there is a database error
     """
     check_token_expiration(token=token)
 
-    db = get_db()
+    if await run_in_threadpool(archived_files, date_from, date_to):
+        response.headers[ARCHIVE_EXCLUDED_HEADER] = "true"
 
     try:
-        distinct_queries = get_distinct_queries(db=db)
+        return await get_price_histogram(
+            db=db,
+            query=query,
+            start_date=date_from,
+            end_date=date_to,
+            bins=bins,
+            price_from=price_from,
+            price_to=price_to,
+            tags=tags,
+            place=place,
+        )
     except OperationalError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error with database!",
         )
-    finally:
-        db.close()
 
-    return distinct_queries
+
+@olx_app.get("/api/v1/charts/places", response_model=List[schemas.PlaceCount])
+async def get_place_counts_from_db(
+    response: Response,
+    query: str,
+    date_from: date,
+    date_to: date,
+    top: int = Query(default=10, ge=1, le=CHART_MAX_PLACES),
+    price_from: int | None = Query(default=None, ge=0),
+    price_to: int | None = Query(default=None, ge=0),
+    tags: str | None = None,
+    place: str | None = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to retrieve the number of adverts per place, for the most frequent places.
+
+    Only adverts in the database are aggregated, the archived ones returned by
+    `/api/v1/adverts` are not. The `X-Archive-Excluded` header is set when the
+    date range reaches archived months.
+
+    :param response: The response, used to flag ranges reaching archived adverts
+    :type response: Response
+
+    :param query: The query string for searching adverts
+    :type query: str
+
+    :param date_from: The start date of the adverts
+    :type date_from: date
+
+    :param date_to: The end date of the adverts
+    :type date_to: date
+
+    :param top: The number of places counted on their own, the rest are summed up as "other"
+    :type top: int, optional
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: The advert counts of the top places and of "other"
+    :rtype: List[schemas.PlaceCount]
+
+    :raises HTTPException: If there is a database error
+    """
+    check_token_expiration(token=token)
+
+    if await run_in_threadpool(archived_files, date_from, date_to):
+        response.headers[ARCHIVE_EXCLUDED_HEADER] = "true"
+
+    try:
+        return await get_place_counts(
+            db=db,
+            query=query,
+            start_date=date_from,
+            end_date=date_to,
+            top=top,
+            price_from=price_from,
+            price_to=price_to,
+            tags=tags,
+            place=place,
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+
+@olx_app.get("/api/v1/charts/price-scatter", response_model=List[schemas.ScatterPoint])
+async def get_price_scatter_from_db(
+    response: Response,
+    query: str,
+    date_from: date,
+    date_to: date,
+    points: int = Query(default=2000, ge=1, le=CHART_MAX_POINTS),
+    price_from: int | None = Query(default=None, ge=0),
+    price_to: int | None = Query(default=None, ge=0),
+    tags: str | None = None,
+    place: str | None = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to retrieve the (date_added, price) points of adverts downsampled to a point budget.
+
+    Every time bin keeps its cheapest, median and most expensive advert, so outliers stay visible.
+
+    Only adverts in the database are aggregated, the archived ones returned by
+    `/api/v1/adverts` are not. The `X-Archive-Excluded` header is set when the
+    date range reaches archived months.
+
+    :param response: The response, used to flag ranges reaching archived adverts
+    :type response: Response
+
+    :param query: The query string for searching adverts
+    :type query: str
+
+    :param date_from: The start date of the adverts
+    :type date_from: date
+
+    :param date_to: The end date of the adverts
+    :type date_to: date
+
+    :param points: The point budget of the scatter
+    :type points: int, optional
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: The kept adverts ordered by date_added
+    :rtype: List[schemas.ScatterPoint]
+
+    :raises HTTPException: If there is a database error
+    """
+    check_token_expiration(token=token)
+
+    if await run_in_threadpool(archived_files, date_from, date_to):
+        response.headers[ARCHIVE_EXCLUDED_HEADER] = "true"
+
+    try:
+        return await get_price_scatter(
+            db=db,
+            query=query,
+            start_date=date_from,
+            end_date=date_to,
+            points=points,
+            price_from=price_from,
+            price_to=price_to,
+            tags=tags,
+            place=place,
+        )
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+
+@olx_app.get("/api/v1/price-history", response_model=schemas.AdvertPriceHistory)
+async def get_price_history_from_db(
+    url: str,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Endpoint to retrieve the price trajectory of a single advert.
+
+    :param url: The url of the advert
+    :type url: str
+
+    :param token: Authentication token, default is extracted from the request headers
+    :type token: str, optional
+
+    :param db: Database session, provided by the `get_db` dependency
+    :type db: AsyncSession
+
+    :return: The recorded price changes of the advert
+    :rtype: schemas.AdvertPriceHistory
+
+    :raises HTTPException: If the advert is unknown or there is a database error
+    """
+    check_token_expiration(token=token)
+
+    try:
+        history = await get_price_history(db=db, url=url)
+    except OperationalError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error with database!",
+        )
+
+    if history is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Advert with such url is not found",
+        )
+
+    return history
@@ -0,0 +1,62 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from typing import Any, Tuple
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(values: Tuple[Any, ...]) -> str:
+    """
+    Encodes the keyset of the last returned row into an opaque cursor.
+
+    :param values: The sort key values of the last row of a page
+    :type values: Tuple[Any, ...]
+
+    :returns: An url-safe cursor string
+    :rtype: str
+    """
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str | None, types: Tuple[type, ...] | None = None) -> Tuple[Any, ...] | None:
+    """
+    Decodes a cursor produced by `encode_cursor` back into the keyset values.
+
+    :param cursor: The cursor passed by a client, if any
+    :type cursor: str | None
+
+    :param types: The expected types of the keyset values, not checked if not set
+    :type types: Tuple[type, ...] | None
+
+    :returns: The keyset values or None when no cursor was passed
+    :rtype: Tuple[Any, ...] | None
+
+    :raises HTTPException: If the cursor is malformed
+    """
+    if not cursor:
+        return None
+
+    try:
+        payload = json.loads(urlsafe_b64decode(cursor.encode()))
+        values = tuple(
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload
+        )
+        # A cursor of another sort order would compare values of the wrong type
+        if types is not None and (
+                len(values) != len(types)
+                or not all(isinstance(value, kind) for value, kind in zip(values, types))
+        ):
+            raise ValueError(cursor)
+        return values
+    except (BinasciiError, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
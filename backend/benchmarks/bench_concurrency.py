@@ -0,0 +1,89 @@
+"""
+Measures how the read endpoints scale with the number of concurrent clients.
+
+With blocking database calls inside `async def` handlers the throughput stays flat
+whatever the concurrency, with the async data-access layer it grows until the
+connection pool (`ASYNC_POOL_SIZE` + `ASYNC_MAX_OVERFLOW`) is saturated.
+
+Usage:
+    python -m benchmarks.bench_concurrency --username user1 --password 123456 \\
+        --query iphone --date-from 2023-09-01 --date-to 2023-09-30
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def get_token(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def run_level(
+        client: httpx.AsyncClient,
+        path: str,
+        params: dict,
+        headers: dict,
+        concurrency: int,
+        requests_count: int
+) -> float:
+    """
+    Sends `requests_count` requests to the path with at most `concurrency` in flight.
+
+    :returns: The achieved requests per second
+    :rtype: float
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send():
+        async with semaphore:
+            response = await client.get(path, params=params, headers=headers)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(requests_count)))
+    return requests_count / (time.perf_counter() - started)
+
+
+async def main(args: argparse.Namespace):
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        token = await get_token(client, args.username, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        endpoints = [
+            ("/api/v1/query-types", {}),
+            ("/api/v1/adverts", {
+                "query": args.query,
+                "date_from": args.date_from,
+                "date_to": args.date_to,
+            }),
+        ]
+
+        for path, params in endpoints:
+            print(f"\n{path}")
+            print(f"{'concurrency':>12} {'req/s':>10} {'speedup':>8}")
+
+            baseline = None
+            for concurrency in args.concurrency:
+                rps = await run_level(client, path, params, headers, concurrency, args.requests)
+                baseline = baseline or rps
+                print(f"{concurrency:>12} {rps:>10.1f} {rps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--query", default="all")
+    parser.add_argument("--date-from", required=True)
+    parser.add_argument("--date-to", required=True)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,185 @@
+"""
+Load-tests the API and reports throughput and tail latency per endpoint and concurrency.
+
+Seed the database first with `benchmarks.seed_adverts`. Save a run with `--output` and
+compare later runs against it with `--baseline`. The exit status is 1 when a throughput
+or p95/p99 latency regresses by more than `--tolerance`.
+
+Usage:
+    python -m benchmarks.bench_latency --username bench --password bench \\
+        --query "bench iphone" --date-from 2023-01-01 --date-to 2024-01-01 \\
+        --output baseline.json
+    python -m benchmarks.bench_latency ... --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.bench_concurrency import get_token
+
+# Higher is better for throughput, lower for latencies
+HIGHER_IS_BETTER = {"rps"}
+COMPARED_METRICS = ("rps", "p95_ms", "p99_ms")
+
+
+async def run_level(
+        client: httpx.AsyncClient,
+        send_request,
+        concurrency: int,
+        requests_count: int
+) -> Dict[str, float]:
+    """
+    Sends `requests_count` requests with at most `concurrency` in flight.
+
+    :returns: The requests per second, latency percentiles in milliseconds and the error count
+    :rtype: Dict[str, float]
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def send():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await send_request(client)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "rps": requests_count / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "errors": errors,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints the change of every metric against the baseline run.
+
+    :returns: Whether a metric regressed by more than the tolerance
+    :rtype: bool
+    """
+    regressed = False
+    print(f"\nCompared with the baseline of {baseline.get('started_at')}")
+
+    for endpoint, levels in results["endpoints"].items():
+        for concurrency, metrics in levels.items():
+            before = baseline.get("endpoints", {}).get(endpoint, {}).get(concurrency)
+            if not before:
+                continue
+
+            changes = []
+            for metric in COMPARED_METRICS:
+                change = (metrics[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                flag = " !" if worse > tolerance else ""
+                regressed = regressed or worse > tolerance
+                changes.append(f"{metric} {change:+.1%}{flag}")
+
+            print(f"{endpoint:<24} c={concurrency:<4} " + "  ".join(changes))
+
+    return regressed
+
+
+async def main(args: argparse.Namespace) -> int:
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120) as client:
+        token = await get_token(client, args.username, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def adverts_params() -> dict:
+            # Different page sizes are different cache keys, so the database is hit every time
+            limit = random.randint(args.limit // 2, args.limit) if args.bypass_cache else args.limit
+            return {
+                "query": args.query,
+                "date_from": args.date_from,
+                "date_to": args.date_to,
+                "limit": limit,
+            }
+
+        endpoints = {
+            "/token": lambda c: c.post(
+                "/token", data={"username": args.username, "password": args.password}
+            ),
+            "/api/v1/adverts": lambda c: c.get(
+                "/api/v1/adverts", params=adverts_params(), headers=headers
+            ),
+            "/api/v1/query-types": lambda c: c.get(
+                "/api/v1/query-types", headers=headers
+            ),
+        }
+
+        results = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "requests": args.requests,
+            "endpoints": {},
+        }
+
+        for endpoint, send_request in endpoints.items():
+            if args.endpoints and endpoint not in args.endpoints:
+                continue
+
+            print(f"\n{endpoint}")
+            print(f"{'concurrency':>12} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+            # One untimed request per endpoint, so connections and caches are warm
+            await send_request(client)
+
+            levels = results["endpoints"].setdefault(endpoint, {})
+            for concurrency in args.concurrency:
+                metrics = await run_level(client, send_request, concurrency, args.requests)
+                levels[str(concurrency)] = metrics
+                print(
+                    f"{concurrency:>12} {metrics['rps']:>10.1f} {metrics['p50_ms']:>9.1f} "
+                    f"{metrics['p95_ms']:>9.1f} {metrics['p99_ms']:>9.1f} {metrics['errors']:>7}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--query", default="all")
+    parser.add_argument("--date-from", required=True)
+    parser.add_argument("--date-to", required=True)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--endpoints", nargs="*", help="Only these endpoints, e.g. /api/v1/adverts")
+    parser.add_argument("--bypass-cache", action="store_true", help="Vary the page size to miss the response cache")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--baseline", help="Compare with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,98 @@
+"""
+Compares the serialization paths of `/api/v1/adverts` on synthetic adverts.
+
+For every path it reports the time to serialize a page and the payload size,
+raw and with each supported content encoding. Nothing but the API code is needed,
+no database or running server.
+
+Usage:
+    python -m benchmarks.bench_serialization --rows 10000 --repeat 5
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from pydantic import TypeAdapter
+
+from api.compression import SUPPORTED_ENCODINGS, compress
+from api.formats import (
+    ARROW_STREAM_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    parse_fields,
+    to_columnar,
+    to_json,
+)
+from db import schemas
+
+PLACES = ["Киев", "Львов", "Одесса", "Днепр", "Харьков", "Запорожье", "Винница"]
+TAGS = ["Электроника", "Детский мир", "Авто", "Дом и сад", "Хобби, отдых и спорт"]
+
+
+def make_adverts(rows: int) -> List[dict]:
+    # Rows shaped like the ones `crud.get_adverts` returns, with every column of the response
+    started = datetime(2023, 9, 1)
+    stored = datetime(2023, 12, 1)
+    return [
+        {
+            "id": position,
+            "title": f"Apple iPhone {random.randint(7, 15)} {random.choice(['64', '128', '256'])}GB",
+            "url": f"https://www.olx.ua/d/uk/obyavlenie/iphone-ID{position:08d}.html",
+            "price": random.randint(1000, 60000) if random.random() > 0.05 else None,
+            "place": random.choice(PLACES),
+            "query": "iphone",
+            "date_added": started + timedelta(seconds=position * 37),
+            "tags": random.choice(TAGS),
+            "date_created": stored,
+            "modified_at": stored + timedelta(seconds=position % 3600),
+        }
+        for position in range(rows)
+    ]
+
+
+def measure(serialize: Callable[[], bytes], repeat: int) -> tuple[float, bytes]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = serialize()
+        timings.append(time.perf_counter() - started)
+    return min(timings), body
+
+
+def main(args: argparse.Namespace):
+    adverts = make_adverts(args.rows)
+    adapter = TypeAdapter(List[schemas.Advertisement])
+    projection = parse_fields("price,date_added")
+
+    paths = [
+        ("pydantic (validate + dump)", lambda: adapter.dump_json(adapter.validate_python(adverts))),
+        ("orjson", lambda: to_json(adverts)),
+        ("orjson fields=price,date_added", lambda: to_json(adverts, projection)),
+        ("arrow stream", lambda: to_columnar(adverts, ARROW_STREAM_MEDIA_TYPE)),
+        ("parquet", lambda: to_columnar(adverts, PARQUET_MEDIA_TYPE)),
+    ]
+
+    header = f"{'path':<32} {'ms':>8} {'raw KiB':>9}" + "".join(
+        f" {encoding + ' KiB':>9} {encoding + ' ms':>8}" for encoding in SUPPORTED_ENCODINGS
+    )
+    print(f"{args.rows} adverts, best of {args.repeat}")
+    print(header)
+
+    for name, serialize in paths:
+        seconds, body = measure(serialize, args.repeat)
+        line = f"{name:<32} {seconds * 1000:>8.1f} {len(body) / 1024:>9.1f}"
+
+        for encoding in SUPPORTED_ENCODINGS:
+            compress_seconds, compressed = measure(lambda: compress(body, encoding), args.repeat)
+            line += f" {len(compressed) / 1024:>9.1f} {compress_seconds * 1000:>8.1f}"
+
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+
+    main(parser.parse_args())
@@ -0,0 +1,164 @@
+"""
+Seeds the database with synthetic adverts, so the API can be benchmarked on a realistic volume.
+
+Adverts are spread over the last `--days` days and `--queries` queries and loaded with COPY,
+a million rows take about a minute. The identities, query associations, query catalog and
+revisions are written like the worker does, and a benchmark user is created if it does not
+exist yet.
+
+Usage (inside the compose network, the database host is `db`):
+    docker compose run --rm web python -m benchmarks.seed_adverts --rows 1000000 \\
+        --username bench --password bench
+"""
+import argparse
+import csv
+import io
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text, update
+
+from api.encrypt_utils import crypto_context
+from db import models
+from db.database import SessionLocal
+from db.dimensions import query_ids, tag_ids, place_ids
+from db.partitions import ensure_partitions
+
+PLACES = ["Киев", "Львов", "Одесса", "Днепр", "Харьков", "Запорожье", "Винница", "Полтава", "Черкассы", "Ужгород"]
+TAGS = ["Электроника", "Детский мир", "Авто", "Дом и сад", "Хобби, отдых и спорт", "Мода и стиль"]
+WORDS = ["iphone", "samsung", "ноутбук", "велосипед", "диван", "коляска", "куртка", "шины", "гитара", "стол"]
+
+COPY_COLUMNS = (
+    "title", "url", "price", "place_id", "query_id", "date_added", "date_created", "modified_at", "tag_id"
+)
+
+
+def seed_user(db, username: str, password: str):
+    user = db.execute(
+        select(models.User).where(models.User.username == username)
+    ).scalars().first()
+
+    if user is None:
+        db.add(models.User(
+            username=username,
+            hashed_password=crypto_context.hash(password),
+            email=None,
+            is_superuser=False,
+        ))
+
+
+def copy_batch(db, rows: list):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(f"COPY adverts ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH CSV", buffer)
+
+
+def main(args: argparse.Namespace):
+    random.seed(args.seed)
+    db = SessionLocal()
+
+    queries = [f"bench {WORDS[position % len(WORDS)]} {position}" for position in range(args.queries)]
+    query_id_of = query_ids.resolve_many(db, queries)
+    tag_id_of = tag_ids.resolve_many(db, TAGS)
+    place_id_of = place_ids.resolve_many(db, PLACES)
+
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    ensure_partitions(db, [start + timedelta(days=day) for day in range(args.days + 1)])
+
+    seed_user(db, args.username, args.password)
+    db.commit()
+
+    started = time.perf_counter()
+    span = (end - start).total_seconds()
+    batch = []
+
+    for position in range(args.rows):
+        query = random.choice(queries)
+        date_added = start + timedelta(seconds=random.random() * span)
+        # Prices are roughly log-normal, a few adverts have none
+        price = None if random.random() < 0.05 else int(math.exp(random.gauss(8.5, 1.2)))
+
+        batch.append((
+            f"{query.split()[1]} {random.choice(WORDS)} {position}",
+            f"https://www.olx.ua/d/uk/obyavlenie/bench-{args.seed}-{position}.html",
+            "" if price is None else price,
+            place_id_of[random.choice(PLACES)],
+            query_id_of[query],
+            f"{date_added:%Y-%m-%d %H:%M:%S}",
+            f"{end:%Y-%m-%d %H:%M:%S}",
+            f"{end:%Y-%m-%d %H:%M:%S}",
+            tag_id_of[random.choice(TAGS)],
+        ))
+
+        if len(batch) >= args.batch_size:
+            copy_batch(db, batch)
+            db.commit()
+            batch = []
+            print(f"{position + 1} adverts, {time.perf_counter() - started:.1f}s")
+
+    if batch:
+        copy_batch(db, batch)
+
+    # Queries filter adverts through their identities, urls are unique per seed and position
+    db.execute(text("""
+        INSERT INTO advert_identities (url, advert_id, advert_date_added, last_price, first_seen, last_seen)
+        SELECT url, id, date_added, price, date_created, date_created
+        FROM adverts WHERE query_id = ANY(:ids)
+        ON CONFLICT (url) DO NOTHING
+    """), {"ids": list(query_id_of.values())})
+    db.execute(text("""
+        INSERT INTO advert_queries (identity_id, query_id, first_seen)
+        SELECT advert_identities.id, adverts.query_id, adverts.date_created
+        FROM adverts
+        JOIN advert_identities
+            ON advert_identities.advert_id = adverts.id
+            AND advert_identities.advert_date_added = adverts.date_added
+        WHERE adverts.query_id = ANY(:ids)
+        ON CONFLICT DO NOTHING
+    """), {"ids": list(query_id_of.values())})
+
+    # The catalog and revisions are what the worker would have written
+    db.execute(text("""
+        UPDATE queries SET
+            advert_count = catalog.advert_count,
+            first_seen = catalog.first_seen,
+            last_seen = catalog.last_seen,
+            last_scraped_at = catalog.last_seen
+        FROM (
+            SELECT query_id, count(*) AS advert_count,
+                   min(date_added) AS first_seen, max(date_added) AS last_seen
+            FROM adverts WHERE query_id = ANY(:ids) GROUP BY query_id
+        ) AS catalog
+        WHERE queries.id = catalog.query_id
+    """), {"ids": list(query_id_of.values())})
+    db.execute(
+        update(models.SearchQuery).where(
+            models.SearchQuery.id.in_(query_id_of.values())
+        ).values(revision=models.SearchQuery.revision + 1)
+    )
+    db.execute(text("ANALYZE adverts"))
+    db.commit()
+    db.close()
+
+    print(f"Seeded {args.rows} adverts in {time.perf_counter() - started:.1f}s")
+    print(f"Queries: {', '.join(queries[:5])}{' ...' if len(queries) > 5 else ''}")
+    print(f"Date range: {start:%Y-%m-%d} - {end:%Y-%m-%d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+
+    main(parser.parse_args())
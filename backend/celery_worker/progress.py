@@ -0,0 +1,127 @@
+import os
+import time
+import uuid
+from typing import Dict
+
+from redis import Redis, RedisError
+
+PROGRESS_REDIS_URL = os.getenv("PROGRESS_REDIS_URL") or os.getenv("BACKEND_URL")
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL") or 24 * 3600)
+
+JOB_KEY = "job:{job_id}"
+JOB_CHANNEL = "job:{job_id}:events"
+
+# Counters of a job, stored as fields of its Redis hash next to `status` and `updated_at`
+JOB_COUNTERS = ("tasks_total", "tasks_done", "tasks_failed", "pages_fetched", "rows_parsed", "rows_written")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_FINISHED = (JOB_DONE, JOB_FAILED)
+
+progress_redis = Redis.from_url(PROGRESS_REDIS_URL) if PROGRESS_REDIS_URL else None
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _publish(job_id: str, mapping: Dict[str, str | int], increments: Dict[str, int] | None = None) -> Dict[str, int]:
+    """
+    Updates the hash of a job and notifies the subscribers of its channel.
+
+    Progress is best effort: a failing Redis never fails the job itself.
+
+    :returns: The counters after the increments
+    :rtype: Dict[str, int]
+    """
+    if progress_redis is None:
+        return {}
+
+    key = JOB_KEY.format(job_id=job_id)
+    try:
+        pipeline = progress_redis.pipeline()
+        for field, amount in (increments or {}).items():
+            pipeline.hincrby(key, field, amount)
+        pipeline.hset(key, mapping={**mapping, "updated_at": time.time()})
+        pipeline.expire(key, PROGRESS_TTL)
+        pipeline.hmget(key, *JOB_COUNTERS)
+        pipeline.publish(JOB_CHANNEL.format(job_id=job_id), "")
+        counters = pipeline.execute()[-2]
+    except RedisError:
+        return {}
+
+    return {field: int(value or 0) for field, value in zip(JOB_COUNTERS, counters)}
+
+
+def start_job(job_id: str, tasks: int):
+    """
+    Registers a new job whose tasks are queued.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :param tasks: The number of parse and save chains of the job
+    :type tasks: int
+    """
+    _publish(job_id, {
+        "status": JOB_QUEUED,
+        **{counter: 0 for counter in JOB_COUNTERS},
+        "tasks_total": tasks,
+    })
+
+
+def page_fetched(job_id: str, adverts: int):
+    """
+    Records a fetched page of a job.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :param adverts: The number of adverts parsed from the page
+    :type adverts: int
+    """
+    _publish(job_id, {"status": JOB_RUNNING}, {"pages_fetched": 1, "rows_parsed": adverts})
+
+
+def task_finished(job_id: str, rows_written: int = 0, failed: bool = False):
+    """
+    Records a finished parse and save chain of a job, the job is finished with its last chain.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :param rows_written: The number of adverts stored by the chain
+    :type rows_written: int
+
+    :param failed: Whether the chain failed
+    :type failed: bool
+    """
+    increments = {"rows_written": rows_written, "tasks_failed" if failed else "tasks_done": 1}
+    counters = _publish(job_id, {"status": JOB_RUNNING}, increments)
+
+    if counters and counters["tasks_done"] + counters["tasks_failed"] >= counters["tasks_total"]:
+        status = JOB_FAILED if counters["tasks_failed"] == counters["tasks_total"] else JOB_DONE
+        _publish(job_id, {"status": status})
+
+
+def parse_progress(raw: Dict[bytes, bytes]) -> Dict[str, str | int | float] | None:
+    """
+    Converts the Redis hash of a job into its progress.
+
+    :param raw: The hash as returned by HGETALL
+    :type raw: Dict[bytes, bytes]
+
+    :returns: The status, the counters and the update time of the job, None for an unknown job
+    :rtype: Dict[str, str | int | float] | None
+    """
+    if not raw:
+        return None
+
+    progress = {key.decode(): value.decode() for key, value in raw.items()}
+    for counter in JOB_COUNTERS:
+        progress[counter] = int(progress.get(counter) or 0)
+    progress["updated_at"] = float(progress.get("updated_at") or 0)
+
+    return progress
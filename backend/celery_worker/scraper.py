@@ -2,7 +2,7 @@ import os
 import re
 
 from dateparser import parse
-from typing import List
+from typing import Callable, List, Tuple
 
 from dotenv import load_dotenv
 
@@ -10,11 +10,23 @@ import requests
 from urllib.parse import urlencode, urlunparse
 from bs4 import BeautifulSoup, Tag
 
+from api.cache import TTLCache
+
 load_dotenv()
 
 MAIN_URL = str(os.getenv("MAIN_URL")) or None
 PARSER = str(os.getenv("PARSER")) or None
 REGEX_PATTERN = r"^(\d{1,3}(?: \d{3})*) .*$"
+CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL") or 3600)
+CATEGORY_CACHE_MAX_ENTRIES = int(os.getenv("CATEGORY_CACHE_MAX_ENTRIES") or 1024)
+
+# Shared by every scrape of the worker process, so connections to OLX are reused
+session = requests.Session()
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# The biggest category of a search url, see `find_category`. Every query and price range
+# is a url of its own, so the least recently used ones are evicted
+_category_cache = TTLCache(CATEGORY_CACHE_MAX_ENTRIES, CATEGORY_CACHE_TTL)
 
 
 def parse_one_page(url: str, find_category: bool):
@@ -28,7 +40,7 @@ def parse_one_page(url: str, find_category: bool):
     :rtype: tuple(list(bs4.Taf), str)
     """
 
-    response = requests.get(
+    response = session.get(
         url=url,
     )
 
@@ -156,12 +168,36 @@ def parse_advertisement(advert_card: Tag) -> dict:
     return advert_info
 
 
+def find_category(url: str) -> Tuple[str, str]:
+    """
+    Finds the category with the most advertisements of a search, the result is cached
+    for `CATEGORY_CACHE_TTL` seconds, so searches repeated by a batch skip the lookup.
+
+    :param url: The url of the first page of the search
+    :type url: str
+
+    :returns: The title of the category and the href of its first page
+    :rtype: tuple(str, str)
+
+    :raises AttributeError: If the page has no categories
+    """
+    cached = _category_cache.get(url)
+    if cached is not None:
+        return cached
+
+    _, category = parse_one_page(url=url, find_category=True)
+    _category_cache.set(url, category)
+
+    return category
+
+
 def parse_full_request(
         netloc: str,
         query: str,
         limit: int = 1,
         price_from: float = .0,
-        price_to: float = .0
+        price_to: float = .0,
+        on_page: Callable[[int], None] | None = None
 ) -> List[dict]:
     """
     Retrieves a list of advertisements from OLX based on the specified query and filters.
@@ -182,6 +218,9 @@ def parse_full_request(
     :param price_to: The maximum price filter for the advertisements. Defaults to 0.0.
     :type price_to: float
 
+    :param on_page: Called with the number of advertisements of every fetched page, if set.
+    :type on_page: Callable[[int], None] | None
+
     :returns: A list of dictionaries, where each dictionary contains information about
     a single advertisement retrieved from the OLX site, including details such as the title,
     URL, price, location, query, and date added.
@@ -200,25 +239,30 @@ def parse_full_request(
     next_page = urlunparse((scheme, netloc, path, '', query_string, ''))
 
     count = 0
-    find_category = True
     global_tag = ''
 
+    if limit > count:
+        try:
+            global_tag, next_page = find_category(next_page)
+            next_page = f"{scheme}://" + MAIN_URL + next_page
+        except AttributeError:
+            print("Max page retrieved!")
+            next_page = None
+
+        # The category lookup counts as the first page, like it always has
+        count += 1
+
     while next_page and limit > count:
         try:
             all_ads, next_page = parse_one_page(
                 url=next_page,
-                find_category=find_category
+                find_category=False
             )
         except AttributeError:
             print("Max page retrieved!")
             break
 
-        if isinstance(next_page, tuple):
-            tag, next_page = next_page
-            global_tag = tag
-            next_page = f"{scheme}://" + MAIN_URL + next_page
-        else:
-            next_page = f"{scheme}://" + MAIN_URL + next_page
+        next_page = f"{scheme}://" + MAIN_URL + next_page
 
         if all_ads:
             for advert in all_ads:
@@ -227,9 +271,9 @@ def parse_full_request(
                 advert_data["tag"] = global_tag
                 advertisements.append(advert_data)
 
-        count += 1
+        if on_page:
+            on_page(len(all_ads))
 
-        if count >= 1:
-            find_category = False
+        count += 1
 
     return advertisements
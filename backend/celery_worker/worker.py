@@ -1,20 +1,32 @@
 import os
 import sys
+from datetime import datetime, timedelta
 from typing import List
 
 # from dotenv import load_dotenv
-from celery import Celery
-from sqlalchemy.exc import OperationalError
+from celery import Celery, group
+from redis import Redis
+from sqlalchemy.exc import OperationalError, IntegrityError
 
 from celery_worker.scraper import parse_full_request
-from db.crud import create_advert
+from celery_worker.progress import new_job_id, start_job, page_fetched, task_finished
+from db.crud import save_adverts, update_price_stats, update_query_catalog
 from db.schemas import AdvertisementCreate
 from db.database import SessionLocal
+from db.partitions import ensure_partitions, ensure_future_partitions, drop_partitions_before
+from db.dimensions import query_ids, tag_ids, place_ids
+from db.archive import archive_adverts_before, ARCHIVE_AFTER_DAYS
 
 
 BROKER_URL = os.getenv("BROKER_URL")
 MAIN_URL = os.getenv("MAIN_URL")
 BACKEND_URL = os.getenv("BACKEND_URL")
+ADVERTS_RETENTION_DAYS = int(os.getenv("ADVERTS_RETENTION_DAYS") or 0)
+ADMISSION_REDIS_URL = os.getenv("ADMISSION_REDIS_URL")
+
+# Interactive jobs go to the default queue, big ones to a queue with its own worker
+INTERACTIVE_QUEUE = "celery"
+BULK_QUEUE = "bulk"
 
 if not BROKER_URL:
     print("Error: You have to set `BROKER_URL` in environment variables")
@@ -26,14 +38,93 @@ celery_app = Celery(
     backend=BACKEND_URL,
 )
 
+admission_redis = Redis.from_url(ADMISSION_REDIS_URL) if ADMISSION_REDIS_URL else None
 
-def get_and_save_date(
+# Releases a cost without going below zero, an expired counter is not brought back
+RELEASE_ADMISSION_SCRIPT = """
+local pending = tonumber(redis.call('GET', KEYS[1]))
+if not pending then
+    return 0
+end
+local left = math.max(pending - tonumber(ARGV[1]), 0)
+redis.call('SET', KEYS[1], left, 'KEEPTTL')
+return left
+"""
+release_admission_script = admission_redis.register_script(RELEASE_ADMISSION_SCRIPT) if admission_redis else None
+
+celery_app.conf.beat_schedule = {
+    "maintain-adverts-partitions": {
+        "task": "maintain_partitions",
+        "schedule": timedelta(hours=12),
+    },
+    "archive-old-adverts": {
+        "task": "archive_adverts",
+        "schedule": timedelta(days=1),
+    },
+}
+
+
+def scrape_chain(
         query: str,
         limit: int,
         price_from: float,
         price_to: float,
-
+        queue: str = INTERACTIVE_QUEUE,
+        pending_key: str | None = None,
+        job_id: str | None = None
 ):
+    """
+    Builds the parse and save chain of one user request.
+
+    :param query: The query string to use when parsing advertisements
+    :type query: str
+
+    :param limit: The maximum number of pages to parse
+    :type limit: int
+
+    :param price_from: The minimum price of the advertisements to parse
+    :type price_from: float
+
+    :param price_to: The maximum price of the advertisements to parse
+    :type price_to: float
+
+    :param queue: The queue the tasks are sent to
+    :type queue: str
+
+    :param pending_key: The Redis key counting the pending cost of the user, released once
+                        the chain is done or failed, if admission control is enabled
+    :type pending_key: str | None
+
+    :param job_id: The id of the job the chain reports its progress to, if any
+    :type job_id: str | None
+
+    :returns: The chain of tasks
+    :rtype: celery.canvas.Signature
+    """
+    chain = (
+        parse_full_user_request.s(query, limit, price_from, price_to, job_id=job_id).set(queue=queue)
+        | fill_adverts_db.s(query=query, job_id=job_id).set(queue=queue)
+    )
+
+    if job_id:
+        chain.on_error(fail_job_task.si(job_id).set(queue=queue))
+
+    if pending_key:
+        release = release_admission.si(pending_key, max(limit, 1)).set(queue=queue)
+        chain.on_error(release)
+        chain = chain | release
+
+    return chain
+
+
+def get_and_save_date(
+        query: str,
+        limit: int,
+        price_from: float,
+        price_to: float,
+        queue: str = INTERACTIVE_QUEUE,
+        pending_key: str | None = None
+) -> str:
     """
     Initiates the process to parse and save advertisement data based on user-defined criteria.
 
@@ -48,9 +139,58 @@ def get_and_save_date(
 
     :param price_to: The maximum price of the advertisements to parse
     :type price_to: float
+
+    :param queue: The queue the tasks are sent to
+    :type queue: str
+
+    :param pending_key: The Redis key counting the pending cost of the user, if any
+    :type pending_key: str | None
+
+    :returns: The id of the job, see `celery_worker.progress`
+    :rtype: str
     """
-    chain = parse_full_user_request.s(query, limit, price_from, price_to) | fill_adverts_db.s()
-    chain()
+    job_id = new_job_id()
+    start_job(job_id, tasks=1)
+
+    scrape_chain(query, limit, price_from, price_to, queue, pending_key, job_id).apply_async()
+
+    return job_id
+
+
+def get_and_save_batch(
+        specs: List[dict],
+        queue: str = INTERACTIVE_QUEUE,
+        pending_key: str | None = None
+) -> str:
+    """
+    Initiates the parsing and saving of several user requests as one grouped job.
+
+    Every spec becomes its own parse and save chain, the chains share the HTTP session
+    and the category lookups of the worker processes they run in.
+
+    :param specs: The requests to parse, with the keys of `get_and_save_date` arguments
+    :type specs: List[dict]
+
+    :param queue: The queue the tasks are sent to
+    :type queue: str
+
+    :param pending_key: The Redis key counting the pending cost of the user, if any
+    :type pending_key: str | None
+
+    :returns: The id of the job grouping the chains, see `celery_worker.progress`
+    :rtype: str
+    """
+    job_id = new_job_id()
+    start_job(job_id, tasks=len(specs))
+
+    group(
+        scrape_chain(
+            spec["query"], spec["limit"], spec["price_from"], spec["price_to"], queue, pending_key, job_id
+        )
+        for spec in specs
+    ).apply_async()
+
+    return job_id
 
 
 @celery_app.task(name="parse_data")
@@ -58,7 +198,8 @@ def parse_full_user_request(
         query: str,
         limit: int,
         price_from: float = .0,
-        price_to: float = .0
+        price_to: float = .0,
+        job_id: str | None = None
 ) -> List[dict]:
     """
     Celery task to parse advertisements data based on user criteria.
@@ -75,6 +216,9 @@ def parse_full_user_request(
     :param price_to: The maximum price of the advertisements to parse, defaults to .0
     :type price_to: float, optional
 
+    :param job_id: The id of the job to report fetched pages to, if any
+    :type job_id: str | None
+
     :returns: A list of parsed advertisements as dictionaries
     :rtype: List[dict]
     """
@@ -84,7 +228,8 @@ def parse_full_user_request(
         query=query,
         limit=limit,
         price_from=price_from,
-        price_to=price_to
+        price_to=price_to,
+        on_page=(lambda adverts: page_fetched(job_id, adverts)) if job_id else None
     )
 
     return parsed_adverts
@@ -93,23 +238,48 @@ def parse_full_user_request(
 @celery_app.task(name="fill_db", ignore_result=True)
 def fill_adverts_db(
         result,
+        query: str | None = None,
+        job_id: str | None = None
 ):
     """
     Celery task to fill the database with parsed advertisement data.
 
+    Known adverts are not stored again, only their price changes are recorded.
+    The price rollup is updated incrementally with the newly stored adverts
+    within the same transaction, as is the query catalog.
+
     :param result: The list of parsed advertisements as dictionaries to save to the database
     :type result: list of dictionaries
 
+    :param query: The query the advertisements were parsed for, marked as scraped even without results
+    :type query: str | None
+
+    :param job_id: The id of the job to report written rows to, if any
+    :type job_id: str | None
+
     :raises OperationalError: If there is an error during database operations
     """
 
     db = SessionLocal()
+    created = []
+    failed = False
+
+    for advert in result:
+        if advert["date_added"] is None:
+            advert["date_added"] = datetime.now()
 
     try:
-        for advert in result:
-            create_advert(
-                db=db,
-                advert=AdvertisementCreate(
+        ensure_partitions(db, [advert["date_added"] for advert in result])
+
+        # Resolve the dimension values of the whole batch up front
+        query_ids.resolve_many(db, [advert["query"] for advert in result])
+        tag_ids.resolve_many(db, [advert["tag"] for advert in result])
+        place_ids.resolve_many(db, [advert["place"] for advert in result])
+
+        created, found = save_adverts(
+            db=db,
+            adverts=[
+                AdvertisementCreate(
                     title=advert["title"],
                     url=advert["url"],
                     price=advert["price"],
@@ -118,10 +288,115 @@ def fill_adverts_db(
                     query=advert["query"],
                     date_added=advert["date_added"]
                 )
-            )
+                for advert in result
+            ]
+        )
 
-    except OperationalError as err:
+        update_price_stats(db, created)
+        update_query_catalog(
+            db,
+            [advert["query"] for advert in result] + ([query] if query is not None else []),
+            found
+        )
+
+        db.commit()
+    except (OperationalError, IntegrityError) as err:
+        # A partition archived or dropped meanwhile fails the insert with an IntegrityError
+        failed = True
+        # Nothing of the batch was committed, progress must not count its rows as written
+        created = []
+        # Committing an aborted transaction would look like a success to the session
+        db.rollback()
         print(f"Error happened while saving data! Error info: {err}")
     finally:
+        db.close()
+
+    if job_id:
+        task_finished(job_id, rows_written=len(created), failed=failed)
+
+
+@celery_app.task(name="fail_job_task", ignore_result=True)
+def fail_job_task(job_id: str):
+    """
+    Celery task recording a failed parse and save chain of a job.
+
+    :param job_id: The id of the job
+    :type job_id: str
+    """
+    task_finished(job_id, failed=True)
+
+
+@celery_app.task(name="release_admission", ignore_result=True)
+def release_admission(pending_key: str, cost: int):
+    """
+    Celery task to release the cost of a finished or failed job from the pending cost of its user.
+
+    The pending cost never goes below zero, a counter which expired while the job
+    was running is left alone, so the user does not get extra budget.
+
+    :param pending_key: The Redis key counting the pending cost of the user
+    :type pending_key: str
+
+    :param cost: The cost of the job
+    :type cost: int
+    """
+    if release_admission_script is not None:
+        release_admission_script(keys=[pending_key], args=[cost])
+
+
+@celery_app.task(name="maintain_partitions", ignore_result=True)
+def maintain_adverts_partitions():
+    """
+    Celery beat task to keep the partitions of the adverts table in shape.
+
+    It creates partitions ahead of time for upcoming months and, if `ADVERTS_RETENTION_DAYS`
+    is set, drops the partitions which only hold adverts older than the retention period.
+
+    :raises OperationalError: If there is an error during database operations
+    """
+
+    db = SessionLocal()
+
+    try:
+        ensure_future_partitions(db)
+
+        if ADVERTS_RETENTION_DAYS:
+            dropped = drop_partitions_before(
+                db, datetime.now() - timedelta(days=ADVERTS_RETENTION_DAYS)
+            )
+            if dropped:
+                print(f"Dropped expired partitions: {', '.join(dropped)}")
+
         db.commit()
+    except OperationalError as err:
+        # Committing an aborted transaction would look like a success to the session
+        db.rollback()
+        print(f"Error happened while maintaining partitions! Error info: {err}")
+    finally:
+        db.close()
+
+
+@celery_app.task(name="archive_adverts", ignore_result=True)
+def archive_old_adverts():
+    """
+    Celery beat task to move adverts older than `ARCHIVE_AFTER_DAYS` days to the Parquet archive.
+
+    Whole partitions are exported and then dropped, so Postgres never runs a bulk DELETE.
+    The task does nothing when `ARCHIVE_AFTER_DAYS` is not set.
+
+    :raises OperationalError: If there is an error during database operations
+    """
+    if not ARCHIVE_AFTER_DAYS:
+        return
+
+    db = SessionLocal()
+
+    try:
+        archived = archive_adverts_before(db, datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS))
+        if archived:
+            print(f"Archived {archived} adverts")
+
+    except OperationalError as err:
+        print(f"Error happened while archiving adverts! Error info: {err}")
+    finally:
         db.close()
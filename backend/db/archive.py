@@ -0,0 +1,365 @@
+import os
+from glob import glob
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import quote
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import Session
+
+from db.models import Advertisement, AdvertIdentity, AdvertQuery, SearchQuery
+from db.schemas import AdvertSort
+from db.partitions import list_partitions, forget_partition
+
+# Must be shared by the API and the worker archiving adverts, see the `archive` volume
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or "/var/lib/olx_parser/archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS") or 0)
+ARCHIVE_BATCH_SIZE = 50000
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("title", pa.string()),
+    ("url", pa.string()),
+    ("price", pa.int32()),
+    ("place", pa.string()),
+    ("query", pa.string()),
+    ("date_added", pa.timestamp("us")),
+    ("tags", pa.string()),
+    # Every query which found the advert, `query` is the one which found it first
+    ("queries", pa.list_(pa.string())),
+])
+
+
+def _month_dir(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"month={month}")
+
+
+def archive_partition(db: Session, name: str, lower_bound: datetime, upper_bound: datetime) -> int:
+    """
+    Exports one partition of the adverts table to Parquet files and drops it.
+
+    Files are laid out as `month=YYYY-MM/query_key=<query>/<partition>_<first id>_<last id>.parquet`
+    under `ARCHIVE_DIR`, by the query which found the advert first, the others are kept in `queries`. Re-running an interrupted export overwrites the same files, while a
+    partition created again for late adverts and archived later gets files of its own.
+    The revisions of the queries which found the archived adverts are bumped, so cached responses are not served.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param name: The name of the partition
+    :type name: str
+
+    :param lower_bound: The inclusive lower bound of the partition
+    :type lower_bound: datetime
+
+    :param upper_bound: The exclusive upper bound of the partition
+    :type upper_bound: datetime
+
+    :returns: The number of archived adverts
+    :rtype: int
+    """
+    # Imported here, crud reads the archive and would be a circular import
+    from db.crud import select_adverts, bump_query_revisions
+
+    # Ids only grow, rows stored after an earlier export of this partition get other bounds
+    first_id, last_id = db.execute(text(f"SELECT min(id), max(id) FROM {name}")).one()
+    query_ids = db.execute(text(f"""
+        SELECT query_id FROM {name}
+        UNION
+        SELECT advert_queries.query_id FROM {name}
+        JOIN advert_identities
+            ON advert_identities.advert_id = {name}.id
+            AND advert_identities.advert_date_added = {name}.date_added
+        JOIN advert_queries ON advert_queries.identity_id = advert_identities.id
+    """)).scalars().all()
+
+    queries = select(
+        func.array_agg(SearchQuery.name)
+    ).select_from(AdvertQuery).join(
+        SearchQuery, AdvertQuery.query_id == SearchQuery.id
+    ).join(
+        AdvertIdentity, AdvertQuery.identity_id == AdvertIdentity.id
+    ).where(
+        AdvertIdentity.advert_id == Advertisement.id
+    ).where(
+        AdvertIdentity.advert_date_added == Advertisement.date_added
+    ).scalar_subquery()
+
+    stmt = select_adverts().add_columns(queries.label("queries")).where(
+        Advertisement.date_added >= lower_bound
+    ).where(
+        Advertisement.date_added < upper_bound
+    ).execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+
+    writers: Dict[Tuple[str, str], Tuple[pq.ParquetWriter, str]] = {}
+    archived = 0
+
+    try:
+        for chunk in db.execute(stmt).mappings().partitions():
+            groups: Dict[Tuple[str, str], List[dict]] = {}
+            for row in chunk:
+                key = (f"{row['date_added']:%Y-%m}", row["query"])
+                groups.setdefault(key, []).append(
+                    {column: row[column] for column in ARCHIVE_SCHEMA.names}
+                )
+
+            for key, rows in groups.items():
+                if key not in writers:
+                    month, query = key
+                    directory = os.path.join(_month_dir(month), f"query_key={quote(query, safe='')}")
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(directory, f"{name}_{first_id}_{last_id}.parquet")
+                    writers[key] = (
+                        pq.ParquetWriter(f"{path}.tmp", ARCHIVE_SCHEMA, compression="zstd"),
+                        path,
+                    )
+                writers[key][0].write_table(pa.Table.from_pylist(rows, schema=ARCHIVE_SCHEMA))
+
+            archived += len(chunk)
+    finally:
+        for writer, _ in writers.values():
+            writer.close()
+
+    # Files only get their final name once complete, readers never see partial files
+    for _, path in writers.values():
+        os.replace(f"{path}.tmp", path)
+
+    db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    bump_query_revisions(db, query_ids)
+    db.commit()
+    forget_partition(name)
+
+    return archived
+
+
+def archive_adverts_before(db: Session, cutoff: date | datetime) -> int:
+    """
+    Moves every adverts partition that only holds rows older than the cutoff to the archive.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param cutoff: Partitions whose upper bound is not after this moment are archived
+    :type cutoff: date | datetime
+
+    :returns: The number of archived adverts
+    :rtype: int
+    """
+    if not isinstance(cutoff, datetime):
+        cutoff = datetime(cutoff.year, cutoff.month, cutoff.day)
+
+    archived = 0
+    for name, lower_bound, upper_bound in list_partitions(db):
+        if upper_bound <= cutoff:
+            archived += archive_partition(db, name, lower_bound, upper_bound)
+
+    return archived
+
+
+def archived_files(start_date: date, end_date: date) -> List[str]:
+    """
+    Lists the archive files of the months overlapping the date range.
+
+    :param start_date: The start date of the range
+    :type start_date: date
+
+    :param end_date: The end date of the range
+    :type end_date: date
+
+    :returns: Paths of the Parquet files, empty if nothing is archived for the range
+    :rtype: List[str]
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+
+    first_month, last_month = f"{start_date:%Y-%m}", f"{end_date:%Y-%m}"
+    files = []
+
+    for entry in sorted(os.listdir(ARCHIVE_DIR)):
+        if not entry.startswith("month="):
+            continue
+        if first_month <= entry.removeprefix("month=") <= last_month:
+            files.extend(glob(os.path.join(ARCHIVE_DIR, entry, "*", "*.parquet")))
+
+    return files
+
+
+def _archived_adverts_sql(
+        files: List[str],
+        query: str,
+        start_date: date,
+        end_date: date,
+        limit: int | None = None,
+        after: Tuple[datetime | int, int] | None = None,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None,
+        sort: AdvertSort = AdvertSort.date
+) -> Tuple[str, list]:
+    source = "read_parquet(?, hive_partitioning = false, union_by_name = true)"
+    params = [files]
+
+    if query != "all":
+        # Like the live adverts, an advert is read under the first matching query which found it
+        source = (
+            "(SELECT * REPLACE (coalesce("
+            "(SELECT min(name) FROM unnest(queries) AS found(name) WHERE name ILIKE ?), query"
+            f") AS query) FROM {source})"
+        )
+        params.insert(0, f"%{query}%")
+
+    sql = (
+        # The times adverts were stored and last changed are not archived
+        "SELECT id, title, url, price, place, query, date_added, tags, "
+        "CAST(NULL AS TIMESTAMP) AS date_created, CAST(NULL AS TIMESTAMP) AS modified_at "
+        f"FROM {source} "
+        "WHERE date_added > ? AND date_added <= ?"
+    )
+    params.extend([start_date, end_date])
+
+    if query == "all":
+        sql += " AND price IS NOT NULL"
+    else:
+        sql += " AND query ILIKE ?"
+        params.append(f"%{query}%")
+
+    if price_from is not None:
+        sql += " AND price >= ?"
+        params.append(price_from)
+
+    if price_to is not None:
+        sql += " AND price <= ?"
+        params.append(price_to)
+
+    if tags is not None:
+        sql += " AND tags = ?"
+        params.append(tags)
+
+    if place is not None:
+        sql += " AND place = ?"
+        params.append(place)
+
+    sort_column = "price" if sort == AdvertSort.price else "date_added"
+
+    if sort == AdvertSort.price:
+        sql += " AND price IS NOT NULL"
+
+    if after:
+        sql += f" AND ({sort_column} > ? OR ({sort_column} = ? AND id > ?))"
+        params.extend([after[0], after[0], after[1]])
+
+    sql += f" ORDER BY {sort_column}, id"
+
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    return sql, params
+
+
+def read_archived_adverts(
+        query: str,
+        start_date: date,
+        end_date: date,
+        limit: int | None = None,
+        after: Tuple[datetime | int, int] | None = None,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None,
+        sort: AdvertSort = AdvertSort.date
+) -> List[dict]:
+    """
+    Reads archived adverts with the same filters `crud.get_adverts` applies to the live table.
+
+    Only the month directories overlapping the date range are scanned. Adverts are
+    ordered by (date_added, id) or (price, id), like the live ones, to support keyset pagination.
+
+    :param query: The query string used to filter adverts, "all" matches every advert with a price
+    :type query: str
+
+    :param start_date: The start date of the date range
+    :type start_date: date
+
+    :param end_date: The end date of the date range
+    :type end_date: date
+
+    :param limit: The maximum number of adverts to read, unlimited if not set
+    :type limit: int | None
+
+    :param after: The (date_added, id) or (price, id) keyset to read adverts after, if any
+    :type after: Tuple[datetime | int, int] | None
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param sort: The order of the adverts, adverts without a price are skipped when sorting by price
+    :type sort: AdvertSort
+
+    :returns: The archived adverts as dictionaries shaped like `schemas.Advertisement`
+    :rtype: List[dict]
+    """
+    files = archived_files(start_date, end_date)
+    if not files:
+        return []
+
+    sql, params = _archived_adverts_sql(
+        files, query, start_date, end_date, limit, after,
+        price_from=price_from, price_to=price_to, tags=tags, place=place, sort=sort
+    )
+
+    with duckdb.connect() as connection:
+        cursor = connection.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def iter_archived_adverts(
+        query: str,
+        start_date: date,
+        end_date: date,
+        batch_size: int = ARCHIVE_BATCH_SIZE
+) -> Iterator[List[dict]]:
+    """
+    Reads archived adverts like `read_archived_adverts`, batch by batch.
+
+    :param query: The query string used to filter adverts, "all" matches every advert with a price
+    :type query: str
+
+    :param start_date: The start date of the date range
+    :type start_date: date
+
+    :param end_date: The end date of the date range
+    :type end_date: date
+
+    :param batch_size: The maximum number of adverts per batch
+    :type batch_size: int
+
+    :returns: An iterator over batches of adverts as dictionaries
+    :rtype: Iterator[List[dict]]
+    """
+    files = archived_files(start_date, end_date)
+    if not files:
+        return
+
+    sql, params = _archived_adverts_sql(files, query, start_date, end_date)
+
+    with duckdb.connect() as connection:
+        cursor = connection.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+
+        while batch := cursor.fetchmany(batch_size):
+            yield [dict(zip(columns, row)) for row in batch]
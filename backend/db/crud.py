@@ -1,11 +1,38 @@
-from datetime import date, datetime
+import asyncio
+import calendar
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Iterable, List, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, func, case, extract, literal, literal_column, and_, or_, true, tuple_
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.dialects.postgresql import insert as psql_upsert
-from db.models import Advertisement
-from db.schemas import AdvertisementCreate
+from db.models import (
+    FTS_CONFIG,
+    Advertisement,
+    AdvertIdentity,
+    AdvertPriceHistory,
+    AdvertPriceStats,
+    AdvertQuery,
+    SearchQuery,
+    Tag,
+    Place,
+)
+from db.schemas import (
+    AdvertisementCreate,
+    AdvertSort,
+    AdvertPriceStats as AdvertPriceStatsSchema,
+    AdvertPriceHistory as AdvertPriceHistorySchema,
+    PricePoint,
+)
+from db.dimensions import query_ids, tag_ids, place_ids
+from db.archive import read_archived_adverts, iter_archived_adverts
+from db.sketch import empty_sketch, add_to_sketch, sketch_bucket, sketch_percentile
+
+STREAM_BATCH_SIZE = 2000
 
 
 def create_advert(
@@ -24,15 +51,18 @@ def create_advert(
 
     :param advert: The advert object containing the details to be added or updated in the database
     :type advert: AdvertisementCreate
+
+    :return: The advert added to the session
+    :rtype: Advertisement
     """
     db_advert = Advertisement(
         title=advert.title,
         url=advert.url,
-        place=advert.place,
+        place_id=place_ids.resolve(db, advert.place),
         price=advert.price,
-        query=advert.query,
+        query_id=query_ids.resolve(db, advert.query),
         date_added=advert.date_added,
-        tags=advert.tags
+        tag_id=tag_ids.resolve(db, advert.tags)
     )
 
     # stmt = psql_upsert(Advertisement).values(db_advert.to_dict()).on_conflict_do_update(
@@ -42,23 +72,363 @@ def create_advert(
     # db.execute(stmt)
     db.add(db_advert)
 
+    return db_advert
 
-def get_adverts(
+
+def save_adverts(
         db: Session,
-        query: str,
-        start_date: date,
-        end_date: date
+        adverts: List[AdvertisementCreate]
+) -> Tuple[List[Advertisement], List[Tuple[int, datetime]]]:
+    """
+    Saves a batch of scraped adverts, storing every advert only once.
+
+    Adverts are identified by their url. A new url creates the advert row, its identity
+    and the first price history entry. A known url only refreshes `last_seen`, and
+    appends to the price history (updating the stored price and the price rollup) when
+    the price has changed. A known url whose row was archived or dropped with its
+    partition is stored as a new row again and its identity points to it.
+    The row keeps the query which found the url first, every query which found it
+    is recorded in `advert_queries`, so each of them returns the advert.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param adverts: The scraped adverts of the batch
+    :type adverts: List[AdvertisementCreate]
+
+    :return: The adverts which were created by this batch, including the stored again ones,
+             and the (query id, date_added) of every advert a query found for the first time
+    :rtype: Tuple[List[Advertisement], List[Tuple[int, datetime]]]
+    """
+    now = datetime.now()
+    batch = {advert.url: advert for advert in adverts if advert.url}
+
+    if not batch:
+        return [], []
+
+    identities = {
+        identity.url: identity
+        for identity in db.execute(
+            select(AdvertIdentity).where(AdvertIdentity.url.in_(batch))
+        ).scalars()
+    }
+
+    # Identities of archived or dropped partitions point to rows which are gone
+    live = set()
+    if identities:
+        live = {
+            tuple(row) for row in db.execute(
+                select(Advertisement.id, Advertisement.date_added).where(
+                    tuple_(Advertisement.id, Advertisement.date_added).in_(
+                        [(identity.advert_id, identity.advert_date_added) for identity in identities.values()]
+                    )
+                )
+            )
+        }
+
+    created = {}
+    revived = {}
+    history = []
+    repriced = []
+    changed_identities = set()
+    changed_queries = set()
+
+    for url, advert in batch.items():
+        identity = identities.get(url)
+
+        if identity is None:
+            created[url] = create_advert(db=db, advert=advert)
+            continue
+
+        identity.last_seen = now
+        price_changed = identity.last_price != advert.price
+        stored_key = (identity.advert_id, identity.advert_date_added)
+
+        stored = None
+        if price_changed and stored_key in live:
+            stored = db.execute(
+                update(Advertisement).where(
+                    Advertisement.id == identity.advert_id
+                ).where(
+                    Advertisement.date_added == identity.advert_date_added
+                ).values(price=advert.price, modified_at=now).returning(
+                    Advertisement.query_id,
+                    Advertisement.tag_id,
+                    Advertisement.place_id,
+                    Advertisement.date_added,
+                )
+            ).one_or_none()
+
+            if stored is not None:
+                repriced.append((*stored, identity.last_price, advert.price))
+                changed_identities.add(identity.id)
+
+        if stored_key not in live or (price_changed and stored is None):
+            # Its partition was archived or dropped, the advert is stored as a new row
+            revived[url] = create_advert(db=db, advert=advert)
+            changed_identities.add(identity.id)
+
+        if price_changed:
+            identity.last_price = advert.price
+            history.append({"identity_id": identity.id, "price": advert.price, "observed_at": now})
+
+    reprice_price_stats(db, repriced)
+
+    if created or revived:
+        db.flush()
+
+    for url, advert in revived.items():
+        identities[url].advert_id = advert.id
+        identities[url].advert_date_added = advert.date_added
+
+    # Identity id and stored date_added of every url of the batch
+    stored_adverts = {
+        url: (identity.id, identity.advert_date_added) for url, identity in identities.items()
+    }
+
+    if created:
+        # Another worker may have stored the same url meanwhile, its identity wins
+        stored = db.execute(
+            psql_upsert(AdvertIdentity).values([
+                {
+                    "url": url,
+                    "advert_id": advert.id,
+                    "advert_date_added": advert.date_added,
+                    "last_price": advert.price,
+                    "first_seen": now,
+                    "last_seen": now,
+                }
+                for url, advert in created.items()
+            ]).on_conflict_do_nothing(
+                index_elements=["url"]
+            ).returning(AdvertIdentity.id, AdvertIdentity.url)
+        ).all()
+        stored_urls = {url for _, url in stored}
+        stored_adverts.update(
+            (url, (identity_id, created[url].date_added)) for identity_id, url in stored
+        )
+
+        duplicates = [advert for url, advert in created.items() if url not in stored_urls]
+        if duplicates:
+            db.execute(delete(Advertisement).where(
+                tuple_(Advertisement.id, Advertisement.date_added).in_(
+                    [(advert.id, advert.date_added) for advert in duplicates]
+                )
+            ).execution_options(synchronize_session=False))
+
+            # The scraped queries are recorded for the advert stored by the other worker
+            stored_adverts.update(
+                (url, (identity_id, date_added)) for identity_id, url, date_added in db.execute(
+                    select(
+                        AdvertIdentity.id, AdvertIdentity.url, AdvertIdentity.advert_date_added
+                    ).where(AdvertIdentity.url.in_([advert.url for advert in duplicates]))
+                )
+            )
+
+        history.extend(
+            {"identity_id": identity_id, "price": created[url].price, "observed_at": now}
+            for identity_id, url in stored
+        )
+        created = {url: advert for url, advert in created.items() if url in stored_urls}
+
+    if history:
+        db.execute(insert(AdvertPriceHistory), history)
+
+    # Only the pairs not recorded yet are returned, an advert is new to these queries
+    found_pairs = {
+        (stored_adverts[url][0], query_ids.resolve(db, advert.query))
+        for url, advert in batch.items() if url in stored_adverts
+    }
+    found = []
+    if found_pairs:
+        found = db.execute(
+            psql_upsert(AdvertQuery).values([
+                {"identity_id": identity_id, "query_id": query_id, "first_seen": now}
+                for identity_id, query_id in sorted(found_pairs)
+            ]).on_conflict_do_nothing(
+                index_elements=["identity_id", "query_id"]
+            ).returning(AdvertQuery.identity_id, AdvertQuery.query_id)
+        ).all()
+
+    # A repriced or stored again advert changes the results of every query which found it
+    if changed_identities:
+        changed_queries.update(db.execute(
+            select(AdvertQuery.query_id).where(AdvertQuery.identity_id.in_(changed_identities))
+        ).scalars())
+
+    stored_dates = dict(stored_adverts.values())
+    found = [(query_id, stored_dates[identity_id]) for identity_id, query_id in found]
+
+    created.update(revived)
+    changed_queries.update(advert.query_id for advert in created.values())
+    changed_queries.update(query_id for query_id, _ in found)
+    bump_query_revisions(db, changed_queries)
+
+    return list(created.values()), found
+
+
+def update_query_catalog(
+        db: Session,
+        scraped_queries: Iterable[str],
+        found: Iterable[Tuple[int, datetime]]
 ):
+    """
+    Keeps the query catalog up to date after a batch was saved.
+
+    Every scraped query gets its `last_scraped_at` refreshed, the queries which found
+    adverts for the first time get their advert count and first/last seen dates advanced.
 
+    :param db: The database session object
+    :type db: Session
+
+    :param scraped_queries: The queries the batch was scraped for
+    :type scraped_queries: Iterable[str]
+
+    :param found: The (query id, date_added) of the adverts new to a query, as returned by `save_adverts`
+    :type found: Iterable[Tuple[int, datetime]]
     """
-    Retrieves adverts from the database based on the query parameter and date range.
+    now = datetime.now()
+    scraped_ids = set(query_ids.resolve_many(db, scraped_queries).values())
 
-    If query parameter is "all", it retrieves all adverts added within the date range and having a non-null price.
-    Otherwise, it retrieves adverts matching the query parameter and added within the date range.
+    if scraped_ids:
+        db.execute(
+            update(SearchQuery).where(
+                SearchQuery.id.in_(scraped_ids)
+            ).values(last_scraped_at=now)
+        )
+
+    catalog = {}
+    for query_id, date_added in found:
+        count, first_seen, last_seen = catalog.get(query_id, (0, date_added, date_added))
+        catalog[query_id] = (count + 1, min(first_seen, date_added), max(last_seen, date_added))
+
+    for query_id, (count, first_seen, last_seen) in catalog.items():
+        db.execute(
+            update(SearchQuery).where(
+                SearchQuery.id == query_id
+            ).values(
+                advert_count=SearchQuery.advert_count + count,
+                first_seen=func.least(SearchQuery.first_seen, first_seen),
+                last_seen=func.greatest(SearchQuery.last_seen, last_seen),
+            )
+        )
+
+
+def bump_query_revisions(
+        db: Session,
+        changed_query_ids: Iterable[int]
+):
+    """
+    Increments the revision of the queries whose adverts were written.
+
+    Cached API responses are keyed on these revisions, so bumping them
+    invalidates exactly the responses that include the written adverts.
 
     :param db: The database session object
     :type db: Session
 
+    :param changed_query_ids: Ids of the queries with new or changed adverts
+    :type changed_query_ids: Iterable[int]
+    """
+    changed_query_ids = sorted(set(changed_query_ids))
+    if not changed_query_ids:
+        return
+
+    db.execute(
+        update(SearchQuery).where(
+            SearchQuery.id.in_(changed_query_ids)
+        ).values(revision=SearchQuery.revision + 1)
+    )
+
+
+def select_found_adverts(
+        query: str
+):
+    """
+    Builds the subquery of the adverts found by the queries like the query parameter.
+
+    An advert found by several of the matching queries is returned once, with the first
+    of their names in alphabetical order.
+
+    :param query: The query string used to filter adverts based on the queries which found them
+    :type query: str
+
+    :return: The subquery of identity ids and matching query names
+    :rtype: Subquery
+    """
+    return select(
+        AdvertQuery.identity_id,
+        func.min(SearchQuery.name).label("query"),
+    ).join(
+        SearchQuery, AdvertQuery.query_id == SearchQuery.id
+    ).where(
+        SearchQuery.name.ilike(f"%{query}%")
+    ).group_by(
+        AdvertQuery.identity_id
+    ).subquery("found")
+
+
+def select_adverts(
+        query: str = "all"
+):
+    """
+    Builds a select of adverts with the query, tag and place names joined back
+    from their dimension tables, so rows keep the shape of `schemas.Advertisement`.
+
+    With "all", every advert is selected under the query which found it first. Otherwise
+    only the adverts found by a query like the query parameter are, under that query.
+
+    :param query: The query string used to filter adverts based on the queries which found them
+    :type query: str
+
+    :return: The select statement over the joined adverts
+    :rtype: Select
+    """
+    found = None if query == "all" else select_found_adverts(query)
+
+    stmt = select(
+        Advertisement.id,
+        Advertisement.title,
+        Advertisement.url,
+        Advertisement.price,
+        Place.name.label("place"),
+        (SearchQuery.name if found is None else found.c.query).label("query"),
+        Advertisement.date_added,
+        Tag.name.label("tags"),
+        Advertisement.date_created,
+        Advertisement.modified_at,
+    ).select_from(Advertisement)
+
+    if found is None:
+        stmt = stmt.join(SearchQuery, Advertisement.query_id == SearchQuery.id)
+    else:
+        stmt = stmt.join(
+            AdvertIdentity, and_(
+                AdvertIdentity.advert_id == Advertisement.id,
+                AdvertIdentity.advert_date_added == Advertisement.date_added,
+            )
+        ).join(
+            found, found.c.identity_id == AdvertIdentity.id
+        )
+
+    return stmt.outerjoin(
+        Place, Advertisement.place_id == Place.id
+    ).outerjoin(
+        Tag, Advertisement.tag_id == Tag.id
+    )
+
+
+def select_adverts_in_range(
+        query: str,
+        start_date: date,
+        end_date: date
+):
+    """
+    Builds the select of adverts matching the query parameter and date range.
+
+    If query parameter is "all", it matches all adverts added within the date range and having a non-null price.
+    Otherwise, it matches adverts found by the queries like the query parameter and added within the date range.
+
     :param query: The query string used to filter adverts based on their query field
     :type query: str
 
@@ -68,11 +438,11 @@ def get_adverts(
     :param end_date: The end date of the date range within which to filter the adverts
     :type end_date: date
 
-    :return: A list of advert objects matching the criteria
-    :rtype: List[Advertisement]
+    :return: The select statement over the matching adverts
+    :rtype: Select
     """
     if query == "all":
-        stmt = select(Advertisement).where(
+        return select_adverts().where(
             Advertisement.date_added > start_date
         ).where(
             Advertisement.date_added <= end_date
@@ -80,34 +450,905 @@ def get_adverts(
             Advertisement.price != None
         )
 
-    else:
-        stmt = select(Advertisement).where(
-            Advertisement.query.ilike(f"%{query}%")
-        ).where(
-            Advertisement.date_added > start_date
-        ).where(
-            Advertisement.date_added <= end_date
+    return select_adverts(query).where(
+        Advertisement.date_added > start_date
+    ).where(
+        Advertisement.date_added <= end_date
+    )
+
+
+def filter_adverts(
+        stmt,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None
+):
+    """
+    Narrows a select of `select_adverts` down by price range, category and place.
+
+    :param stmt: The select statement over the joined adverts
+    :type stmt: Select
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :return: The filtered select statement
+    :rtype: Select
+    """
+    if price_from is not None:
+        stmt = stmt.where(Advertisement.price >= price_from)
+
+    if price_to is not None:
+        stmt = stmt.where(Advertisement.price <= price_to)
+
+    if tags is not None:
+        stmt = stmt.where(Tag.name == tags)
+
+    if place is not None:
+        stmt = stmt.where(Place.name == place)
+
+    return stmt
+
+
+async def get_adverts(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date,
+        limit: int,
+        after: Tuple[datetime | int, int] | None = None,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None,
+        sort: AdvertSort = AdvertSort.date,
+        since: datetime | None = None
+) -> Tuple[List[dict], Tuple[datetime | int, int] | None]:
+
+    """
+    Retrieves a page of adverts from the database based on the query parameter and date range.
+
+    If query parameter is "all", it retrieves all adverts added within the date range and having a non-null price.
+    Otherwise, it retrieves adverts matching the query parameter and added within the date range.
+    The adverts table is partitioned by `date_added`, so only the partitions overlapping
+    the date range are scanned. Adverts moved to the Parquet archive are read from there.
+    Price range, category and place filters are applied by the database, not after the fetch.
+    With `since`, only adverts stored or changed after that moment are returned, for clients
+    syncing their copy incrementally; archived adverts are older than any such moment and are
+    skipped. `modified_at` is taken before a batch commits, so a batch committing late can carry
+    an earlier stamp than adverts already synced. Clients pass a `since` some time before the
+    highest `modified_at` they have seen and drop the adverts they get twice by url.
+
+    Adverts are ordered by (date_added, id), or by (price, id) skipping adverts without a price,
+    and paginated by keyset: pass the returned keyset as `after` to read the next page.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
+
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param limit: The maximum number of adverts to return
+    :type limit: int
+
+    :param after: The (date_added, id) or (price, id) keyset of the last advert of the previous page
+    :type after: Tuple[datetime | int, int] | None
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :param sort: The order of the adverts, by date added (default) or by price
+    :type sort: AdvertSort
+
+    :param since: Only return adverts with a later `modified_at`, if set
+    :type since: datetime | None
+
+    :return: A page of adverts matching the criteria and the keyset of the next page, if any
+    :rtype: Tuple[List[dict], Tuple[datetime | int, int] | None]
+    """
+    sort_column, sort_key = (
+        (Advertisement.price, "price") if sort == AdvertSort.price
+        else (Advertisement.date_added, "date_added")
+    )
+
+    stmt = filter_adverts(
+        select_adverts_in_range(query, start_date, end_date),
+        price_from=price_from, price_to=price_to, tags=tags, place=place
+    )
+
+    if sort == AdvertSort.price:
+        stmt = stmt.where(Advertisement.price != None)
+
+    if since is not None:
+        stmt = stmt.where(Advertisement.modified_at > since)
+
+    if after:
+        stmt = stmt.where(tuple_(sort_column, Advertisement.id) > tuple_(*after))
+
+    stmt = stmt.order_by(sort_column, Advertisement.id).limit(limit + 1)
+
+    archived = []
+    if since is None:
+        # The archive is read by DuckDB, which blocks, so it runs in a thread
+        archived = await asyncio.to_thread(
+            read_archived_adverts,
+            query=query, start_date=start_date, end_date=end_date, limit=limit + 1, after=after,
+            price_from=price_from, price_to=price_to, tags=tags, place=place, sort=sort
         )
+    live = [row._asdict() for row in (await db.execute(stmt)).all()]
+
+    # Both sources are sorted by the keyset, so merging them keeps the page order
+    data = list(heapq.merge(archived, live, key=lambda advert: (advert[sort_key], advert["id"])))
+
+    if len(data) <= limit:
+        return data, None
+
+    data = data[:limit]
+    return data, (data[-1][sort_key], data[-1]["id"])
+
+
+async def stream_adverts(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date,
+        batch_size: int = STREAM_BATCH_SIZE
+) -> AsyncIterator[List[dict]]:
+    """
+    Streams all adverts matching the query parameter and date range in batches.
+
+    Archived adverts come first, then the live ones are read through a server-side
+    cursor, so memory use does not depend on the size of the result.
+
+    :param db: The database session object, it must stay open while the stream is consumed
+    :type db: AsyncSession
 
-    data = [item[0] for item in db.execute(stmt).all()]
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
 
-    return data
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param batch_size: The number of adverts fetched per round trip
+    :type batch_size: int
+
+    :return: An async iterator over batches of adverts as dictionaries
+    :rtype: AsyncIterator[List[dict]]
+    """
+    archived = iter_archived_adverts(query, start_date, end_date, batch_size)
+
+    try:
+        while batch := await asyncio.to_thread(next, archived, None):
+            yield batch
+    finally:
+        archived.close()
+
+    stmt = select_adverts_in_range(query, start_date, end_date).execution_options(
+        yield_per=batch_size
+    )
+    result = await db.stream(stmt)
 
+    async for partition in result.partitions():
+        yield [row._asdict() for row in partition]
 
-def get_distinct_queries(
-        db: Session
+
+async def search_adverts(
+        db: AsyncSession,
+        text: str,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        limit: int = 50,
+        after: Tuple[Any, ...] | None = None
+) -> Tuple[List[Row], Tuple[Any, ...] | None]:
+    """
+    Searches adverts by their title using the full-text index, best matches first.
+
+    Results are ordered by rank, date_added and id, all descending, and paginated by
+    keyset: pass the returned keyset as `after` to read the next page.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param text: The search text, web search syntax ("quoted phrases", -exclusions, or) is supported
+    :type text: str
+
+    :param start_date: The start date of the date range, if any
+    :type start_date: date | None
+
+    :param end_date: The end date of the date range, if any
+    :type end_date: date | None
+
+    :param price_from: The minimum price of adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of adverts, if any
+    :type price_to: int | None
+
+    :param limit: The maximum number of adverts to return
+    :type limit: int
+
+    :param after: The (rank, date_added, id) keyset of the last advert of the previous page
+    :type after: Tuple[Any, ...] | None
+
+    :return: The page of advert rows with their rank and the keyset of the next page, if any
+    :rtype: Tuple[List[Row], Tuple[Any, ...] | None]
+    """
+    ts_query = func.websearch_to_tsquery(FTS_CONFIG, text)
+    rank = func.ts_rank(Advertisement.title_tsv, ts_query)
+
+    stmt = select_adverts().add_columns(
+        rank.label("rank")
+    ).where(
+        Advertisement.title_tsv.op("@@")(ts_query)
+    )
+
+    if start_date:
+        stmt = stmt.where(Advertisement.date_added > start_date)
+    if end_date:
+        stmt = stmt.where(Advertisement.date_added <= end_date)
+    if price_from:
+        stmt = stmt.where(Advertisement.price >= price_from)
+    if price_to:
+        stmt = stmt.where(Advertisement.price <= price_to)
+    if after:
+        stmt = stmt.where(
+            tuple_(rank, Advertisement.date_added, Advertisement.id) < tuple_(*after)
+        )
+
+    stmt = stmt.order_by(
+        rank.desc(), Advertisement.date_added.desc(), Advertisement.id.desc()
+    ).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, (rows[-1].rank, rows[-1].date_added, rows[-1].id)
+
+
+def select_filtered_adverts(
+        query: str,
+        start_date: date,
+        end_date: date,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None
+):
+    """
+    Builds the subquery of priced adverts the chart aggregations are computed over.
+
+    Charts are computed over the adverts in the database, archived adverts are not included.
+
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
+
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :return: The subquery over the matching adverts having a price
+    :rtype: Subquery
+    """
+    return filter_adverts(
+        select_adverts_in_range(query, start_date, end_date),
+        price_from=price_from, price_to=price_to, tags=tags, place=place
+    ).where(
+        Advertisement.price != None
+    ).subquery()
+
+
+async def get_price_histogram(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date,
+        bins: int,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None
+) -> List[dict]:
+    """
+    Computes a histogram of advert prices in the database, only the bin counts are returned.
+
+    Bins have equal width between the lowest and the highest price of the matching adverts.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
+
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param bins: The number of bins
+    :type bins: int
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :return: The bins with their price range and advert count, empty if no advert matches
+    :rtype: List[dict]
+    """
+    adverts = select_filtered_adverts(query, start_date, end_date, price_from, price_to, tags, place)
+    bounds = select(
+        func.min(adverts.c.price).label("low"),
+        func.max(adverts.c.price).label("high"),
+    ).cte("bounds")
+
+    # The upper bound of width_bucket is exclusive, the highest price would get its own bucket
+    bucket = func.width_bucket(adverts.c.price, bounds.c.low, bounds.c.high + 1, bins).label("bucket")
+    stmt = select(
+        bucket, func.count().label("advert_count"), bounds.c.low, bounds.c.high
+    ).select_from(
+        adverts.join(bounds, true())
+    ).group_by(
+        bucket, bounds.c.low, bounds.c.high
+    )
+
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return []
+
+    low, high = rows[0].low, rows[0].high + 1
+    width = (high - low) / bins
+    counts = {row.bucket: row.advert_count for row in rows}
+
+    return [
+        {
+            "price_from": low + (bucket - 1) * width,
+            "price_to": low + bucket * width,
+            "advert_count": counts.get(bucket, 0),
+        }
+        for bucket in range(1, bins + 1)
+    ]
+
+
+async def get_place_counts(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date,
+        top: int,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None
+) -> List[dict]:
+    """
+    Counts the adverts per place in the database, the places after the `top` ones are summed up as "other".
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
+
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param top: The number of places counted on their own
+    :type top: int
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :return: The places with their advert count, the most frequent first and "other" last
+    :rtype: List[dict]
+    """
+    adverts = select_filtered_adverts(query, start_date, end_date, price_from, price_to, tags, place)
+    counts = select(
+        adverts.c.place,
+        func.count().label("advert_count"),
+        func.row_number().over(
+            order_by=(func.count().desc(), adverts.c.place)
+        ).label("position"),
+    ).group_by(adverts.c.place).subquery()
+
+    is_other = counts.c.position > top
+    grouped = select(
+        case((is_other, literal("other")), else_=counts.c.place).label("place"),
+        is_other.label("is_other"),
+        counts.c.advert_count,
+    ).subquery()
+
+    stmt = select(
+        grouped.c.place,
+        func.sum(grouped.c.advert_count).label("advert_count"),
+    ).group_by(
+        grouped.c.place, grouped.c.is_other
+    ).order_by(
+        grouped.c.is_other, func.sum(grouped.c.advert_count).desc()
+    )
+
+    return [row._asdict() for row in (await db.execute(stmt)).all()]
+
+
+async def get_price_scatter(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date,
+        points: int,
+        price_from: int | None = None,
+        price_to: int | None = None,
+        tags: str | None = None,
+        place: str | None = None
+) -> List[dict]:
+    """
+    Downsamples the (date_added, price) points of adverts in the database to a point budget.
+
+    The date range is split into `points // 3` equal time bins, and the cheapest, the median
+    and the most expensive advert of every bin are kept, so the spread and the outliers stay
+    visible. If no more than `points` adverts match, all of them are returned.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param query: The query string used to filter adverts based on their query field
+    :type query: str
+
+    :param start_date: The start date of the date range within which to filter the adverts
+    :type start_date: date
+
+    :param end_date: The end date of the date range within which to filter the adverts
+    :type end_date: date
+
+    :param points: The maximum number of points to return
+    :type points: int
+
+    :param price_from: The minimum price of the adverts, if any
+    :type price_from: int | None
+
+    :param price_to: The maximum price of the adverts, if any
+    :type price_to: int | None
+
+    :param tags: The category of the adverts, if any
+    :type tags: str | None
+
+    :param place: The place of the adverts, if any
+    :type place: str | None
+
+    :return: The kept adverts ordered by date_added
+    :rtype: List[dict]
+    """
+    adverts = select_filtered_adverts(query, start_date, end_date, price_from, price_to, tags, place)
+
+    # date_added is stored without a time zone, its epoch is taken as UTC
+    start_epoch = calendar.timegm(start_date.timetuple())
+    end_epoch = calendar.timegm(end_date.timetuple())
+    bucket = func.width_bucket(
+        extract("epoch", adverts.c.date_added), start_epoch, max(end_epoch, start_epoch + 1),
+        max(points // 3, 1)
+    )
+
+    ranked = select(
+        adverts.c.title,
+        adverts.c.url,
+        adverts.c.price,
+        adverts.c.date_added,
+        adverts.c.id,
+        func.row_number().over(
+            partition_by=bucket, order_by=(adverts.c.price, adverts.c.id)
+        ).label("position"),
+        func.count().over(partition_by=bucket).label("bucket_size"),
+        func.count().over().label("total"),
+    ).subquery()
+
+    stmt = select(
+        ranked.c.title, ranked.c.url, ranked.c.price, ranked.c.date_added
+    ).where(
+        or_(
+            ranked.c.total <= points,
+            ranked.c.position == 1,
+            ranked.c.position == ranked.c.bucket_size,
+            ranked.c.position == (ranked.c.bucket_size + 1) // 2,
+        )
+    ).order_by(
+        ranked.c.date_added, ranked.c.id
+    )
+
+    return [row._asdict() for row in (await db.execute(stmt)).all()]
+
+
+async def get_query_revisions(
+        db: AsyncSession,
+        query: str
+) -> List[Tuple[int, int]]:
+    """
+    Retrieves the revisions of the queries a query parameter matches.
+
+    The queries table is small, so this is a cheap way to tell whether
+    the adverts behind a cached response could have changed.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param query: The query string as passed to `get_adverts`, "all" matches every query
+    :type query: str
+
+    :return: Pairs of query id and revision ordered by id
+    :rtype: List[Tuple[int, int]]
+    """
+    stmt = select(SearchQuery.id, SearchQuery.revision).order_by(SearchQuery.id)
+
+    if query != "all":
+        stmt = stmt.where(SearchQuery.name.ilike(f"%{query}%"))
+
+    return [tuple(row) for row in (await db.execute(stmt)).all()]
+
+
+async def get_distinct_queries(
+        db: AsyncSession
 ):
     """
     Retrieves distinct query strings from the adverts stored in the database.
 
+    They are read from the query catalog maintained at ingest, so this does not scan the adverts.
+
     :param db: The database session object
-    :type db: Session
+    :type db: AsyncSession
 
     :return: A list of distinct query strings from the database
     :rtype: List[str]
     """
-    return [item[0] for item in db.query(Advertisement.query).distinct().all()]
+    return list((await db.execute(select(SearchQuery.name).order_by(SearchQuery.name))).scalars())
+
+
+async def get_query_catalog(
+        db: AsyncSession
+) -> List[SearchQuery]:
+    """
+    Retrieves the query catalog with the advert count and the seen/scraped dates of every query.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :return: The catalog entries ordered by query name
+    :rtype: List[SearchQuery]
+    """
+    return list((await db.execute(select(SearchQuery).order_by(SearchQuery.name))).scalars())
+
+
+async def get_catalog_stamp(
+        db: AsyncSession
+) -> Tuple[Any, ...]:
+    """
+    Retrieves a value which changes whenever the query catalog changes.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :return: The number of queries, the sum of their revisions and the last scrape time
+    :rtype: Tuple[Any, ...]
+    """
+    return tuple((await db.execute(
+        select(
+            func.count(SearchQuery.id),
+            func.coalesce(func.sum(SearchQuery.revision), 0),
+            func.max(SearchQuery.last_scraped_at),
+        )
+    )).one())
+
+
+def update_price_stats(
+        db: Session,
+        adverts: Iterable[Advertisement]
+):
+    """
+    Incrementally folds a batch of adverts into the per query/tag/place/day price rollup.
+
+    The batch is aggregated in memory first, then every affected rollup row is
+    upserted once, merging counts, min/max, sums and the percentile sketch.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param adverts: The adverts written in the current batch
+    :type adverts: Iterable[Advertisement]
+    """
+    batch = {}
+
+    for advert in adverts:
+        key = (advert.query_id, advert.tag_id or 0, advert.place_id or 0, advert.date_added.date())
+        stats = batch.setdefault(key, {
+            "advert_count": 0,
+            "priced_count": 0,
+            "price_min": None,
+            "price_max": None,
+            "price_sum": 0,
+            "price_sketch": empty_sketch(),
+        })
+
+        stats["advert_count"] += 1
+
+        if advert.price and advert.price > 0:
+            stats["priced_count"] += 1
+            stats["price_sum"] += advert.price
+            stats["price_min"] = min(filter(None, (stats["price_min"], advert.price)))
+            stats["price_max"] = max(filter(None, (stats["price_max"], advert.price)))
+            add_to_sketch(stats["price_sketch"], advert.price)
+
+    if not batch:
+        return
+
+    values = [
+        dict(query_id=query_id, tag_id=tag_id, place_id=place_id, day=day, **stats)
+        for (query_id, tag_id, place_id, day), stats in batch.items()
+    ]
+
+    stmt = psql_upsert(AdvertPriceStats).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["query_id", "tag_id", "place_id", "day"],
+        set_=dict(
+            advert_count=AdvertPriceStats.advert_count + stmt.excluded.advert_count,
+            priced_count=AdvertPriceStats.priced_count + stmt.excluded.priced_count,
+            price_min=func.least(AdvertPriceStats.price_min, stmt.excluded.price_min),
+            price_max=func.greatest(AdvertPriceStats.price_max, stmt.excluded.price_max),
+            price_sum=AdvertPriceStats.price_sum + stmt.excluded.price_sum,
+            price_sketch=literal_column(
+                "ARRAY(SELECT merged.stored + merged.added "
+                "FROM unnest(advert_price_stats.price_sketch, excluded.price_sketch) "
+                "WITH ORDINALITY AS merged(stored, added, position) ORDER BY merged.position)"
+            ),
+        )
+    )
+    db.execute(stmt)
+
+
+def reprice_price_stats(
+        db: Session,
+        repriced: Iterable[Tuple[int, int | None, int | None, datetime, int | None, int | None]]
+):
+    """
+    Moves the repriced adverts from their old to their new price in the price rollup.
+
+    Counts, sums and sketches get the difference applied, the minimum and maximum
+    of an affected rollup row are read again from its adverts, as a removed price
+    can not be taken out of them. Must run after the adverts were updated.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param repriced: Tuples of query id, tag id, place id, date added, old and new price
+                     of the stored adverts whose price changed
+    :type repriced: Iterable[Tuple[int, int | None, int | None, datetime, int | None, int | None]]
+    """
+    deltas = {}
 
+    for query_id, tag_id, place_id, date_added, old_price, new_price in repriced:
+        key = (query_id, tag_id or 0, place_id or 0, date_added.date())
+        delta = deltas.setdefault(key, {"priced_count": 0, "price_sum": 0, "price_sketch": empty_sketch()})
 
+        if old_price and old_price > 0:
+            delta["priced_count"] -= 1
+            delta["price_sum"] -= old_price
+            delta["price_sketch"][sketch_bucket(old_price)] -= 1
 
+        if new_price and new_price > 0:
+            delta["priced_count"] += 1
+            delta["price_sum"] += new_price
+            delta["price_sketch"][sketch_bucket(new_price)] += 1
+
+    for (query_id, tag_id, place_id, day), delta in deltas.items():
+        stats = db.execute(
+            select(AdvertPriceStats).where(
+                AdvertPriceStats.query_id == query_id,
+                AdvertPriceStats.tag_id == tag_id,
+                AdvertPriceStats.place_id == place_id,
+                AdvertPriceStats.day == day,
+            ).with_for_update()
+        ).scalar_one_or_none()
+
+        if stats is None:
+            continue
+
+        stats.priced_count += delta["priced_count"]
+        stats.price_sum += delta["price_sum"]
+        stats.price_sketch = [
+            stored + added for stored, added in zip(stats.price_sketch, delta["price_sketch"])
+        ]
+        stats.price_min, stats.price_max = db.execute(
+            select(func.min(Advertisement.price), func.max(Advertisement.price)).where(
+                Advertisement.query_id == query_id,
+                func.coalesce(Advertisement.tag_id, 0) == tag_id,
+                func.coalesce(Advertisement.place_id, 0) == place_id,
+                Advertisement.date_added >= day,
+                Advertisement.date_added < day + timedelta(days=1),
+                Advertisement.price > 0,
+            )
+        ).one()
+
+    # Later upserts of the rollup in this transaction must not be overwritten by these objects
+    db.flush()
+
+
+async def get_price_stats(
+        db: AsyncSession,
+        query: str,
+        start_date: date,
+        end_date: date
+) -> List[AdvertPriceStatsSchema]:
+    """
+    Retrieves the price rollup rows for the query parameter and date range.
+
+    The rollup holds one row per query, tag, place and day, so the cost of this does
+    not depend on the number of stored adverts. Every advert is counted once, under
+    the query which found it first.
+
+    :param db: The database session object
+    :type db: AsyncSession
 
+    :param query: The query string used to filter the rollup, "all" matches every query
+    :type query: str
+
+    :param start_date: The start date of the date range
+    :type start_date: date
+
+    :param end_date: The end date of the date range
+    :type end_date: date
+
+    :return: The price statistics per query, tag, place and day
+    :rtype: List[schemas.AdvertPriceStats]
+    """
+    stmt = select(
+        SearchQuery.name.label("query"),
+        Tag.name.label("tags"),
+        Place.name.label("place"),
+        AdvertPriceStats.day,
+        AdvertPriceStats.advert_count,
+        AdvertPriceStats.priced_count,
+        AdvertPriceStats.price_min,
+        AdvertPriceStats.price_max,
+        AdvertPriceStats.price_sum,
+        AdvertPriceStats.price_sketch,
+    ).join(
+        SearchQuery, AdvertPriceStats.query_id == SearchQuery.id
+    ).outerjoin(
+        Tag, AdvertPriceStats.tag_id == Tag.id
+    ).outerjoin(
+        Place, AdvertPriceStats.place_id == Place.id
+    ).where(
+        AdvertPriceStats.day >= start_date
+    ).where(
+        AdvertPriceStats.day <= end_date
+    ).order_by(
+        AdvertPriceStats.day
+    )
+
+    if query != "all":
+        stmt = stmt.where(SearchQuery.name.ilike(f"%{query}%"))
+
+    stats = []
+    for row in (await db.execute(stmt)).all():
+        stats.append(AdvertPriceStatsSchema(
+            query=row.query,
+            tags=row.tags,
+            place=row.place,
+            day=row.day,
+            advert_count=row.advert_count,
+            priced_count=row.priced_count,
+            price_min=row.price_min,
+            price_max=row.price_max,
+            price_mean=row.price_sum / row.priced_count if row.priced_count else None,
+            price_p25=sketch_percentile(row.price_sketch, 0.25),
+            price_p50=sketch_percentile(row.price_sketch, 0.5),
+            price_p75=sketch_percentile(row.price_sketch, 0.75),
+            price_p90=sketch_percentile(row.price_sketch, 0.9),
+        ))
+
+    return stats
+
+
+async def get_price_history(
+        db: AsyncSession,
+        url: str
+) -> AdvertPriceHistorySchema | None:
+    """
+    Retrieves the price trajectory of an advert.
+
+    The history only holds an entry for every price change, so this reads
+    a handful of rows through the (identity_id, observed_at) index.
+
+    :param db: The database session object
+    :type db: AsyncSession
+
+    :param url: The url identifying the advert
+    :type url: str
+
+    :return: The price history of the advert or None if the url is unknown
+    :rtype: schemas.AdvertPriceHistory | None
+    """
+    identity = (await db.execute(
+        select(AdvertIdentity).where(AdvertIdentity.url == url)
+    )).scalar_one_or_none()
+
+    if identity is None:
+        return None
+
+    points = (await db.execute(
+        select(AdvertPriceHistory.price, AdvertPriceHistory.observed_at).where(
+            AdvertPriceHistory.identity_id == identity.id
+        ).order_by(
+            AdvertPriceHistory.observed_at
+        )
+    )).all()
+
+    return AdvertPriceHistorySchema(
+        url=identity.url,
+        first_seen=identity.first_seen,
+        last_seen=identity.last_seen,
+        prices=[PricePoint(price=point.price, observed_at=point.observed_at) for point in points],
+    )
@@ -3,6 +3,7 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from dotenv import load_dotenv
 
@@ -16,6 +17,10 @@ print(password)
 print(db_name)
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{user}:{password}@db/{db_name}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{user}:{password}@db/{db_name}"
+
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE") or 10)
+ASYNC_MAX_OVERFLOW = int(os.getenv("ASYNC_MAX_OVERFLOW") or 20)
 
 try:
     engine = create_engine(
@@ -30,3 +35,11 @@ except OperationalError:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Used by the API, so database round trips do not block the event loop
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    pool_size=ASYNC_POOL_SIZE,
+    max_overflow=ASYNC_MAX_OVERFLOW,
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
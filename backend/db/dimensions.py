@@ -0,0 +1,121 @@
+import os
+from typing import Dict, Iterable
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as psql_upsert
+
+from db.models import SearchQuery, Tag, Place
+
+DIMENSION_CACHE_SIZE = int(os.getenv("DIMENSION_CACHE_SIZE") or 10000)
+
+# Session info key of the ids resolved by the current transaction, per cache
+PENDING_IDS_KEY = "pending_dimension_ids"
+
+
+def _pending_ids(db: Session) -> Dict["DimensionCache", Dict[str, int]]:
+    if PENDING_IDS_KEY not in db.info:
+        db.info[PENDING_IDS_KEY] = {}
+        event.listen(db, "after_commit", _remember_pending_ids)
+        event.listen(db, "after_rollback", _forget_pending_ids)
+    return db.info[PENDING_IDS_KEY]
+
+
+def _remember_pending_ids(db: Session):
+    for cache, ids in db.info[PENDING_IDS_KEY].items():
+        cache.remember(ids)
+    db.info[PENDING_IDS_KEY].clear()
+
+
+def _forget_pending_ids(db: Session):
+    db.info[PENDING_IDS_KEY].clear()
+
+
+class DimensionCache:
+    """
+    In-process cache of `name -> id` pairs of a dimension table.
+
+    Ingestion resolves every query, tag and place string through it,
+    so the database is only hit for names seen for the first time.
+    Ids inserted by a transaction are only shared once it is committed,
+    a rolled back batch never leaves ids of rows that do not exist.
+    """
+
+    def __init__(self, model, max_size: int = DIMENSION_CACHE_SIZE):
+        self.model = model
+        self.max_size = max_size
+        self._ids: Dict[str, int] = {}
+
+    def resolve_many(self, db: Session, names: Iterable[str | None]) -> Dict[str, int]:
+        """
+        Resolves names to ids, inserting the names which are not stored yet.
+
+        :param db: The database session object
+        :type db: Session
+
+        :param names: The dimension values to resolve, empty values are skipped
+        :type names: Iterable[str | None]
+
+        :returns: A mapping of every non-empty name to its id
+        :rtype: Dict[str, int]
+        """
+        resolved = {}
+        missing = []
+        pending = _pending_ids(db).setdefault(self, {})
+
+        for name in {name for name in names if name}:
+            if name in self._ids:
+                resolved[name] = self._ids[name]
+            elif name in pending:
+                resolved[name] = pending[name]
+            else:
+                missing.append(name)
+
+        if missing:
+            db.execute(
+                psql_upsert(self.model).values(
+                    [{"name": name} for name in missing]
+                ).on_conflict_do_nothing(index_elements=["name"])
+            )
+            stored = db.execute(
+                select(self.model.name, self.model.id).where(self.model.name.in_(missing))
+            ).all()
+            stored = {name: dimension_id for name, dimension_id in stored}
+
+            pending.update(stored)
+            resolved.update(stored)
+
+        return resolved
+
+    def remember(self, ids: Dict[str, int]):
+        """
+        Adds committed `name -> id` pairs to the cache.
+
+        :param ids: The committed pairs
+        :type ids: Dict[str, int]
+        """
+        if len(self._ids) + len(ids) > self.max_size:
+            self._ids.clear()
+        self._ids.update(ids)
+
+    def resolve(self, db: Session, name: str | None) -> int | None:
+        """
+        Resolves a single name to its id.
+
+        :param db: The database session object
+        :type db: Session
+
+        :param name: The dimension value to resolve
+        :type name: str | None
+
+        :returns: The id of the value or None for an empty value
+        :rtype: int | None
+        """
+        if not name:
+            return None
+        return self.resolve_many(db, [name])[name]
+
+
+query_ids = DimensionCache(SearchQuery)
+tag_ids = DimensionCache(Tag)
+place_ids = DimensionCache(Place)
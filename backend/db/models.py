@@ -1,13 +1,18 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, ARRAY
-from sqlalchemy import UniqueConstraint, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, Enum, ARRAY
+from sqlalchemy import UniqueConstraint, ForeignKey, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 
+# Text search configuration of advert titles, PostgreSQL ships no Ukrainian one
+FTS_CONFIG = "russian"
+
+
 class TokenType(enum.Enum):
     bearer: str = "BEARER"
 
@@ -49,6 +54,41 @@ class Token(Base):
         self.is_expired = is_expired
 
 
+class SearchQuery(Base):
+    __tablename__ = "queries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    advert_count = Column(Integer, nullable=False, default=0, server_default="0")
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    last_scraped_at = Column(DateTime, nullable=True)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Place(Base):
+    __tablename__ = "places"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
 class Advertisement(Base):
     __tablename__ = "adverts"
 
@@ -56,25 +96,102 @@ class Advertisement(Base):
     title = Column(String)
     url = Column(String)
     price = Column(Integer, nullable=True)
-    place = Column(String, nullable=True)
-    query = Column(String, nullable=False)
-    date_added = Column(DateTime)
+    place_id = Column(ForeignKey("places.id"), nullable=True)
+    query_id = Column(ForeignKey("queries.id"), nullable=False)
+    date_added = Column(DateTime, primary_key=True)
     date_created = Column(DateTime, default=datetime.now)
-    tags = Column(String, nullable=True)
+    # Set again whenever the stored advert changes, incremental syncs read adverts by it
+    modified_at = Column(DateTime, default=datetime.now)
+    tag_id = Column(ForeignKey("tags.id"), nullable=True)
+    title_tsv = Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{FTS_CONFIG}', coalesce(title, ''))", persisted=True)
+    )
 
     # __table_args__ = (
     #     UniqueConstraint("title", "url", "query", name="unique_values"),
     # )
-
-    def __init__(self, title: str, url: str, price: int, place: str, query: str, date_added: datetime, tags):
+    __table_args__ = (
+        Index("ix_adverts_query_id_date_added", "query_id", "date_added"),
+        Index("ix_adverts_date_added_id", "date_added", "id"),
+        Index("ix_adverts_query_id_price_id", "query_id", "price", "id"),
+        Index("ix_adverts_price_id", "price", "id"),
+        Index("ix_adverts_tag_id_date_added", "tag_id", "date_added"),
+        Index("ix_adverts_place_id_date_added", "place_id", "date_added"),
+        Index("ix_adverts_title_tsv", "title_tsv", postgresql_using="gin"),
+        Index("ix_adverts_modified_at", "modified_at"),
+        {"postgresql_partition_by": "RANGE (date_added)"},
+    )
+
+    def __init__(self, title: str, url: str, price: int, place_id: int | None, query_id: int,
+                 date_added: datetime, tag_id: int | None):
         self.title = title
         self.url = url
-        self.place = place
+        self.place_id = place_id
         self.price = price
-        self.query = query
+        self.query_id = query_id
         self.date_added = date_added
-        self.tags = tags
+        self.tag_id = tag_id
         self.date_created = datetime.now()
+        self.modified_at = self.date_created
 
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class AdvertPriceStats(Base):
+    __tablename__ = "advert_price_stats"
+
+    # Tag and place ids are part of the key, 0 stands for an unknown value
+    query_id = Column(ForeignKey("queries.id"), primary_key=True)
+    tag_id = Column(Integer, primary_key=True, default=0)
+    place_id = Column(Integer, primary_key=True, default=0)
+    day = Column(Date, primary_key=True)
+    advert_count = Column(Integer, nullable=False, default=0)
+    priced_count = Column(Integer, nullable=False, default=0)
+    price_min = Column(Integer, nullable=True)
+    price_max = Column(Integer, nullable=True)
+    price_sum = Column(BigInteger, nullable=False, default=0)
+    price_sketch = Column(ARRAY(Integer), nullable=False)
+
+    __table_args__ = (
+        Index("ix_advert_price_stats_day", "day"),
+    )
+
+
+class AdvertIdentity(Base):
+    __tablename__ = "advert_identities"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    url = Column(String, nullable=False, unique=True)
+    advert_id = Column(Integer, nullable=False)
+    advert_date_added = Column(DateTime, nullable=False)
+    last_price = Column(Integer, nullable=True)
+    first_seen = Column(DateTime, nullable=False, default=datetime.now)
+    last_seen = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class AdvertQuery(Base):
+    __tablename__ = "advert_queries"
+
+    # Every query that found an advert, the advert row itself is stored once under the first one
+    identity_id = Column(ForeignKey("advert_identities.id"), primary_key=True)
+    query_id = Column(ForeignKey("queries.id"), primary_key=True)
+    first_seen = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_advert_queries_query_id_identity_id", "query_id", "identity_id"),
+    )
+
+
+class AdvertPriceHistory(Base):
+    __tablename__ = "advert_price_history"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    identity_id = Column(ForeignKey("advert_identities.id"), nullable=False)
+    price = Column(Integer, nullable=True)
+    observed_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_advert_price_history_identity_id_observed_at", "identity_id", "observed_at"),
+    )
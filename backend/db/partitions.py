@@ -0,0 +1,230 @@
+import os
+import re
+from datetime import date, datetime
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Session
+
+PARTITIONED_TABLE = "adverts"
+PARTITION_MONTHS = int(os.getenv("ADVERTS_PARTITION_MONTHS") or 1)
+PARTITIONS_AHEAD = int(os.getenv("ADVERTS_PARTITIONS_AHEAD") or 3)
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+# Bounds of the partitions known to exist in this process, so
+# ingestion does not have to hit the catalog for every batch
+_known_partitions = {}
+
+
+def partition_bounds(moment: date | datetime) -> Tuple[datetime, datetime]:
+    """
+    Calculates the range partition of the adverts table the given moment belongs to.
+
+    Partitions are aligned on calendar months and span `ADVERTS_PARTITION_MONTHS` months.
+
+    :param moment: The date or datetime to find the partition for
+    :type moment: date | datetime
+
+    :returns: The inclusive lower and exclusive upper bound of the partition
+    :rtype: Tuple[datetime, datetime]
+    """
+    month_index = moment.year * 12 + moment.month - 1
+    start_index = month_index - month_index % PARTITION_MONTHS
+    end_index = start_index + PARTITION_MONTHS
+
+    return (
+        datetime(start_index // 12, start_index % 12 + 1, 1),
+        datetime(end_index // 12, end_index % 12 + 1, 1),
+    )
+
+
+def partition_name(lower_bound: datetime) -> str:
+    """
+    Builds the name of the partition that starts at the given lower bound.
+
+    :param lower_bound: The inclusive lower bound of the partition
+    :type lower_bound: datetime
+
+    :returns: The partition table name, e.g. `adverts_p2023_09`
+    :rtype: str
+    """
+    return f"{PARTITIONED_TABLE}_p{lower_bound:%Y_%m}"
+
+
+def _covering_partition(moment: datetime) -> str | None:
+    for name, (lower_bound, upper_bound) in _known_partitions.items():
+        if lower_bound <= moment < upper_bound:
+            return name
+    return None
+
+
+def _partitions_exist(db: Session, names: Iterable[str]) -> bool:
+    # Another process may have dropped or archived a remembered partition
+    names = sorted(set(names))
+    if not names:
+        return True
+
+    existing = db.execute(
+        text("SELECT count(*) FROM pg_class WHERE relname = ANY(:names) AND relispartition"),
+        {"names": names}
+    ).scalar_one()
+    return existing == len(names)
+
+
+def _create_partition(db: Session, name: str, lower_bound: datetime, upper_bound: datetime):
+    # A short transaction of its own, so the ingest transaction neither holds the lock
+    # taken on the adverts table nor gets aborted by a concurrent creation
+    with db.get_bind().begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARTITIONED_TABLE} "
+            f"FOR VALUES FROM ('{lower_bound.isoformat()}') TO ('{upper_bound.isoformat()}')"
+        ))
+
+
+def ensure_partitions(db: Session, moments: Iterable[date | datetime]):
+    """
+    Creates the adverts partitions needed to store rows with the given `date_added` values.
+
+    Already existing partitions are remembered in-process and only checked for
+    being still there, so calling this for every ingested batch is cheap. A new
+    partition is clipped to its neighbours, so changing `ADVERTS_PARTITION_MONTHS`
+    never produces overlaps. Partitions are created in their own committed transaction,
+    a partition created meanwhile by another worker is picked up instead.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param moments: The `date_added` values that are about to be inserted
+    :type moments: Iterable[date | datetime]
+
+    :raises ProgrammingError: If a partition can not be created and no other process created it
+    """
+    moments = [
+        moment if isinstance(moment, datetime) else datetime(moment.year, moment.month, moment.day)
+        for moment in moments
+    ]
+    covering = {_covering_partition(moment) for moment in moments}
+
+    if None in covering or not _partitions_exist(db, covering - {None}):
+        list_partitions(db)
+
+    for moment in moments:
+        if _covering_partition(moment):
+            continue
+
+        lower_bound, upper_bound = partition_bounds(moment)
+        for known_lower, known_upper in _known_partitions.values():
+            if known_upper <= moment:
+                lower_bound = max(lower_bound, known_upper)
+            elif known_lower > moment:
+                upper_bound = min(upper_bound, known_lower)
+
+        try:
+            _create_partition(db, partition_name(lower_bound), lower_bound, upper_bound)
+        except ProgrammingError:
+            # Another worker created an overlapping partition with other bounds first
+            list_partitions(db)
+            if not _covering_partition(moment):
+                raise
+            continue
+
+        # The partition may have been created by another worker with other bounds, re-read them
+        list_partitions(db)
+
+
+def forget_partition(name: str):
+    """
+    Removes a dropped or archived partition from the partitions known to this process.
+
+    :param name: The name of the partition
+    :type name: str
+    """
+    _known_partitions.pop(name, None)
+
+
+def ensure_future_partitions(db: Session, ahead: int = PARTITIONS_AHEAD):
+    """
+    Creates the current partition and the given number of partitions after it.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param ahead: How many partitions to create after the current one
+    :type ahead: int
+    """
+    lower_bound, upper_bound = partition_bounds(datetime.now())
+    moments = [lower_bound]
+
+    for _ in range(ahead):
+        moments.append(upper_bound)
+        upper_bound = partition_bounds(upper_bound)[1]
+
+    ensure_partitions(db, moments)
+
+
+def list_partitions(db: Session) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Lists the existing partitions of the adverts table with their bounds.
+
+    :param db: The database session object
+    :type db: Session
+
+    :returns: Tuples of partition name, lower bound and upper bound ordered by lower bound
+    :rtype: List[Tuple[str, datetime, datetime]]
+    """
+    rows = db.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": PARTITIONED_TABLE}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if not match:
+            continue
+        partitions.append((
+            name,
+            datetime.fromisoformat(match.group(1)),
+            datetime.fromisoformat(match.group(2)),
+        ))
+
+    _known_partitions.clear()
+    _known_partitions.update({name: (lower, upper) for name, lower, upper in partitions})
+
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def drop_partitions_before(db: Session, cutoff: date | datetime) -> List[str]:
+    """
+    Drops every adverts partition that only holds rows older than the cutoff.
+
+    Dropping a partition is a metadata operation, so it replaces
+    expensive `DELETE ... WHERE date_added < cutoff` statements.
+
+    :param db: The database session object
+    :type db: Session
+
+    :param cutoff: Partitions whose upper bound is not after this moment are dropped
+    :type cutoff: date | datetime
+
+    :returns: Names of the dropped partitions
+    :rtype: List[str]
+    """
+    if not isinstance(cutoff, datetime):
+        cutoff = datetime(cutoff.year, cutoff.month, cutoff.day)
+
+    dropped = []
+    for name, _, upper_bound in list_partitions(db):
+        if upper_bound > cutoff:
+            continue
+
+        db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        forget_partition(name)
+        dropped.append(name)
+
+    return dropped
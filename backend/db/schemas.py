@@ -1,5 +1,8 @@
-from datetime import datetime
-from pydantic import BaseModel
+import enum
+from datetime import date, datetime
+from typing import List
+
+from pydantic import BaseModel, Field
 
 from db.models import TokenType
 
@@ -40,6 +43,11 @@ class TokenModel(Token):
 
 
 # Adverts classes
+class AdvertSort(str, enum.Enum):
+    date = "date"
+    price = "price"
+
+
 class AdvertisementBase(BaseModel):
     title: str
     url: str
@@ -56,6 +64,101 @@ class AdvertisementCreate(AdvertisementBase):
 
 class Advertisement(AdvertisementBase):
     id: int
+    date_created: datetime | None = None
+    modified_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class AdvertisementSearchResult(Advertisement):
+    rank: float
+
+
+class AdvertisementSearchPage(BaseModel):
+    items: List[AdvertisementSearchResult]
+    next_cursor: str | None
+
+
+class ScrapeSpec(BaseModel):
+    query: str = Field(min_length=1)
+    limit: int = 1
+    price_from: float = .0
+    price_to: float = .0
+
+
+class ScrapeJob(BaseModel):
+    msg: str
+    job_id: str
+
+
+class ScrapeBatchJob(ScrapeJob):
+    tasks: int
+
+
+class JobProgress(BaseModel):
+    status: str
+    tasks_total: int
+    tasks_done: int
+    tasks_failed: int
+    pages_fetched: int
+    rows_parsed: int
+    rows_written: int
+    updated_at: datetime
+
+
+class QueryCatalogEntry(BaseModel):
+    name: str
+    advert_count: int
+    first_seen: datetime | None
+    last_seen: datetime | None
+    last_scraped_at: datetime | None
 
     class Config:
         from_attributes = True
+
+
+class AdvertPriceStats(BaseModel):
+    query: str
+    tags: str | None
+    place: str | None
+    day: date
+    advert_count: int
+    priced_count: int
+    price_min: int | None
+    price_max: int | None
+    price_mean: float | None
+    price_p25: float | None
+    price_p50: float | None
+    price_p75: float | None
+    price_p90: float | None
+
+
+class PriceHistogramBin(BaseModel):
+    price_from: float
+    price_to: float
+    advert_count: int
+
+
+class PlaceCount(BaseModel):
+    place: str | None
+    advert_count: int
+
+
+class ScatterPoint(BaseModel):
+    title: str | None
+    url: str | None
+    price: int
+    date_added: datetime
+
+
+class PricePoint(BaseModel):
+    price: int | None
+    observed_at: datetime
+
+
+class AdvertPriceHistory(BaseModel):
+    url: str
+    first_seen: datetime
+    last_seen: datetime
+    prices: List[PricePoint]
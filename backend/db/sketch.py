@@ -0,0 +1,90 @@
+import math
+from typing import List, Sequence
+
+# Log-scale buckets: bucket `i` holds prices in [GAMMA ** i, GAMMA ** (i + 1)),
+# which keeps percentile estimates within ~5% relative error.
+# The values are baked into stored sketches, do not change them without a migration.
+SKETCH_GAMMA = 1.1
+SKETCH_SIZE = 192
+
+
+def empty_sketch() -> List[int]:
+    """
+    Creates a price sketch without any observations.
+
+    :returns: A list of zero bucket counts
+    :rtype: List[int]
+    """
+    return [0] * SKETCH_SIZE
+
+
+def sketch_bucket(price: int) -> int:
+    """
+    Finds the sketch bucket of a positive price.
+
+    :param price: The price of an advert
+    :type price: int
+
+    :returns: The index of the bucket counting this price
+    :rtype: int
+    """
+    return min(SKETCH_SIZE - 1, int(math.log(max(price, 1)) / math.log(SKETCH_GAMMA)))
+
+
+def add_to_sketch(sketch: List[int], price: int):
+    """
+    Counts a price in the sketch in place.
+
+    :param sketch: The sketch to update
+    :type sketch: List[int]
+
+    :param price: The price of an advert, non-positive prices are ignored
+    :type price: int
+    """
+    if price and price > 0:
+        sketch[sketch_bucket(price)] += 1
+
+
+def merge_sketches(sketches: Sequence[Sequence[int]]) -> List[int]:
+    """
+    Merges sketches by adding up their bucket counts.
+
+    :param sketches: The sketches to merge
+    :type sketches: Sequence[Sequence[int]]
+
+    :returns: The merged sketch
+    :rtype: List[int]
+    """
+    merged = empty_sketch()
+    for sketch in sketches:
+        for bucket, count in enumerate(sketch or ()):
+            merged[bucket] += count
+    return merged
+
+
+def sketch_percentile(sketch: Sequence[int], percentile: float) -> float | None:
+    """
+    Estimates a price percentile from a sketch.
+
+    :param sketch: The sketch to estimate the percentile from
+    :type sketch: Sequence[int]
+
+    :param percentile: The percentile to estimate, between 0 and 1
+    :type percentile: float
+
+    :returns: The estimated price or None for an empty sketch
+    :rtype: float | None
+    """
+    total = sum(sketch)
+    if not total:
+        return None
+
+    rank = percentile * (total - 1)
+    seen = 0
+    for bucket, count in enumerate(sketch):
+        seen += count
+        if seen > rank:
+            # Geometric middle of the bucket
+            return round(SKETCH_GAMMA ** (bucket + 0.5), 2)
+
+    return round(SKETCH_GAMMA ** (SKETCH_SIZE - 0.5), 2)
@@ -0,0 +1,117 @@
+"""Partition adverts by date_added
+
+Revision ID: 5b1e7d2c4a90
+Revises: 49d621d6d35f
+Create Date: 2026-10-19 09:00:12.418305
+
+"""
+import os
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e7d2c4a90'
+down_revision = '49d621d6d35f'
+branch_labels = None
+depends_on = None
+
+
+# Read like in db/partitions.py, so the partitions created here are the ones
+# `ensure_partitions` would create at runtime for the same settings
+PARTITION_MONTHS = int(os.getenv("ADVERTS_PARTITION_MONTHS") or 1)
+PARTITIONS_AHEAD = int(os.getenv("ADVERTS_PARTITIONS_AHEAD") or 3)
+
+
+def partition_start(moment: datetime, shift: int = 0) -> datetime:
+    # Must match partition_bounds of db/partitions.py
+    month_index = moment.year * 12 + moment.month - 1
+    start_index = month_index - month_index % PARTITION_MONTHS + shift * PARTITION_MONTHS
+    return datetime(start_index // 12, start_index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE adverts RENAME TO adverts_old")
+    op.execute("ALTER TABLE adverts_old RENAME CONSTRAINT adverts_pkey TO adverts_old_pkey")
+    op.execute("ALTER INDEX ix_adverts_id RENAME TO ix_adverts_old_id")
+
+    # The partition key is part of the primary key, so it can not be empty
+    op.execute(
+        "UPDATE adverts_old SET date_added = coalesce(date_created, now()) "
+        "WHERE date_added IS NULL"
+    )
+
+    op.execute("""
+        CREATE TABLE adverts (
+            id INTEGER NOT NULL DEFAULT nextval('adverts_id_seq'),
+            title VARCHAR,
+            url VARCHAR,
+            price INTEGER,
+            place VARCHAR,
+            query VARCHAR NOT NULL,
+            date_added TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            date_created TIMESTAMP WITHOUT TIME ZONE,
+            tags VARCHAR,
+            CONSTRAINT adverts_pkey PRIMARY KEY (id, date_added)
+        ) PARTITION BY RANGE (date_added)
+    """)
+    op.create_index(op.f('ix_adverts_id'), 'adverts', ['id'], unique=False)
+    op.create_index('ix_adverts_query_date_added', 'adverts', ['query', 'date_added'], unique=False)
+
+    bounds = op.get_bind().execute(
+        sa.text("SELECT min(date_added), max(date_added) FROM adverts_old")
+    ).first()
+    first_partition = partition_start(bounds[0] or datetime.now())
+    last_partition = partition_start(max(bounds[1] or datetime.now(), datetime.now()), shift=PARTITIONS_AHEAD)
+
+    lower_bound = first_partition
+    while lower_bound <= last_partition:
+        upper_bound = partition_start(lower_bound, shift=1)
+        op.execute(
+            f"CREATE TABLE adverts_p{lower_bound:%Y_%m} PARTITION OF adverts "
+            f"FOR VALUES FROM ('{lower_bound.isoformat()}') TO ('{upper_bound.isoformat()}')"
+        )
+        lower_bound = upper_bound
+
+    op.execute("""
+        INSERT INTO adverts (id, title, url, price, place, query, date_added, date_created, tags)
+        SELECT id, title, url, price, place, query, date_added, date_created, tags
+        FROM adverts_old
+    """)
+
+    op.execute("ALTER SEQUENCE adverts_id_seq OWNED BY adverts.id")
+    op.drop_table('adverts_old')
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE adverts RENAME TO adverts_partitioned")
+    op.execute(
+        "ALTER TABLE adverts_partitioned RENAME CONSTRAINT adverts_pkey TO adverts_partitioned_pkey"
+    )
+    op.execute("ALTER INDEX ix_adverts_id RENAME TO ix_adverts_partitioned_id")
+    op.drop_index('ix_adverts_query_date_added', table_name='adverts_partitioned')
+
+    op.create_table('adverts',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('adverts_id_seq')"), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('url', sa.String(), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=True),
+    sa.Column('place', sa.String(), nullable=True),
+    sa.Column('query', sa.String(), nullable=False),
+    sa.Column('date_added', sa.DateTime(), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('tags', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_adverts_id'), 'adverts', ['id'], unique=False)
+
+    op.execute("""
+        INSERT INTO adverts (id, title, url, price, place, query, date_added, date_created, tags)
+        SELECT id, title, url, price, place, query, date_added, date_created, tags
+        FROM adverts_partitioned
+    """)
+
+    op.execute("ALTER SEQUENCE adverts_id_seq OWNED BY adverts.id")
+    op.execute("DROP TABLE adverts_partitioned CASCADE")
@@ -0,0 +1,72 @@
+"""Dictionary encode query, tag and place of adverts
+
+Revision ID: c83f19a6e2d1
+Revises: 5b1e7d2c4a90
+Create Date: 2026-10-19 10:15:47.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c83f19a6e2d1'
+down_revision = '5b1e7d2c4a90'
+branch_labels = None
+depends_on = None
+
+# (dimension table, old adverts column, new foreign key column)
+DIMENSIONS = (
+    ('queries', 'query', 'query_id'),
+    ('tags', 'tags', 'tag_id'),
+    ('places', 'place', 'place_id'),
+)
+
+
+def upgrade() -> None:
+    for table, column, fk_column in DIMENSIONS:
+        op.create_table(table,
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+        )
+        # Empty tags and places become NULL keys, while the query is mandatory
+        condition = f"{column} IS NOT NULL" if column == 'query' else f"coalesce({column}, '') <> ''"
+        op.execute(
+            f"INSERT INTO {table} (name) "
+            f"SELECT DISTINCT {column} FROM adverts WHERE {condition}"
+        )
+
+        op.add_column('adverts', sa.Column(fk_column, sa.Integer(), nullable=True))
+        op.execute(
+            f"UPDATE adverts SET {fk_column} = {table}.id "
+            f"FROM {table} WHERE {table}.name = adverts.{column}"
+        )
+        op.create_foreign_key(
+            f'adverts_{fk_column}_fkey', 'adverts', table, [fk_column], ['id']
+        )
+
+    op.drop_index('ix_adverts_query_date_added', table_name='adverts')
+    op.alter_column('adverts', 'query_id', nullable=False)
+    op.create_index('ix_adverts_query_id_date_added', 'adverts', ['query_id', 'date_added'], unique=False)
+
+    for _, column, _ in DIMENSIONS:
+        op.drop_column('adverts', column)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_adverts_query_id_date_added', table_name='adverts')
+
+    for table, column, fk_column in DIMENSIONS:
+        op.add_column('adverts', sa.Column(column, sa.String(), nullable=True))
+        op.execute(
+            f"UPDATE adverts SET {column} = {table}.name "
+            f"FROM {table} WHERE {table}.id = adverts.{fk_column}"
+        )
+        op.drop_constraint(f'adverts_{fk_column}_fkey', 'adverts', type_='foreignkey')
+        op.drop_column('adverts', fk_column)
+        op.drop_table(table)
+
+    op.alter_column('adverts', 'query', nullable=False)
+    op.create_index('ix_adverts_query_date_added', 'adverts', ['query', 'date_added'], unique=False)
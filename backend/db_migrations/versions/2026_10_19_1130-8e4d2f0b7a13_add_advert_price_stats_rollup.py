@@ -0,0 +1,90 @@
+"""Add advert price stats rollup
+
+Revision ID: 8e4d2f0b7a13
+Revises: c83f19a6e2d1
+Create Date: 2026-10-19 11:30:05.772960
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4d2f0b7a13'
+down_revision = 'c83f19a6e2d1'
+branch_labels = None
+depends_on = None
+
+# Must match SKETCH_GAMMA and SKETCH_SIZE of db/sketch.py
+SKETCH_GAMMA = 1.1
+SKETCH_SIZE = 192
+
+
+def upgrade() -> None:
+    op.create_table('advert_price_stats',
+    sa.Column('query_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('place_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('advert_count', sa.Integer(), nullable=False),
+    sa.Column('priced_count', sa.Integer(), nullable=False),
+    sa.Column('price_min', sa.Integer(), nullable=True),
+    sa.Column('price_max', sa.Integer(), nullable=True),
+    sa.Column('price_sum', sa.BigInteger(), nullable=False),
+    sa.Column('price_sketch', sa.ARRAY(sa.Integer()), nullable=False),
+    sa.ForeignKeyConstraint(['query_id'], ['queries.id'], ),
+    sa.PrimaryKeyConstraint('query_id', 'tag_id', 'place_id', 'day')
+    )
+    op.create_index('ix_advert_price_stats_day', 'advert_price_stats', ['day'], unique=False)
+
+    op.execute(f"""
+        INSERT INTO advert_price_stats (
+            query_id, tag_id, place_id, day, advert_count, priced_count,
+            price_min, price_max, price_sum, price_sketch
+        )
+        WITH base AS (
+            SELECT query_id, coalesce(tag_id, 0) AS tag_id, coalesce(place_id, 0) AS place_id,
+                   date_added::date AS day, price
+            FROM adverts
+        ),
+        buckets AS (
+            SELECT query_id, tag_id, place_id, day,
+                   least({SKETCH_SIZE - 1}, floor(ln(price) / ln({SKETCH_GAMMA})))::int AS bucket,
+                   count(*) AS observations
+            FROM base
+            WHERE price > 0
+            GROUP BY 1, 2, 3, 4, 5
+        ),
+        sketches AS (
+            SELECT keys.query_id, keys.tag_id, keys.place_id, keys.day,
+                   array_agg(coalesce(buckets.observations, 0)::int ORDER BY slot) AS price_sketch
+            FROM (SELECT DISTINCT query_id, tag_id, place_id, day FROM buckets) AS keys
+            CROSS JOIN generate_series(0, {SKETCH_SIZE - 1}) AS slot
+            LEFT JOIN buckets
+                ON buckets.query_id = keys.query_id
+                AND buckets.tag_id = keys.tag_id
+                AND buckets.place_id = keys.place_id
+                AND buckets.day = keys.day
+                AND buckets.bucket = slot
+            GROUP BY 1, 2, 3, 4
+        )
+        SELECT base.query_id, base.tag_id, base.place_id, base.day,
+               count(*),
+               count(*) FILTER (WHERE base.price > 0),
+               min(base.price) FILTER (WHERE base.price > 0),
+               max(base.price) FILTER (WHERE base.price > 0),
+               coalesce(sum(base.price) FILTER (WHERE base.price > 0), 0),
+               coalesce(sketches.price_sketch, array_fill(0, ARRAY[{SKETCH_SIZE}]))
+        FROM base
+        LEFT JOIN sketches
+            ON sketches.query_id = base.query_id
+            AND sketches.tag_id = base.tag_id
+            AND sketches.place_id = base.place_id
+            AND sketches.day = base.day
+        GROUP BY base.query_id, base.tag_id, base.place_id, base.day, sketches.price_sketch
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_advert_price_stats_day', table_name='advert_price_stats')
+    op.drop_table('advert_price_stats')
@@ -0,0 +1,175 @@
+"""Add advert identities and price history
+
+Revision ID: 2fa9c04e81b6
+Revises: 8e4d2f0b7a13
+Create Date: 2026-10-19 12:45:31.006482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2fa9c04e81b6'
+down_revision = '8e4d2f0b7a13'
+branch_labels = None
+depends_on = None
+
+# Must match SKETCH_GAMMA and SKETCH_SIZE of db/sketch.py
+SKETCH_GAMMA = 1.1
+SKETCH_SIZE = 192
+
+
+def upgrade() -> None:
+    op.create_table('advert_identities',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('url', sa.String(), nullable=False),
+    sa.Column('advert_id', sa.Integer(), nullable=False),
+    sa.Column('advert_date_added', sa.DateTime(), nullable=False),
+    sa.Column('last_price', sa.Integer(), nullable=True),
+    sa.Column('first_seen', sa.DateTime(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('url')
+    )
+    op.create_table('advert_price_history',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('identity_id', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Integer(), nullable=True),
+    sa.Column('observed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['identity_id'], ['advert_identities.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_advert_price_history_identity_id_observed_at',
+        'advert_price_history', ['identity_id', 'observed_at'], unique=False
+    )
+    op.create_table('advert_queries',
+    sa.Column('identity_id', sa.Integer(), nullable=False),
+    sa.Column('query_id', sa.Integer(), nullable=False),
+    sa.Column('first_seen', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['identity_id'], ['advert_identities.id'], ),
+    sa.ForeignKeyConstraint(['query_id'], ['queries.id'], ),
+    sa.PrimaryKeyConstraint('identity_id', 'query_id')
+    )
+    op.create_index(
+        'ix_advert_queries_query_id_identity_id',
+        'advert_queries', ['query_id', 'identity_id'], unique=False
+    )
+
+    # The earliest snapshot of every url becomes the stored advert
+    op.execute("""
+        INSERT INTO advert_identities (url, advert_id, advert_date_added, last_price, first_seen, last_seen)
+        SELECT first_snapshot.url, first_snapshot.id, first_snapshot.date_added, last_snapshot.price,
+               seen.first_seen, seen.last_seen
+        FROM (
+            SELECT DISTINCT ON (url) url, id, date_added
+            FROM adverts WHERE url IS NOT NULL ORDER BY url, id
+        ) AS first_snapshot
+        JOIN (
+            SELECT DISTINCT ON (url) url, price
+            FROM adverts WHERE url IS NOT NULL ORDER BY url, id DESC
+        ) AS last_snapshot USING (url)
+        JOIN (
+            SELECT url,
+                   min(coalesce(date_created, date_added)) AS first_seen,
+                   max(coalesce(date_created, date_added)) AS last_seen
+            FROM adverts WHERE url IS NOT NULL GROUP BY url
+        ) AS seen USING (url)
+    """)
+
+    # Only the snapshots where the price changed go to the history
+    op.execute("""
+        INSERT INTO advert_price_history (identity_id, price, observed_at)
+        SELECT advert_identities.id, snapshots.price, snapshots.observed_at
+        FROM (
+            SELECT url, price, coalesce(date_created, date_added) AS observed_at,
+                   lag(price) OVER (PARTITION BY url ORDER BY id) AS previous_price,
+                   row_number() OVER (PARTITION BY url ORDER BY id) AS position
+            FROM adverts WHERE url IS NOT NULL
+        ) AS snapshots
+        JOIN advert_identities USING (url)
+        WHERE snapshots.position = 1 OR snapshots.price IS DISTINCT FROM snapshots.previous_price
+    """)
+
+    # Every query which found a url keeps it, before the snapshots of the other queries are deleted
+    op.execute("""
+        INSERT INTO advert_queries (identity_id, query_id, first_seen)
+        SELECT advert_identities.id, adverts.query_id, min(coalesce(adverts.date_created, adverts.date_added))
+        FROM adverts
+        JOIN advert_identities USING (url)
+        GROUP BY advert_identities.id, adverts.query_id
+    """)
+
+    op.execute("""
+        UPDATE adverts SET price = advert_identities.last_price
+        FROM advert_identities
+        WHERE adverts.id = advert_identities.advert_id
+        AND adverts.date_added = advert_identities.advert_date_added
+    """)
+    op.execute("""
+        DELETE FROM adverts
+        WHERE url IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM advert_identities
+            WHERE advert_identities.advert_id = adverts.id
+            AND advert_identities.advert_date_added = adverts.date_added
+        )
+    """)
+
+    # The rollup counted every snapshot, rebuild it over the deduplicated adverts
+    op.execute("DELETE FROM advert_price_stats")
+    op.execute(f"""
+        INSERT INTO advert_price_stats (
+            query_id, tag_id, place_id, day, advert_count, priced_count,
+            price_min, price_max, price_sum, price_sketch
+        )
+        WITH base AS (
+            SELECT query_id, coalesce(tag_id, 0) AS tag_id, coalesce(place_id, 0) AS place_id,
+                   date_added::date AS day, price
+            FROM adverts
+        ),
+        buckets AS (
+            SELECT query_id, tag_id, place_id, day,
+                   least({SKETCH_SIZE - 1}, floor(ln(price) / ln({SKETCH_GAMMA})))::int AS bucket,
+                   count(*) AS observations
+            FROM base
+            WHERE price > 0
+            GROUP BY 1, 2, 3, 4, 5
+        ),
+        sketches AS (
+            SELECT keys.query_id, keys.tag_id, keys.place_id, keys.day,
+                   array_agg(coalesce(buckets.observations, 0)::int ORDER BY slot) AS price_sketch
+            FROM (SELECT DISTINCT query_id, tag_id, place_id, day FROM buckets) AS keys
+            CROSS JOIN generate_series(0, {SKETCH_SIZE - 1}) AS slot
+            LEFT JOIN buckets
+                ON buckets.query_id = keys.query_id
+                AND buckets.tag_id = keys.tag_id
+                AND buckets.place_id = keys.place_id
+                AND buckets.day = keys.day
+                AND buckets.bucket = slot
+            GROUP BY 1, 2, 3, 4
+        )
+        SELECT base.query_id, base.tag_id, base.place_id, base.day,
+               count(*),
+               count(*) FILTER (WHERE base.price > 0),
+               min(base.price) FILTER (WHERE base.price > 0),
+               max(base.price) FILTER (WHERE base.price > 0),
+               coalesce(sum(base.price) FILTER (WHERE base.price > 0), 0),
+               coalesce(sketches.price_sketch, array_fill(0, ARRAY[{SKETCH_SIZE}]))
+        FROM base
+        LEFT JOIN sketches
+            ON sketches.query_id = base.query_id
+            AND sketches.tag_id = base.tag_id
+            AND sketches.place_id = base.place_id
+            AND sketches.day = base.day
+        GROUP BY base.query_id, base.tag_id, base.place_id, base.day, sketches.price_sketch
+    """)
+
+
+def downgrade() -> None:
+    # Deduplicated snapshots can not be restored, only the new tables are dropped
+    op.drop_index('ix_advert_queries_query_id_identity_id', table_name='advert_queries')
+    op.drop_table('advert_queries')
+    op.drop_index('ix_advert_price_history_identity_id_observed_at', table_name='advert_price_history')
+    op.drop_table('advert_price_history')
+    op.drop_table('advert_identities')
@@ -0,0 +1,34 @@
+"""Add title full text search
+
+Revision ID: 7d3b8a51c9e0
+Revises: 2fa9c04e81b6
+Create Date: 2026-10-19 14:00:26.551873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b8a51c9e0'
+down_revision = '2fa9c04e81b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('adverts', sa.Column(
+        'title_tsv',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('russian', coalesce(title, ''))", persisted=True),
+        nullable=True
+    ))
+    op.create_index(
+        'ix_adverts_title_tsv', 'adverts', ['title_tsv'], unique=False, postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_adverts_title_tsv', table_name='adverts', postgresql_using='gin')
+    op.drop_column('adverts', 'title_tsv')
@@ -0,0 +1,24 @@
+"""Add adverts keyset index
+
+Revision ID: a41c6e9d03f7
+Revises: 7d3b8a51c9e0
+Create Date: 2026-10-19 15:15:40.128337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c6e9d03f7'
+down_revision = '7d3b8a51c9e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_adverts_date_added_id', 'adverts', ['date_added', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_adverts_date_added_id', table_name='adverts')
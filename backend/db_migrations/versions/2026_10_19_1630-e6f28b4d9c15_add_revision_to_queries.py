@@ -0,0 +1,24 @@
+"""Add revision to queries
+
+Revision ID: e6f28b4d9c15
+Revises: a41c6e9d03f7
+Create Date: 2026-10-19 16:30:52.340118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f28b4d9c15'
+down_revision = 'a41c6e9d03f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('queries', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('queries', 'revision')
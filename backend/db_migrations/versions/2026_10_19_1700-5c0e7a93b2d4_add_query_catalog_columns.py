@@ -0,0 +1,52 @@
+"""Add query catalog columns
+
+Revision ID: 5c0e7a93b2d4
+Revises: e6f28b4d9c15
+Create Date: 2026-10-19 17:00:14.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0e7a93b2d4'
+down_revision = 'e6f28b4d9c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('queries', sa.Column('advert_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('queries', sa.Column('first_seen', sa.DateTime(), nullable=True))
+    op.add_column('queries', sa.Column('last_seen', sa.DateTime(), nullable=True))
+    op.add_column('queries', sa.Column('last_scraped_at', sa.DateTime(), nullable=True))
+
+    op.execute("""
+        UPDATE queries SET
+            advert_count = catalog.advert_count,
+            first_seen = catalog.first_seen,
+            last_seen = catalog.last_seen,
+            last_scraped_at = catalog.last_scraped_at
+        FROM (
+            SELECT advert_queries.query_id,
+                   count(*) AS advert_count,
+                   min(adverts.date_added) AS first_seen,
+                   max(adverts.date_added) AS last_seen,
+                   max(coalesce(adverts.date_created, adverts.date_added)) AS last_scraped_at
+            FROM advert_queries
+            JOIN advert_identities ON advert_identities.id = advert_queries.identity_id
+            JOIN adverts
+                ON adverts.id = advert_identities.advert_id
+                AND adverts.date_added = advert_identities.advert_date_added
+            GROUP BY advert_queries.query_id
+        ) AS catalog
+        WHERE queries.id = catalog.query_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('queries', 'last_scraped_at')
+    op.drop_column('queries', 'last_seen')
+    op.drop_column('queries', 'first_seen')
+    op.drop_column('queries', 'advert_count')
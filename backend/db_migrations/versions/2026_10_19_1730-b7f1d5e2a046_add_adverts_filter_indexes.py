@@ -0,0 +1,30 @@
+"""Add adverts filter indexes
+
+Revision ID: b7f1d5e2a046
+Revises: 5c0e7a93b2d4
+Create Date: 2026-10-19 17:30:27.904615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f1d5e2a046'
+down_revision = '5c0e7a93b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_adverts_query_id_price_id', 'adverts', ['query_id', 'price', 'id'], unique=False)
+    op.create_index('ix_adverts_price_id', 'adverts', ['price', 'id'], unique=False)
+    op.create_index('ix_adverts_tag_id_date_added', 'adverts', ['tag_id', 'date_added'], unique=False)
+    op.create_index('ix_adverts_place_id_date_added', 'adverts', ['place_id', 'date_added'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_adverts_place_id_date_added', table_name='adverts')
+    op.drop_index('ix_adverts_tag_id_date_added', table_name='adverts')
+    op.drop_index('ix_adverts_price_id', table_name='adverts')
+    op.drop_index('ix_adverts_query_id_price_id', table_name='adverts')
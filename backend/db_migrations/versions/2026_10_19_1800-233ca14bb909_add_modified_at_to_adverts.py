@@ -0,0 +1,30 @@
+"""Add modified_at to adverts
+
+Revision ID: 233ca14bb909
+Revises: b7f1d5e2a046
+Create Date: 2026-10-19 18:00:12.518734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '233ca14bb909'
+down_revision = 'b7f1d5e2a046'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('adverts', sa.Column('modified_at', sa.DateTime(), nullable=True))
+
+    # Stored adverts were last written when they were created
+    op.execute("UPDATE adverts SET modified_at = coalesce(date_created, date_added)")
+
+    op.create_index('ix_adverts_modified_at', 'adverts', ['modified_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_adverts_modified_at', table_name='adverts')
+    op.drop_column('adverts', 'modified_at')
@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import uuid
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("redis")
+pytest.importorskip("brotli")
+pytest.importorskip("zstandard")
+
+from starlette.requests import Request
+
+from api.cache import CachedResponse, TTLCache, cached_response, etag_matches, make_cache_key
+from api.compression import COMPRESSION_MIN_SIZE
+
+LARGE_BODY = b'[{"title": "Apple iPhone 13 128GB", "price": 18500}]' * (COMPRESSION_MIN_SIZE // 32 + 1)
+SMALL_BODY = b"[]"
+
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/adverts",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def respond(request: Request, key: str, body: bytes = LARGE_BODY, produced: list | None = None):
+    async def produce():
+        if produced is not None:
+            produced.append(key)
+        return CachedResponse(body, "application/json", {"X-Next-Cursor": "next"})
+
+    return asyncio.run(cached_response(request, key, produce))
+
+
+@pytest.fixture
+def key():
+    # The response cache is shared by the whole process, every test gets keys of its own
+    return make_cache_key("adverts", str(uuid.uuid4()))
+
+
+def test_response_without_accept_encoding(key):
+    response = respond(make_request(), key)
+
+    assert response.status_code == 200
+    assert response.body == LARGE_BODY
+    assert response.headers["etag"] == f'"{key}"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["x-next-cursor"] == "next"
+    assert "content-encoding" not in response.headers
+
+
+def test_response_is_compressed_with_negotiated_encoding(key):
+    response = respond(make_request(accept_encoding="gzip, deflate"), key)
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == f'"{key}-gzip"'
+    assert gzip.decompress(response.body) == LARGE_BODY
+
+
+def test_small_response_is_not_compressed(key):
+    response = respond(make_request(accept_encoding="gzip"), key, body=SMALL_BODY)
+
+    assert response.body == SMALL_BODY
+    assert "content-encoding" not in response.headers
+
+
+def test_every_encoding_has_its_own_etag(key):
+    etags = {
+        respond(make_request(accept_encoding=encoding), key).headers["etag"]
+        for encoding in ("identity", "gzip", "br", "zstd")
+    }
+    assert len(etags) == 4
+
+
+def test_matching_etag_is_not_modified(key):
+    produced = []
+    etag = respond(make_request(accept_encoding="br"), key, produced=produced).headers["etag"]
+
+    response = respond(make_request(accept_encoding="br", if_none_match=etag), key, produced=produced)
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+    assert produced == [key]
+
+
+def test_weak_etag_matches(key):
+    etag = respond(make_request(), key).headers["etag"]
+
+    response = respond(make_request(if_none_match=f"W/{etag}"), key)
+
+    assert response.status_code == 304
+
+
+def test_etag_of_another_encoding_does_not_match(key):
+    identity_etag = respond(make_request(), key).headers["etag"]
+
+    response = respond(make_request(accept_encoding="gzip", if_none_match=identity_etag), key)
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_response_is_produced_once(key):
+    produced = []
+
+    for encoding in ("gzip", "br", "gzip", "identity"):
+        respond(make_request(accept_encoding=encoding), key, produced=produced)
+
+    assert produced == [key]
+
+
+def test_etag_matches_lists_and_wildcard():
+    assert etag_matches(make_request(if_none_match='"a", "b"'), '"b"')
+    assert etag_matches(make_request(if_none_match="*"), '"b"')
+    assert not etag_matches(make_request(if_none_match='"a"'), '"b"')
+    assert not etag_matches(make_request(), '"b"')
+
+
+def test_cache_key_depends_on_revisions():
+    assert make_cache_key("iphone", [(1, 3)]) == make_cache_key("iphone", [(1, 3)])
+    assert make_cache_key("iphone", [(1, 3)]) != make_cache_key("iphone", [(1, 4)])
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_entries_expire():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1, ttl=-1)
+
+    assert cache.get("a") is None
@@ -0,0 +1,49 @@
+import gzip
+
+import pytest
+
+brotli = pytest.importorskip("brotli")
+zstandard = pytest.importorskip("zstandard")
+
+from api.compression import SUPPORTED_ENCODINGS, compress, negotiate_encoding
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("gzip, deflate, br, zstd", "zstd"),
+    ("GZIP", "gzip"),
+    ("br;q=1.0, zstd;q=0.5", "br"),
+    ("zstd;q=0.1, gzip;q=0.9", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=abc", None),
+    ("*", "zstd"),
+    ("*;q=0.5, br", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("*;q=0", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("encoding, decompress", [
+    ("gzip", gzip.decompress),
+    ("br", brotli.decompress),
+    ("zstd", lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body)),
+])
+def test_compress_round_trip(encoding, decompress):
+    body = b'{"title": "Apple iPhone 13 128GB", "price": 18500}\n' * 200
+
+    compressed = compress(body, encoding)
+
+    assert len(compressed) < len(body)
+    assert decompress(compressed) == body
+
+
+def test_every_supported_encoding_is_negotiable():
+    for encoding in SUPPORTED_ENCODINGS:
+        assert negotiate_encoding(encoding) == encoding
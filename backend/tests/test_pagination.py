@@ -0,0 +1,77 @@
+from base64 import urlsafe_b64encode
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from api.pagination import encode_cursor, decode_cursor
+
+DATE_KEYSET = (datetime, int)
+PRICE_KEYSET = (int, int)
+
+
+def assert_rejected(cursor, types=None):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, types)
+    assert error.value.status_code == 400
+
+
+def test_date_keyset_round_trip():
+    keyset = (datetime(2023, 9, 1, 12, 30, 15, 250000), 42)
+    assert decode_cursor(encode_cursor(keyset), DATE_KEYSET) == keyset
+
+
+def test_price_keyset_round_trip():
+    keyset = (15000, 7)
+    assert decode_cursor(encode_cursor(keyset), PRICE_KEYSET) == keyset
+
+
+def test_search_keyset_round_trip():
+    keyset = (0.0759, datetime(2023, 9, 1), 3)
+    assert decode_cursor(encode_cursor(keyset)) == keyset
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor((datetime(2023, 9, 1, 23, 59, 59), 2 ** 31 - 1))
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+def test_missing_cursor():
+    assert decode_cursor(None, DATE_KEYSET) is None
+    assert decode_cursor("", DATE_KEYSET) is None
+
+
+def test_truncated_cursor_is_rejected():
+    cursor = encode_cursor((datetime(2023, 9, 1), 42))
+    assert_rejected(cursor[:-3], DATE_KEYSET)
+
+
+def test_edited_cursor_is_rejected():
+    cursor = encode_cursor((datetime(2023, 9, 1), 42))
+    tampered = "A" * 4 + cursor[4:]
+    assert_rejected(tampered, DATE_KEYSET)
+
+
+def test_not_base64_cursor_is_rejected():
+    assert_rejected("not a cursor!", DATE_KEYSET)
+
+
+def test_not_json_cursor_is_rejected():
+    assert_rejected(urlsafe_b64encode(b"[1, 2").decode(), DATE_KEYSET)
+
+
+def test_bad_date_in_cursor_is_rejected():
+    assert_rejected(urlsafe_b64encode(b'[{"dt": "yesterday"}, 1]').decode(), DATE_KEYSET)
+
+
+def test_cursor_of_another_sort_order_is_rejected():
+    assert_rejected(encode_cursor((15000, 7)), DATE_KEYSET)
+    assert_rejected(encode_cursor((datetime(2023, 9, 1), 7)), PRICE_KEYSET)
+
+
+def test_cursor_with_other_length_is_rejected():
+    assert_rejected(encode_cursor((datetime(2023, 9, 1), 7, 1)), DATE_KEYSET)
+    assert_rejected(encode_cursor((datetime(2023, 9, 1),)), DATE_KEYSET)
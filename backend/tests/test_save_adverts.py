@@ -0,0 +1,156 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pydantic")
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+from sqlalchemy import delete, func, select
+
+from db.crud import save_adverts, select_adverts_in_range, update_price_stats
+from db.models import (
+    Advertisement,
+    AdvertIdentity,
+    AdvertPriceHistory,
+    AdvertPriceStats,
+    AdvertQuery,
+    SearchQuery,
+)
+from db.partitions import ensure_partitions
+from db.schemas import AdvertisementCreate
+from db.dimensions import query_ids
+
+DATE_ADDED = datetime(2026, 10, 1, 12, 0)
+URL = "https://www.olx.ua/d/uk/obyavlenie/iphone-13-128gb-IDtest.html"
+
+
+def make_advert(price: int | None, query: str = "iphone", url: str = URL) -> AdvertisementCreate:
+    return AdvertisementCreate(
+        title="Apple iPhone 13 128GB",
+        url=url,
+        price=price,
+        place="Київ",
+        query=query,
+        date_added=DATE_ADDED,
+        tags="Електроніка",
+    )
+
+
+def save(db, *adverts: AdvertisementCreate):
+    ensure_partitions(db, [advert.date_added for advert in adverts])
+    created, found = save_adverts(db, list(adverts))
+    db.commit()
+    return created, found
+
+
+def history(db):
+    return db.execute(
+        select(AdvertPriceHistory.price).order_by(AdvertPriceHistory.id)
+    ).scalars().all()
+
+
+def test_new_url_creates_advert_identity_and_history(db):
+    created, found = save(db, make_advert(18500))
+
+    assert len(created) == 1
+    identity = db.execute(select(AdvertIdentity)).scalar_one()
+    assert (identity.advert_id, identity.advert_date_added) == (created[0].id, DATE_ADDED)
+    assert identity.last_price == 18500
+    assert history(db) == [18500]
+    assert found == [(query_ids.resolve(db, "iphone"), DATE_ADDED)]
+
+
+def test_adverts_without_url_are_skipped(db):
+    assert save(db, make_advert(18500, url="")) == ([], [])
+    assert db.execute(select(func.count()).select_from(Advertisement)).scalar() == 0
+
+
+def test_known_url_with_same_price_is_not_stored_again(db):
+    save(db, make_advert(18500))
+    first_seen = db.execute(select(AdvertIdentity.last_seen)).scalar_one()
+
+    assert save(db, make_advert(18500)) == ([], [])
+
+    assert db.execute(select(func.count()).select_from(Advertisement)).scalar() == 1
+    assert history(db) == [18500]
+    assert db.execute(select(AdvertIdentity.last_seen)).scalar_one() >= first_seen
+
+
+def test_price_change_reprices_the_stored_advert(db):
+    created, _ = save(db, make_advert(18500))
+    update_price_stats(db, created)
+    db.commit()
+    modified_at = created[0].modified_at
+
+    assert save(db, make_advert(17000)) == ([], [])
+
+    advert = db.execute(select(Advertisement)).scalar_one()
+    assert advert.price == 17000
+    assert advert.modified_at > modified_at
+    assert history(db) == [18500, 17000]
+    assert db.execute(select(AdvertIdentity.last_price)).scalar_one() == 17000
+
+    stats = db.execute(select(AdvertPriceStats)).scalar_one()
+    assert (stats.advert_count, stats.priced_count) == (1, 1)
+    assert (stats.price_min, stats.price_max, stats.price_sum) == (17000, 17000, 17000)
+    assert sum(stats.price_sketch) == 1
+
+
+def test_price_change_bumps_every_query_which_found_the_advert(db):
+    save(db, make_advert(18500, query="iphone"))
+    save(db, make_advert(18500, query="apple"))
+    revisions = dict(db.execute(select(SearchQuery.name, SearchQuery.revision)).all())
+
+    save(db, make_advert(17000, query="iphone"))
+
+    bumped = dict(db.execute(select(SearchQuery.name, SearchQuery.revision)).all())
+    assert bumped == {name: revision + 1 for name, revision in revisions.items()}
+
+
+def test_url_found_by_another_query_is_returned_for_it(db):
+    created, _ = save(db, make_advert(18500, query="iphone"))
+
+    created_again, found = save(db, make_advert(18500, query="apple"))
+
+    assert created_again == []
+    assert found == [(query_ids.resolve(db, "apple"), DATE_ADDED)]
+
+    assert db.execute(select(func.count()).select_from(Advertisement)).scalar() == 1
+    assert db.execute(select(func.count()).select_from(AdvertQuery)).scalar() == 2
+
+    rows = db.execute(select_adverts_in_range("apple", date(2026, 9, 30), date(2026, 10, 2))).all()
+    assert [(row.id, row.query) for row in rows] == [(created[0].id, "apple")]
+
+    rows = db.execute(select_adverts_in_range("iphone", date(2026, 9, 30), date(2026, 10, 2))).all()
+    assert [(row.id, row.query) for row in rows] == [(created[0].id, "iphone")]
+
+
+def test_archived_advert_is_stored_again(db):
+    created, _ = save(db, make_advert(18500))
+    archived_id = created[0].id
+    db.execute(delete(Advertisement))
+    db.commit()
+
+    revived, found = save(db, make_advert(18500))
+
+    assert len(revived) == 1
+    assert revived[0].id != archived_id
+    identity = db.execute(select(AdvertIdentity)).scalar_one()
+    assert (identity.advert_id, identity.advert_date_added) == (revived[0].id, DATE_ADDED)
+    # The query already had the advert, the catalog must not count it twice
+    assert found == []
+    assert db.execute(select(func.count()).select_from(AdvertQuery)).scalar() == 1
+    assert history(db) == [18500]
+
+
+def test_archived_advert_with_new_price_is_stored_again_with_it(db):
+    save(db, make_advert(18500))
+    db.execute(delete(Advertisement))
+    db.commit()
+
+    revived, _ = save(db, make_advert(17000))
+
+    assert [advert.price for advert in revived] == [17000]
+    assert history(db) == [18500, 17000]
@@ -0,0 +1,115 @@
+import importlib.util
+import math
+from pathlib import Path
+
+import pytest
+
+from db.sketch import (
+    SKETCH_GAMMA,
+    SKETCH_SIZE,
+    add_to_sketch,
+    empty_sketch,
+    merge_sketches,
+    sketch_bucket,
+    sketch_percentile,
+)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "db_migrations" / "versions"
+# Migrations which compute sketch buckets in SQL
+SKETCH_MIGRATIONS = ("8e4d2f0b7a13", "2fa9c04e81b6")
+# The expression those migrations bucket prices with
+SQL_BUCKET = f"least({SKETCH_SIZE - 1}, floor(ln(price) / ln({SKETCH_GAMMA})))::int"
+
+# Small prices, every bucket boundary up to the cap and its neighbours, and prices past the cap
+PRICES = sorted(
+    set(range(1, 2000))
+    | {
+        price
+        for bucket in range(SKETCH_SIZE)
+        for boundary in (math.floor(SKETCH_GAMMA ** bucket), math.ceil(SKETCH_GAMMA ** bucket))
+        for price in (boundary - 1, boundary, boundary + 1)
+        if 0 < price < 2 ** 31
+    }
+    | {2 ** 31 - 1}
+)
+
+
+def load_migration(revision: str):
+    pytest.importorskip("alembic")
+    path, = MIGRATIONS_DIR.glob(f"*-{revision}_*.py")
+    spec = importlib.util.spec_from_file_location(f"migration_{revision}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bucket_bounds():
+    for price in PRICES:
+        bucket = sketch_bucket(price)
+        assert 0 <= bucket < SKETCH_SIZE
+        if bucket < SKETCH_SIZE - 1:
+            assert SKETCH_GAMMA ** bucket <= price * (1 + 1e-9)
+            assert price < SKETCH_GAMMA ** (bucket + 1) * (1 + 1e-9)
+
+
+def test_buckets_grow_with_price():
+    buckets = [sketch_bucket(price) for price in PRICES]
+    assert buckets == sorted(buckets)
+
+
+def test_highest_bucket_holds_every_larger_price():
+    assert sketch_bucket(2 ** 31 - 1) == SKETCH_SIZE - 1
+
+
+def test_non_positive_prices_are_not_counted():
+    sketch = empty_sketch()
+    for price in (None, 0, -5):
+        add_to_sketch(sketch, price)
+    assert sum(sketch) == 0
+
+
+def test_percentile_is_within_a_bucket():
+    sketch = empty_sketch()
+    prices = [100 * position for position in range(1, 101)]
+    for price in prices:
+        add_to_sketch(sketch, price)
+
+    median = sketch_percentile(sketch, 0.5)
+    assert abs(median - 5000) / 5000 < SKETCH_GAMMA - 1
+
+
+def test_merged_sketch_counts_every_price():
+    first, second = empty_sketch(), empty_sketch()
+    add_to_sketch(first, 100)
+    add_to_sketch(second, 100)
+    add_to_sketch(second, 10000)
+
+    merged = merge_sketches([first, second, None])
+    assert merged[sketch_bucket(100)] == 2
+    assert merged[sketch_bucket(10000)] == 1
+
+
+@pytest.mark.parametrize("revision", SKETCH_MIGRATIONS)
+def test_migrations_use_sketch_constants(revision):
+    migration = load_migration(revision)
+    assert (migration.SKETCH_GAMMA, migration.SKETCH_SIZE) == (SKETCH_GAMMA, SKETCH_SIZE)
+
+
+@pytest.mark.parametrize("revision", SKETCH_MIGRATIONS)
+def test_migrations_bucket_prices_like_python(revision):
+    path, = MIGRATIONS_DIR.glob(f"*-{revision}_*.py")
+    source = path.read_text()
+    assert "least({SKETCH_SIZE - 1}, floor(ln(price) / ln({SKETCH_GAMMA})))::int" in source
+
+
+def test_sql_buckets_agree_with_python(engine):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(f"SELECT price, {SQL_BUCKET} FROM unnest(CAST(:prices AS integer[])) AS price"),
+            {"prices": PRICES},
+        ).all()
+
+    mismatches = [(price, bucket, sketch_bucket(price)) for price, bucket in rows if bucket != sketch_bucket(price)]
+    assert not mismatches
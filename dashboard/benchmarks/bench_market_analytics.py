@@ -0,0 +1,152 @@
+"""
+Compares the vectorized market analytics with per-row Python loops on synthetic adverts.
+
+Adverts get the compact dtypes the dashboard loads them with. For every statistic it
+reports the best time of the vectorized version and of a straightforward loop over rows,
+the loops are skipped above --loop-rows since they only get slower.
+
+Usage:
+    python -m benchmarks.bench_market_analytics --rows 50000 --repeat 3
+"""
+import argparse
+import statistics
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from utils.market_analytics import (
+    GROUP_COLUMNS,
+    MAD_SCALE,
+    UNDERPRICED_Z_SCORE,
+    flag_underpriced,
+    place_price_distribution,
+    rolling_price_stats,
+)
+from utils.market_data_preprocessing import compact_adverts
+
+PLACES = ["Киев", "Львов", "Одесса", "Днепр", "Харьков", "Запорожье", "Винница"]
+TAGS = ["Электроника", "Детский мир", "Авто", "Дом и сад", "Хобби, отдых и спорт"]
+QUERIES = ["iphone", "macbook", "playstation", "велосипед", "диван"]
+WINDOW = pd.Timedelta(days=7)
+
+
+def make_adverts(rows: int, seed: int) -> pd.DataFrame:
+    generator = np.random.default_rng(seed)
+    prices = generator.lognormal(mean=9, sigma=0.6, size=rows).round()
+    prices[generator.random(rows) < 0.05] = np.nan
+
+    data = pd.DataFrame({
+        "title": [f"advert {position}" for position in range(rows)],
+        "url": [f"https://www.olx.ua/d/uk/obyavlenie/ID{position:08d}.html" for position in range(rows)],
+        "price": pd.array(prices, dtype="Int32"),
+        "place": generator.choice(PLACES, rows),
+        "tags": generator.choice(TAGS, rows),
+        "query": generator.choice(QUERIES, rows),
+        "date_added": pd.Timestamp("2023-09-01") + pd.to_timedelta(
+            np.sort(generator.integers(0, 90 * 24 * 3600, rows)), unit="s"
+        ),
+    })
+    data["date_created"] = data["date_added"]
+    data["modified_at"] = data["date_added"]
+
+    return compact_adverts(data)[0]
+
+
+def loop_rolling_price_stats(data: pd.DataFrame) -> int:
+    windows = defaultdict(list)
+    days = {}
+
+    for row in data.sort_values("date_added").itertuples():
+        if pd.isna(row.price):
+            continue
+        group = windows[(row.query, row.tags)]
+        group.append((row.date_added, float(row.price)))
+        start = bisect_left(group, (row.date_added - WINDOW, np.inf))
+        prices = sorted(price for _, price in group[start:])
+        quartiles = statistics.quantiles(prices, n=4) if len(prices) > 1 else [prices[0]] * 3
+        days[(row.query, row.tags, row.date_added.floor("D"))] = quartiles
+
+    return len(days)
+
+
+def loop_flag_underpriced(data: pd.DataFrame) -> int:
+    groups = defaultdict(list)
+    for row in data.itertuples():
+        if not pd.isna(row.price):
+            groups[(row.query, row.tags)].append(float(row.price))
+
+    medians = {key: statistics.median(prices) for key, prices in groups.items()}
+    mads = {
+        key: statistics.median(abs(price - medians[key]) for price in prices)
+        for key, prices in groups.items()
+    }
+
+    underpriced = 0
+    for row in data.itertuples():
+        key = (row.query, row.tags)
+        if pd.isna(row.price) or not mads[key]:
+            continue
+        underpriced += MAD_SCALE * (row.price - medians[key]) / mads[key] < -UNDERPRICED_Z_SCORE
+
+    return underpriced
+
+
+def loop_place_price_distribution(data: pd.DataFrame) -> int:
+    places = defaultdict(list)
+    for row in data.itertuples():
+        if not pd.isna(row.price):
+            places[row.place].append(float(row.price))
+
+    return len({
+        place: (len(prices), min(prices), *statistics.quantiles(prices, n=4), max(prices))
+        for place, prices in places.items()
+    })
+
+
+def measure(run: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args: argparse.Namespace):
+    data = make_adverts(args.rows, args.seed)
+
+    statistics_to_compare = [
+        ("rolling median / IQR", lambda: rolling_price_stats(data), lambda: loop_rolling_price_stats(data)),
+        ("underpriced flags", lambda: flag_underpriced(data), lambda: loop_flag_underpriced(data)),
+        ("place distributions", lambda: place_price_distribution(data), lambda: loop_place_price_distribution(data)),
+    ]
+
+    print(
+        f"{args.rows} adverts in {data[GROUP_COLUMNS].drop_duplicates().shape[0]} groups, "
+        f"{data.memory_usage(deep=True).sum() / 2 ** 20:.1f} MiB, best of {args.repeat}"
+    )
+    print(f"{'statistic':<24} {'vectorized ms':>14} {'loop ms':>10} {'speedup':>8}")
+
+    for name, vectorized, loop in statistics_to_compare:
+        vectorized_seconds = measure(vectorized, args.repeat)
+        line = f"{name:<24} {vectorized_seconds * 1000:>14.1f}"
+
+        if args.rows <= args.loop_rows:
+            loop_seconds = measure(loop, args.repeat)
+            line += f" {loop_seconds * 1000:>10.1f} {loop_seconds / vectorized_seconds:>7.1f}x"
+
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--loop-rows", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=0)
+
+    main(parser.parse_args())
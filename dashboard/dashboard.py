@@ -8,16 +8,24 @@ from dotenv import load_dotenv
 
 # Importing necessary modules for data retrieval and preprocessing
 from utils.market_data_preprocessing import (
-    get_data,
+    get_token_data,
+    sync_data,
+    load_adverts,
+    dataset_key,
+    get_market_analytics,
     get_query_names,
-    preprocess_data,
+    filter_params,
     InvalidAuthData,
+    UnknownQuery,
     CATEGORIES
 )
+from utils import analytics_store, charts
 
 load_dotenv(os.path.join(os.curdir, ".env"))
 
 DATA_API_DOMAIN = os.getenv("DATA_API_DOMAIN")
+# Only the latest adverts are rendered in the table, charts use every stored one
+DISPLAY_LIMIT = int(os.getenv("DISPLAY_LIMIT") or 1000)
 
 # Setting up the page configuration for the Streamlit app
 st.set_page_config(
@@ -53,80 +61,116 @@ with st.form("my_form"):
     # Submit button for the form
     btn_submit = st.form_submit_button("Submit")
 
-# Data retrieval and visualization if the form is submitted
+# Data retrieval if the form is submitted
 if btn_submit:
+    st.session_state.pop("params", None)
     try:
-        token_data = requests.request(
-            method="POST",
-            url=f"{DATA_API_DOMAIN}/token",
-            data={
-                "content-type": "multipart/form-data",
-                'username': username,
-                'password': password
-            }
-
-        )
-
-        token_data.raise_for_status()
-        token_data = token_data.json()
+        # The token is reused until it expires
+        token_data = get_token_data(username, password)
 
         # Getting data based on user inputs
 
-        df = get_data(
-            params={
-                "query": query,
-                "date_from": start_date,
-                "date_to": end_date
-            },
-            token_data=token_data
-        )
-
-        # Preprocessing data based on price range inputs
-        if not (price_from == 0.0 and price_to == 0.0):
-            df = preprocess_data(
-                market_df=df,
+        # Price range and category filters are passed to the API
+        params = {
+            "query": query,
+            "date_from": start_date,
+            "date_to": end_date,
+            **filter_params(
                 price_from=price_from,
                 price_to=price_to,
                 category=category
             )
-
-        # Displaying data frame
-        st.dataframe(df)
-
-        # Setting up columns for different plots
-        fig_col1, fig_col2 = st.columns(2)
-
-        # Creating and displaying a scatter plot
-        fig_col1.markdown("## Scatter plot for price")
-        fig1 = px.scatter(
-            data_frame=df,
-            x="date_added",
-            y="price",
-            hover_data="title"
-        )
-        fig_col1.write(fig1)
-
-        # Creating and displaying a histogram
-        fig_col2.markdown("## Price Histogram")
-        fig2 = px.histogram(
-            data_frame=df,
-            x="price"
-        )
-        fig_col2.write(fig2)
-
-        # Creating and displaying a pie chart
-        pie_chart = px.pie(
-            data_frame=df,
-            names="place",
+        }
+        # Only adverts stored since the previous submit are fetched,
+        # they are kept in the local analytics store together with the older ones
+        high_water_mark = sync_data(
+            params=params,
+            token_data=token_data
         )
-        pie_chart.update_traces(textposition='inside')
-        pie_chart.update_layout(uniformtext_minsize=12, uniformtext_mode='hide')
-        st.write(pie_chart)
+        # Selecting points reruns the script without a submit, the synced data set stays shown
+        st.session_state["params"] = params
+        st.session_state["high_water_mark"] = high_water_mark
     except InvalidAuthData:
         st.write("Auth data is invalid!")
 
     except requests.exceptions.HTTPError as err:
         st.write(f"Something wrong with API connection!\n\nError: {err.response.json()}")
 
-    except KeyError as err:
+    except UnknownQuery:
         st.write(f"Wrong query name!\n\nAll available queries are: {get_query_names(token_data)} ")
+
+# Visualization of the last synced data set
+if "params" in st.session_state:
+    params = st.session_state["params"]
+
+    # Displaying the latest adverts of the data set
+    df, memory_saved = load_adverts(params, limit=DISPLAY_LIMIT)
+    st.markdown(f"{analytics_store.count_adverts(params)} adverts")
+    st.caption(f"Compact dtypes saved {memory_saved / 2 ** 20:.2f} MB of memory")
+    st.dataframe(df)
+
+    # Setting up columns for different plots
+    fig_col1, fig_col2 = st.columns(2)
+
+    # Creating and displaying a scatter plot, downsampled by the analytics store
+    # and drawn with WebGL when it still has many points
+    fig_col1.markdown("## Scatter plot for price")
+    scatter_df = analytics_store.price_scatter(params, points=charts.SCATTER_POINT_BUDGET)
+    event = fig_col1.plotly_chart(
+        charts.scatter_figure(scatter_df, x="date_added", y="price", key="url"),
+        on_select="rerun",
+        key="price_scatter"
+    )
+
+    # Details are only loaded for the selected points
+    selected_urls = charts.selected_keys(event)
+    if selected_urls:
+        fig_col1.dataframe(analytics_store.advert_details(selected_urls))
+
+    # Creating and displaying a histogram from the bins counted by the analytics store
+    fig_col2.markdown("## Price Histogram")
+    histogram_df = analytics_store.price_histogram(params)
+    fig2 = px.bar(
+        data_frame=histogram_df,
+        x=(histogram_df["price_from"] + histogram_df["price_to"]) / 2,
+        y="advert_count",
+        labels={"x": "price", "advert_count": "count"}
+    )
+    fig2.update_traces(width=(histogram_df["price_to"] - histogram_df["price_from"]).tolist())
+    fig_col2.write(fig2)
+
+    # Creating and displaying a pie chart of the top places
+    pie_chart = px.pie(
+        data_frame=analytics_store.place_counts(params),
+        names="place",
+        values="advert_count",
+    )
+    pie_chart.update_traces(textposition='inside')
+    pie_chart.update_layout(uniformtext_minsize=12, uniformtext_mode='hide')
+    st.write(pie_chart)
+
+    # Market analytics over every stored advert of the data set,
+    # computed again only once a sync moved the high-water mark of the data set
+    st.markdown("## Market analytics")
+    rolling_df, places_df, underpriced_df = get_market_analytics(
+        dataset_key(params), st.session_state["high_water_mark"], params
+    )
+    stats_col1, stats_col2 = st.columns(2)
+
+    # Rolling median price of every query and category
+    stats_col1.markdown("### Rolling median price")
+    stats_col1.write(px.line(
+        data_frame=rolling_df,
+        x="day",
+        y="price_median",
+        color="tags",
+        line_dash="query",
+        hover_data=["price_iqr", "advert_count"]
+    ))
+
+    stats_col2.markdown("### Prices by place")
+    stats_col2.dataframe(places_df)
+
+    # Adverts far below the usual price of their query and category
+    st.markdown("### Underpriced adverts")
+    st.dataframe(underpriced_df)
@@ -0,0 +1,232 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+import streamlit as st
+
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH") or "analytics.duckdb"
+
+ADVERT_COLUMNS = ["title", "url", "price", "place", "tags", "query", "date_added", "date_created", "modified_at"]
+
+
+@st.cache_resource
+def get_connection() -> duckdb.DuckDBPyConnection:
+    # One database file for every session of the dashboard, it outlives restarts
+    connection = duckdb.connect(ANALYTICS_DB_PATH)
+
+    # An advert is stored once per query which found it, stores keyed by url alone are synced again
+    primary_key = connection.execute("""
+        SELECT constraint_column_names FROM duckdb_constraints()
+        WHERE table_name = 'adverts' AND constraint_type = 'PRIMARY KEY'
+    """).fetchone()
+    if primary_key is not None and primary_key[0] == ["url"]:
+        connection.execute("DROP TABLE adverts")
+        connection.execute("DROP TABLE IF EXISTS datasets")
+
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS adverts (
+            url VARCHAR,
+            title VARCHAR,
+            price INTEGER,
+            place VARCHAR,
+            tags VARCHAR,
+            query VARCHAR,
+            date_added TIMESTAMP,
+            date_created TIMESTAMP,
+            modified_at TIMESTAMP,
+            PRIMARY KEY (url, query)
+        )
+    """)
+    # Stores synced before adverts had it, the next sync fills it for changed adverts
+    connection.execute("ALTER TABLE adverts ADD COLUMN IF NOT EXISTS modified_at TIMESTAMP")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS datasets (
+            key VARCHAR PRIMARY KEY,
+            high_water_mark TIMESTAMP
+        )
+    """)
+    # Bumped by every write of adverts, whichever data set it was for
+    connection.execute("CREATE TABLE IF NOT EXISTS store_version (version BIGINT NOT NULL)")
+    connection.execute("""
+        INSERT INTO store_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM store_version)
+    """)
+    return connection
+
+
+def _cursor() -> duckdb.DuckDBPyConnection:
+    # Streamlit runs sessions in threads, every call gets its own cursor
+    return get_connection().cursor()
+
+
+def get_high_water_mark(key: str) -> Optional[str]:
+    row = _cursor().execute(
+        "SELECT high_water_mark FROM datasets WHERE key = ?", [key]
+    ).fetchone()
+
+    if row is None or row[0] is None:
+        return None
+    return row[0].isoformat()
+
+
+def get_store_version() -> int:
+    return _cursor().execute("SELECT version FROM store_version").fetchone()[0]
+
+
+def append_adverts(key: str, data: pd.DataFrame):
+    # An advert fetched again replaces the stored one, so price changes are kept
+    new_adverts = data[ADVERT_COLUMNS].drop_duplicates(subset=["url", "query"], keep="last")
+
+    cursor = _cursor()
+    cursor.register("new_adverts", new_adverts)
+    cursor.begin()
+    try:
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO adverts ({", ".join(ADVERT_COLUMNS)})
+            SELECT {", ".join(ADVERT_COLUMNS)} FROM new_adverts
+        """)
+        cursor.execute("""
+            INSERT OR REPLACE INTO datasets
+            SELECT key, greatest(coalesce(stored, fetched), coalesce(fetched, stored))
+            FROM (
+                SELECT ? AS key,
+                       (SELECT high_water_mark FROM datasets WHERE key = ?) AS stored,
+                       (SELECT max(modified_at) FROM new_adverts) AS fetched
+            )
+        """, [key, key])
+        cursor.execute("UPDATE store_version SET version = version + 1")
+        cursor.commit()
+    except duckdb.Error:
+        cursor.rollback()
+        raise
+    finally:
+        cursor.unregister("new_adverts")
+
+
+def _where(params: Dict) -> Tuple[str, List]:
+    # The same filters the API applies, so a dataset reads back what was synced for it
+    conditions = ["date_added > ?", "date_added <= ?"]
+    args = [params["date_from"], params["date_to"]]
+
+    if params["query"] == "all":
+        conditions.append("price IS NOT NULL")
+    else:
+        conditions.append("query ILIKE ?")
+        args.append(f"%{params['query']}%")
+
+    if params.get("price_from") is not None:
+        conditions.append("price >= ?")
+        args.append(params["price_from"])
+
+    if params.get("price_to") is not None:
+        conditions.append("price <= ?")
+        args.append(params["price_to"])
+
+    if params.get("tags") is not None:
+        conditions.append("tags = ?")
+        args.append(params["tags"])
+
+    if params.get("place") is not None:
+        conditions.append("place = ?")
+        args.append(params["place"])
+
+    return " AND ".join(conditions), args
+
+
+def count_adverts(params: Dict) -> int:
+    where, args = _where(params)
+    return _cursor().execute(f"SELECT count(*) FROM adverts WHERE {where}", args).fetchone()[0]
+
+
+def select_adverts(
+        params: Dict,
+        limit: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+        priced: bool = False
+) -> pd.DataFrame:
+    where, args = _where(params)
+    if priced:
+        where += " AND price IS NOT NULL"
+
+    sql = f"SELECT {', '.join(columns or ADVERT_COLUMNS)} FROM adverts WHERE {where} ORDER BY date_added DESC"
+
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(limit)
+
+    return _cursor().execute(sql, args).df()
+
+
+def price_histogram(params: Dict, bins: int = 50) -> pd.DataFrame:
+    where, args = _where(params)
+    return _cursor().execute(f"""
+        WITH priced AS (
+            SELECT price FROM adverts WHERE {where} AND price IS NOT NULL
+        ),
+        bounds AS (
+            SELECT min(price) AS low, (max(price) + 1 - min(price)) / ? AS width FROM priced
+        )
+        SELECT low + bucket * width AS price_from,
+               low + (bucket + 1) * width AS price_to,
+               count(*) AS advert_count
+        FROM (
+            SELECT least(floor((price - low) / width), ? - 1) AS bucket, low, width
+            FROM priced, bounds
+        )
+        GROUP BY bucket, low, width
+        ORDER BY bucket
+    """, [*args, bins, bins]).df()
+
+
+def place_counts(params: Dict, top: int = 10) -> pd.DataFrame:
+    where, args = _where(params)
+    return _cursor().execute(f"""
+        WITH counts AS (
+            SELECT place, count(*) AS advert_count,
+                   row_number() OVER (ORDER BY count(*) DESC, place) AS position
+            FROM adverts WHERE {where}
+            GROUP BY place
+        ),
+        grouped AS (
+            SELECT CASE WHEN position > ? THEN 'other' ELSE place END AS place,
+                   position > ? AS is_other,
+                   advert_count
+            FROM counts
+        )
+        SELECT place, sum(advert_count) AS advert_count
+        FROM grouped
+        GROUP BY place, is_other
+        ORDER BY is_other, advert_count DESC
+    """, [*args, top, top]).df()
+
+
+def price_scatter(params: Dict, points: int = 2000) -> pd.DataFrame:
+    # Every time bin keeps its cheapest, median and most expensive advert, so outliers stay visible
+    where, args = _where(params)
+    return _cursor().execute(f"""
+        WITH priced AS (
+            SELECT url, price, date_added,
+                   ntile(?) OVER (ORDER BY date_added) AS bucket
+            FROM adverts WHERE {where} AND price IS NOT NULL
+        ),
+        ranked AS (
+            SELECT *,
+                   row_number() OVER (PARTITION BY bucket ORDER BY price, url) AS position,
+                   count(*) OVER (PARTITION BY bucket) AS bucket_size,
+                   count(*) OVER () AS total
+            FROM priced
+        )
+        SELECT url, price, date_added
+        FROM ranked
+        WHERE total <= ? OR position IN (1, bucket_size, (bucket_size + 1) // 2)
+        ORDER BY date_added, url
+    """, [max(points // 3, 1), *args, points]).df()
+
+
+def advert_details(urls: List[str]) -> pd.DataFrame:
+    return _cursor().execute(
+        # An advert found by several queries is shown once
+        f"SELECT * FROM (SELECT DISTINCT ON (url) {', '.join(ADVERT_COLUMNS)} FROM adverts "
+        "WHERE list_contains(?, url)) ORDER BY date_added",
+        [urls]
+    ).df()
@@ -0,0 +1,47 @@
+import os
+from typing import List
+
+import pandas as pd
+from plotly import graph_objects as go
+
+# Above this many points SVG markers stall the browser, WebGL draws them on the GPU instead
+WEBGL_POINT_THRESHOLD = int(os.getenv("WEBGL_POINT_THRESHOLD") or 5000)
+# The most points sent to the browser, the analytics store downsamples to it
+SCATTER_POINT_BUDGET = int(os.getenv("SCATTER_POINT_BUDGET") or 20000)
+
+
+def scatter_figure(
+        data: pd.DataFrame,
+        x: str,
+        y: str,
+        key: str
+) -> go.Figure:
+    trace = go.Scattergl if len(data) > WEBGL_POINT_THRESHOLD else go.Scatter
+
+    # Only the coordinates and the key of every point are sent,
+    # details of the selected points are loaded on demand
+    figure = go.Figure(trace(
+        x=data[x],
+        y=data[y],
+        customdata=data[key],
+        mode="markers",
+        hovertemplate=f"{x}=%{{x}}<br>{y}=%{{y}}<extra></extra>"
+    ))
+    figure.update_layout(xaxis_title=x, yaxis_title=y, dragmode="select")
+
+    return figure
+
+
+def selected_keys(event) -> List:
+    # The key travels with the point, positions would shift once the frame is queried again
+    if not event:
+        return []
+
+    keys = []
+    for point in event["selection"]["points"]:
+        key = point.get("customdata")
+        if isinstance(key, list):
+            key = key[0]
+        if key is not None:
+            keys.append(key)
+    return keys
@@ -0,0 +1,80 @@
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# Adverts are compared with the others of the same query and category
+GROUP_COLUMNS = ["query", "tags"]
+ROLLING_WINDOW = "7D"
+# Scales the median absolute deviation to the standard deviation of a normal distribution
+MAD_SCALE = 0.6745
+UNDERPRICED_Z_SCORE = 3.5
+
+
+def _priced(data: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    priced = data.loc[data["price"].notna(), columns]
+    # Nullable integers have no rolling or quantile kernels, floats do
+    return priced.astype({"price": "float64"})
+
+
+def rolling_price_stats(
+        data: pd.DataFrame,
+        window: str = ROLLING_WINDOW
+) -> pd.DataFrame:
+    priced = _priced(data, [*GROUP_COLUMNS, "date_added", "price"]).sort_values("date_added")
+
+    # Time based windows need the dates as a monotonic index within every group
+    rolling = priced.set_index("date_added").groupby(
+        GROUP_COLUMNS, observed=True, dropna=False, sort=False
+    )["price"].rolling(window)
+
+    median = rolling.median()
+    # Adverts of the same second repeat an index entry, values are aligned by position
+    stats = pd.DataFrame({
+        "price_q1": rolling.quantile(0.25).to_numpy(),
+        "price_median": median.to_numpy(),
+        "price_q3": rolling.quantile(0.75).to_numpy(),
+        "advert_count": rolling.count().to_numpy(),
+    }, index=median.index).reset_index()
+    stats["price_iqr"] = stats["price_q3"] - stats["price_q1"]
+    stats["day"] = stats["date_added"].dt.floor("D")
+
+    # The window ending with the last advert of a day describes that day
+    return stats.groupby(
+        [*GROUP_COLUMNS, "day"], observed=True, dropna=False
+    ).last().drop(columns="date_added").reset_index()
+
+
+def flag_underpriced(
+        data: pd.DataFrame,
+        threshold: float = UNDERPRICED_Z_SCORE
+) -> pd.DataFrame:
+    prices = data["price"].astype("float64")
+    groups = [data[column] for column in GROUP_COLUMNS]
+
+    # Median and MAD are not pulled by the outliers themselves, unlike mean and std
+    median = prices.groupby(groups, observed=True, dropna=False).transform("median")
+    deviation = prices - median
+    mad = deviation.abs().groupby(groups, observed=True, dropna=False).transform("median")
+    robust_z = MAD_SCALE * deviation / mad.replace(0, np.nan)
+
+    return data.assign(
+        group_median_price=median,
+        robust_z=robust_z,
+        underpriced=robust_z < -threshold,
+    )
+
+
+def place_price_distribution(data: pd.DataFrame) -> pd.DataFrame:
+    priced = _priced(data, ["place", "price"])
+    grouped = priced.groupby("place", observed=True)["price"]
+
+    quantiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quantiles.columns = ["price_q1", "price_median", "price_q3"]
+
+    return pd.concat([
+        grouped.count().rename("advert_count"),
+        grouped.min().rename("price_min"),
+        quantiles,
+        grouped.max().rename("price_max"),
+    ], axis=1).sort_values("advert_count", ascending=False).reset_index()
@@ -1,12 +1,18 @@
-from typing import Optional, Dict
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Tuple
 
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 import requests
 
 import os
 from dotenv import load_dotenv
 
+from utils import analytics_store, market_analytics
+
 load_dotenv()
 
 
@@ -14,15 +20,63 @@ class InvalidAuthData(Exception):
     pass
 
 
+class UnknownQuery(Exception):
+    pass
+
+
 CATEGORIES = ["Электроника", "Детский мир", "Недвижимость", "Авто", "Запчасти для транспорта",
               "Работа", "Животные", "Дом и сад", "Электроника", "Бизнес и услуги", "Аренда и прокат",
               "Мода и стиль", "Хобби, отдых и спорт", "Отдам даром", "Обмен", "Авто для победы",
               "Товары для школы", "Товары для победы"]
 
 DATA_API_DOMAIN = os.getenv("DATA_API_DOMAIN")
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# A token about to expire is not reused, a new one is requested instead
+TOKEN_EXPIRY_MARGIN = timedelta(seconds=30)
+# Adverts are stamped before their batch commits, a batch committing late may carry
+# a stamp below the high-water mark, so syncs re-read this much before it
+SYNC_OVERLAP = timedelta(seconds=int(os.getenv("SYNC_OVERLAP_SECONDS") or 300))
+# Few distinct values repeat over many adverts, they are stored once as categories
+ADVERT_DTYPES = {
+    "place": "category",
+    "tags": "category",
+    "query": "category",
+    "price": "Int32",
+}
+ADVERT_DATE_COLUMNS = ["date_added", "date_created", "modified_at"]
+# Only what the market analytics and the underpriced adverts table need is loaded
+ANALYTICS_COLUMNS = ["title", "url", "price", "place", "tags", "query", "date_added"]
+ANALYTICS_CACHE_ENTRIES = int(os.getenv("ANALYTICS_CACHE_ENTRIES") or 16)
+
+
+def get_token_data(
+        username: str,
+        password: str
+) -> dict:
+    # The token is kept in the session until it expires, so a submit does not log in again
+    credentials = hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
+    token_data = st.session_state.get("token_data")
+
+    if (token_data and token_data["credentials"] == credentials and
+            datetime.fromisoformat(token_data["expires_date"]) - datetime.utcnow() > TOKEN_EXPIRY_MARGIN):
+        return token_data
+
+    response = requests.post(
+        url=f"{DATA_API_DOMAIN}/token",
+        data={
+            "username": username,
+            "password": password
+        }
+    )
+    response.raise_for_status()
+
+    token_data = {**response.json(), "credentials": credentials}
+    st.session_state["token_data"] = token_data
+
+    return token_data
 
 
-@st.cache_data
 def get_data(
         params: Optional[Dict | None],
         token_data: dict
@@ -33,31 +87,159 @@ def get_data(
     if not (token and token_type):
         raise InvalidAuthData
 
-    response = requests.get(
-        url=f"{DATA_API_DOMAIN}/api/v1/adverts",
-        params=params,
-        headers={
-            "Authorization": f"{token_data['token_type'].title()} {token_data['token']}"
-        }
+    params = dict(params or {})
+    pages = []
+
+    # The API returns adverts page by page, the next page is announced in a header
+    while True:
+        response = requests.get(
+            url=f"{DATA_API_DOMAIN}/api/v1/adverts",
+            params=params,
+            headers={
+                "Authorization": f"{token_data['token_type'].title()} {token_data['token']}",
+                "Accept": ARROW_STREAM_MEDIA_TYPE
+            }
+        )
+        response.raise_for_status()
+
+        # Pages come as Arrow IPC streams, no JSON parsing or object conversion needed
+        pages.append(pa.ipc.open_stream(response.content).read_all())
+
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+        params["cursor"] = cursor
+
+    table = pa.concat_tables(pages)
+
+    # No adverts may just mean that none matched, unless no stored query is like the requested one
+    if not table.num_rows and not is_known_query(params.get("query"), token_data):
+        raise UnknownQuery(params.get("query"))
+
+    data = table.to_pandas(split_blocks=True, self_destruct=True)
+
+    data, _ = compact_adverts(data[analytics_store.ADVERT_COLUMNS])
+
+    return data
+
+
+def is_known_query(
+        query: str,
+        token_data: dict
+) -> bool:
+    # The API matches queries by substring, "all" matches every query
+    if query == "all":
+        return True
+    return any(query.lower() in name.lower() for name in get_query_names(token_data))
+
+
+def dataset_key(
+        params: Dict
+) -> str:
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def sync_data(
+        params: Dict,
+        token_data: dict
+):
+    # Every set of params is a dataset of the analytics store, later submits only fetch
+    # the adverts stored or changed around and after the highest `modified_at` seen so far,
+    # adverts fetched again replace the stored ones by url and query
+    key = dataset_key(params)
+    high_water_mark = analytics_store.get_high_water_mark(key)
+
+    if high_water_mark is None:
+        data = get_data(params, token_data)
+    else:
+        since = datetime.fromisoformat(high_water_mark) - SYNC_OVERLAP
+        data = get_data({**params, "since": since.isoformat()}, token_data)
+
+    analytics_store.append_adverts(key, data)
+
+    return analytics_store.get_high_water_mark(key)
+
+
+def compact_adverts(
+        data: pd.DataFrame
+) -> Tuple[pd.DataFrame, int]:
+    memory_before = data.memory_usage(deep=True).sum()
+
+    data = data.astype({
+        column: dtype for column, dtype in ADVERT_DTYPES.items() if column in data
+    })
+    for column in ADVERT_DATE_COLUMNS:
+        if column in data:
+            data[column] = pd.to_datetime(data[column])
+
+    return data, int(memory_before - data.memory_usage(deep=True).sum())
+
+
+def load_adverts(
+        params: Dict,
+        limit: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+        priced: bool = False
+) -> Tuple[pd.DataFrame, int]:
+    # Adverts of the analytics store with categorical, Int32 and datetime64 columns,
+    # together with the number of bytes saved compared to the plain object columns
+    return compact_adverts(
+        analytics_store.select_adverts(params, limit=limit, columns=columns, priced=priced)
     )
 
-    data = response.json()
-    data = pd.DataFrame(data)
 
-    return data[["title", "url", "price", "place", "tags", "query", "date_added"]]
+def get_market_analytics(
+        key: str,
+        high_water_mark: Optional[str],
+        params: Dict
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    # A data set without a high-water mark has no version to cache its results under
+    if high_water_mark is None:
+        return compute_market_analytics(params)
 
+    # Every data set reads the adverts of the shared store, which the syncs of the
+    # other data sets change too, so the version of the whole store is part of the key
+    return cached_market_analytics(key, high_water_mark, analytics_store.get_store_version(), params)
 
-@st.cache_data
-def preprocess_data(
-        market_df: pd.DataFrame,
+
+@st.cache_data(max_entries=ANALYTICS_CACHE_ENTRIES)
+def cached_market_analytics(
+        key: str,
+        high_water_mark: str,
+        store_version: int,
+        _params: Dict
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    # Computed once per version of a data set, reruns like point selections reuse the results
+    return compute_market_analytics(_params)
+
+
+def compute_market_analytics(
+        params: Dict
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    adverts, _ = load_adverts(params, columns=ANALYTICS_COLUMNS, priced=True)
+
+    flagged = market_analytics.flag_underpriced(adverts)
+
+    return (
+        market_analytics.rolling_price_stats(adverts),
+        market_analytics.place_price_distribution(adverts),
+        flagged[flagged["underpriced"]].sort_values("robust_z"),
+    )
+
+
+def filter_params(
         price_from: float,
         price_to: float,
         category: str
-):
+) -> Dict[str, int | str]:
+    # Filters are applied by the API, only matching adverts are transferred
     if not (price_to and price_from):
-        return market_df
-    return market_df[
-        (market_df["price"] >= price_from) & (market_df["price"] <= price_to) & (market_df["tags"] == category)]
+        return {}
+    return {
+        "price_from": int(price_from),
+        "price_to": int(price_to),
+        "tags": category
+    }
 
 
 @st.cache_data